@@ -0,0 +1,94 @@
+"""
+サムネイルの符号化方式（thumbnails.CODECS）の比較。キャッシュヒット時はデコードだけが表示までの時間になるため、
+サイズよりもデコード時間を重視して thumbnail_codec を選ぶための材料にする。
+
+  python benchmarks/bench_thumbnail_codecs.py --files 60 --output codec_results.json
+
+各段（128/256/最上位）のサムネイルを方式ごとに符号化し、1枚あたりの符号化・デコード時間と
+デコード後に表示サイズへ縮小するまでの時間、保存サイズを中央値で示す。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import thumbnails
+
+from generate_corpus import generate_corpus
+
+TOP_BOX = (400, 400)
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    value = func(*args)
+    return value, time.perf_counter() - started
+
+def _load_pyramids(paths):
+    pyramids = []
+    for path in paths:
+        top_img = thumbnails.load_source(path, TOP_BOX)
+        pyramids.append(thumbnails.build_pyramid(top_img, max(TOP_BOX)))
+    return pyramids
+
+def _measure(pyramids, codec, quality, display_size):
+    encode_times, decode_times, display_times, sizes = [], [], [], []
+    for pyramid in pyramids:
+        for img in pyramid.values():
+            data, seconds = _timed(thumbnails.encode, img, codec, quality)
+            encode_times.append(seconds)
+            sizes.append(len(data))
+            view = memoryview(data)  # パックストアからはメモリビューで渡される
+            _, seconds = _timed(thumbnails.decode, view)
+            decode_times.append(seconds)
+            started = time.perf_counter()
+            thumbnails.scale_to(thumbnails.decode(view), display_size)
+            display_times.append(time.perf_counter() - started)
+    return {
+        "tiles": len(sizes),
+        "encode_ms": statistics.median(encode_times) * 1000,
+        "decode_ms": statistics.median(decode_times) * 1000,
+        "decode_and_scale_ms": statistics.median(display_times) * 1000,
+        "bytes_per_tile": statistics.median(sizes),
+        "total_bytes": sum(sizes),
+    }
+
+def run(args):
+    corpus_dir = os.path.abspath(args.corpus or os.path.join(tempfile.gettempdir(), f"ims_bench_codecs_{args.files}"))
+    manifest = generate_corpus(corpus_dir, args.files)
+    paths = sorted(os.path.join(root, name) for root, _, names in os.walk(corpus_dir) for name in names
+                   if os.path.splitext(name)[1].lower() in (".jpg", ".png", ".webp"))
+    pyramids = _load_pyramids(paths)
+    codecs = args.codecs or list(thumbnails.CODECS)
+
+    results = {}
+    for codec in codecs:
+        _measure(pyramids[:1], codec, args.quality, args.display_size)  # 初回の読み込みを除く
+        results[codec] = stat = _measure(pyramids, codec, args.quality, args.display_size)
+        print(f"{codec:5s} encode {stat['encode_ms']:6.2f}ms  decode {stat['decode_ms']:6.2f}ms  "
+              f"decode+scale {stat['decode_and_scale_ms']:6.2f}ms  {stat['bytes_per_tile']:>9,.0f} B/tile", file=sys.stderr)
+
+    result = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "top_box": TOP_BOX, "quality": args.quality,
+              "display_size": args.display_size, "corpus": dict(manifest, dir=corpus_dir), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="サムネイルの符号化方式の比較")
+    parser.add_argument("--files", type=int, default=60, help="合成コーパスの画像数")
+    parser.add_argument("--corpus", help="コーパスの保存先（同じ条件なら再利用する）")
+    parser.add_argument("--codecs", nargs="+", choices=thumbnails.CODECS, help="比較する方式（既定はすべて）")
+    parser.add_argument("--quality", type=int, default=thumbnails.DEFAULT_QUALITY, help="webp・jpeg の品質")
+    parser.add_argument("--display-size", type=int, default=150, help="デコード後に縮小する表示サイズ")
+    parser.add_argument("--output", help="結果の JSON ファイル")
+    run(parser.parse_args(argv))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
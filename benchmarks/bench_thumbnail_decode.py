@@ -0,0 +1,144 @@
+"""
+サムネイル生成時のデコード経路の比較（キャッシュミス時に元画像から最上位のサムネイルを作る処理）。
+
+  - legacy: 元画像をそのまま開き、exif_transpose（全画素のコピー）→ thumbnail → RGB 変換
+  - fast:   thumbnails.load_source（JPEG は draft、それ以外は reduce で縮小してから向きを補正）
+
+  python benchmarks/bench_thumbnail_decode.py --files 40 --width 3840 --height 2160
+
+処理時間は方式ごとに1つのサブプロセスでまとめて計り、ピークメモリ（RSS）は1枚ごとに新しい
+サブプロセスで計る（ピーク値は減らないため）。RSS はインポート直後からの増分で示す。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageOps
+import thumbnails
+
+from generate_corpus import generate_corpus
+
+TOP_BOX = (400, 400)
+
+def decode_legacy(file_path, top_box=TOP_BOX):
+    """変更前の ImageSearchView._create_and_get_webp と同じ処理"""
+    with Image.open(file_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(top_box, thumbnails.LANCZOS_RESAMPLING)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return img.copy()
+
+METHODS = {"legacy": decode_legacy, "fast": thumbnails.load_source}
+
+def _peak_rss():
+    """このプロセスのピーク RSS（バイト）。取得できなければ None"""
+    # Linux の ru_maxrss は親プロセスの値を引き継ぐため、プロセス自身の VmHWM を優先する
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    except ImportError:
+        return None
+
+def _worker(method, paths):
+    decode = METHODS[method]
+    base = _peak_rss()
+    times = []
+    for path in paths:
+        started = time.perf_counter()
+        decode(path, TOP_BOX)
+        times.append(time.perf_counter() - started)
+    peak = _peak_rss()
+    return {"times": times, "peak_delta": peak - base if peak is not None and base is not None else None}
+
+def _run_worker(method, paths):
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(paths, f)
+        list_path = f.name
+    try:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", method, list_path],
+                             check=True, capture_output=True, text=True).stdout
+        return json.loads(out)
+    finally:
+        os.remove(list_path)
+
+def _kind(path):
+    return os.path.splitext(path)[1].lower().lstrip(".")
+
+def run(args):
+    corpus_dir = os.path.abspath(args.corpus or os.path.join(tempfile.gettempdir(), f"ims_bench_decode_{args.width}x{args.height}_{args.files}"))
+    manifest = generate_corpus(corpus_dir, args.files, args.width, args.height)
+    paths = sorted(os.path.join(root, name) for root, _, names in os.walk(corpus_dir) for name in names
+                   if os.path.splitext(name)[1].lower() in (".jpg", ".png", ".webp"))
+    by_kind = {}
+    for path in paths:
+        by_kind.setdefault(_kind(path), []).append(path)
+
+    results = {}
+    for kind, kind_paths in sorted(by_kind.items()):
+        results[kind] = {}
+        for method in METHODS:
+            _run_worker(method, kind_paths[:1])  # ファイルキャッシュを温める
+            times = _run_worker(method, kind_paths)["times"]
+            peaks = [_run_worker(method, [p])["peak_delta"] for p in kind_paths[:args.rss_samples]]
+            peaks = [p for p in peaks if p is not None]
+            results[kind][method] = {
+                "tiles": len(times),
+                "ms_per_tile": {"median": statistics.median(times) * 1000, "max": max(times) * 1000},
+                "peak_rss_mb": {"median": statistics.median(peaks) / 2**20, "max": max(peaks) / 2**20} if peaks else None,
+            }
+        legacy, fast = results[kind]["legacy"], results[kind]["fast"]
+        results[kind]["speedup"] = legacy["ms_per_tile"]["median"] / fast["ms_per_tile"]["median"]
+        line = f"{kind:5s} legacy {legacy['ms_per_tile']['median']:7.1f}ms  fast {fast['ms_per_tile']['median']:7.1f}ms  (x{results[kind]['speedup']:.1f})"
+        if legacy["peak_rss_mb"] and fast["peak_rss_mb"]:
+            line += f"  RSS {legacy['peak_rss_mb']['median']:6.1f}MB → {fast['peak_rss_mb']['median']:6.1f}MB"
+        print(line, file=sys.stderr)
+
+    result = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "top_box": TOP_BOX,
+              "corpus": dict(manifest, dir=corpus_dir), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="サムネイル生成のデコード経路の比較")
+    parser.add_argument("--files", type=int, default=40, help="合成コーパスの画像数")
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--corpus", help="コーパスの保存先（同じ条件なら再利用する）")
+    parser.add_argument("--rss-samples", type=int, default=5, help="形式ごとにピークメモリを計る枚数")
+    parser.add_argument("--output", help="結果の JSON ファイル")
+    parser.add_argument("--worker", nargs=2, metavar=("METHOD", "LIST"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        method, list_path = args.worker
+        with open(list_path, "r", encoding="utf-8") as f:
+            print(json.dumps(_worker(method, json.load(f))))
+        return 0
+    run(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+ベンチマーク用の合成画像コーパスを作る。
+
+  python benchmarks/generate_corpus.py <出力フォルダ> --files 2000
+
+生成する画像の内訳（既定）:
+  - NovelAI v4 形式の PNG（Comment に JSON、v4_prompt / v4_negative_prompt とキャラクタープロンプト付き）
+  - A1111 形式の PNG（parameters テキストチャンク）
+  - EXIF 付き JPEG（ImageDescription と UserComment に A1111 形式のパラメータ）
+  - EXIF 付き WebP（同上）
+プロンプトは実際の生成画像と同程度のタグ数（30〜120）にし、フォルダは入れ子にして分散させる。
+同じ引数なら同じコーパスができる（乱数シード固定）。
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+from PIL import Image, PngImagePlugin
+
+MANIFEST_NAME = "corpus_manifest.json"
+
+# 実際のプロンプトでよく使われるタグ。これに合成タグを足して語彙にする
+COMMON_TAGS = [
+    "1girl", "1boy", "solo", "long hair", "short hair", "smile", "looking at viewer", "blush", "open mouth",
+    "blue eyes", "red eyes", "green eyes", "brown hair", "black hair", "blonde hair", "white hair", "silver hair",
+    "twintails", "ponytail", "bangs", "hair ornament", "hair ribbon", "school uniform", "serafuku", "skirt",
+    "pleated skirt", "thighhighs", "dress", "white dress", "hat", "gloves", "jacket", "shirt", "long sleeves",
+    "upper body", "full body", "cowboy shot", "portrait", "standing", "sitting", "outdoors", "indoors", "sky",
+    "cloud", "day", "night", "sunset", "tree", "flower", "cherry blossoms", "city", "street", "window", "bed",
+    "masterpiece", "best quality", "very aesthetic", "absurdres", "highres", "detailed background",
+    "depth of field", "dynamic angle", "from above", "from side", "light particles", "wind", "rain", "snow",
+    "animal ears", "cat ears", "fox ears", "tail", "wings", "halo", "armor", "sword", "holding weapon", "book",
+    "cup", "umbrella", "smartphone", "headphones", "glasses", "earrings", "necklace", "choker", "scarf",
+]
+NEGATIVE_TAGS = [
+    "lowres", "bad anatomy", "bad hands", "text", "error", "missing fingers", "extra digit", "fewer digits",
+    "cropped", "worst quality", "low quality", "normal quality", "jpeg artifacts", "signature", "watermark",
+    "username", "blurry", "artist name", "bad proportions", "extra arms", "extra legs", "mutation",
+]
+CHAR_TAGS = ["girl", "boy", "red hair", "blue hair", "maid", "knight", "witch", "idol", "nurse", "detective"]
+
+DEFAULT_MIX = {"novelai_png": 0.4, "a1111_png": 0.25, "exif_jpeg": 0.2, "exif_webp": 0.15}
+
+def _vocabulary(size=600):
+    return COMMON_TAGS + [f"synthetic tag {i}" for i in range(max(0, size - len(COMMON_TAGS)))]
+
+def _prompt(rng, vocab, min_tags=30, max_tags=120):
+    # 先頭のタグほど出現しやすくする（実際のプロンプトのように偏った分布にする）
+    count = rng.randint(min_tags, max_tags)
+    tags = []
+    while len(tags) < count:
+        tag = vocab[min(len(vocab) - 1, int(rng.expovariate(1 / 120)))]
+        if tag not in tags:
+            tags.append(tag)
+    return ", ".join(tags)
+
+def _negative(rng):
+    return ", ".join(rng.sample(NEGATIVE_TAGS, rng.randint(8, len(NEGATIVE_TAGS))))
+
+def _image(rng, width, height):
+    base = Image.linear_gradient("L").resize((width, height))
+    color = tuple(rng.randrange(256) for _ in range(3))
+    return Image.merge("RGB", [base.point(lambda v, c=c: (v + c) % 256) for c in color])
+
+def _a1111_parameters(rng, prompt, negative, width, height, seed):
+    return (f"{prompt}\nNegative prompt: {negative}\n"
+            f"Steps: {rng.choice([20, 25, 28, 30])}, Sampler: DPM++ 2M Karras, CFG scale: {rng.choice([5, 6, 7])}, "
+            f"Seed: {seed}, Size: {width}x{height}, Model hash: {rng.getrandbits(32):08x}, Model: synthetic_xl_v{rng.randint(1, 5)}")
+
+def _novelai_comment(rng, prompt, negative, width, height, seed):
+    chars = [{"char_caption": ", ".join(rng.sample(CHAR_TAGS, 3)), "centers": [{"x": 0.5, "y": 0.5}]}
+             for _ in range(rng.randint(0, 3))]
+    return json.dumps({
+        "prompt": prompt, "steps": 28, "height": height, "width": width, "scale": 5.0, "seed": seed,
+        "sampler": "k_euler_ancestral", "noise_schedule": "karras", "uc": negative,
+        "v4_prompt": {"caption": {"base_caption": prompt, "char_captions": chars}, "use_coords": False, "use_order": True},
+        "v4_negative_prompt": {"caption": {"base_caption": negative, "char_captions": []}},
+    })
+
+def _exif_bytes(parameters):
+    exif = Image.Exif()
+    exif[0x010e] = parameters  # ImageDescription
+    exif[0x0131] = "Stable Diffusion"  # Software
+    exif.get_ifd(0x8769)[0x9286] = b"UNICODE\x00" + parameters.encode("utf-16-be")  # UserComment
+    return exif.tobytes()
+
+def _write_image(kind, path, rng, vocab, width, height):
+    prompt, negative, seed = _prompt(rng, vocab), _negative(rng), rng.getrandbits(32)
+    img = _image(rng, width, height)
+    if kind == "novelai_png":
+        info = PngImagePlugin.PngInfo()
+        info.add_text("Title", "NovelAI generated image")
+        info.add_text("Description", prompt)
+        info.add_text("Software", "NovelAI")
+        info.add_text("Source", "NovelAI Diffusion V4 Full")
+        info.add_text("Comment", _novelai_comment(rng, prompt, negative, width, height, seed))
+        img.save(path, pnginfo=info)
+    elif kind == "a1111_png":
+        info = PngImagePlugin.PngInfo()
+        info.add_text("parameters", _a1111_parameters(rng, prompt, negative, width, height, seed))
+        img.save(path, pnginfo=info)
+    elif kind == "exif_jpeg":
+        img.save(path, quality=90, exif=_exif_bytes(_a1111_parameters(rng, prompt, negative, width, height, seed)))
+    elif kind == "exif_webp":
+        img.save(path, quality=85, exif=_exif_bytes(_a1111_parameters(rng, prompt, negative, width, height, seed)))
+
+EXTENSIONS = {"novelai_png": ".png", "a1111_png": ".png", "exif_jpeg": ".jpg", "exif_webp": ".webp"}
+
+def generate_corpus(out_dir, files, width=512, height=768, files_per_dir=50, seed=0, mix=None):
+    """合成コーパスを生成し、マニフェスト（生成条件と内訳）を返す。同じ条件のコーパスがあれば再利用する"""
+    mix = mix or DEFAULT_MIX
+    manifest = {"files": files, "width": width, "height": height, "files_per_dir": files_per_dir, "seed": seed, "mix": mix}
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+        if {k: existing.get(k) for k in manifest} == manifest:
+            return existing
+
+    rng = random.Random(seed)
+    vocab = _vocabulary()
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    counts = dict.fromkeys(kinds, 0)
+    for i in range(files):
+        # 2階層のフォルダに分散させる（例: g003/d012/img000600.png）
+        dir_index = i // max(1, files_per_dir)
+        sub_dir = os.path.join(out_dir, f"g{dir_index // 10:03d}", f"d{dir_index:03d}")
+        os.makedirs(sub_dir, exist_ok=True)
+        kind = rng.choices(kinds, weights)[0]
+        _write_image(kind, os.path.join(sub_dir, f"img{i:06d}{EXTENSIONS[kind]}"), rng, vocab, width, height)
+        counts[kind] += 1
+
+    manifest["counts"] = counts
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ベンチマーク用の合成画像コーパスを生成する")
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=768)
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    manifest = generate_corpus(args.out_dir, args.files, args.width, args.height, args.files_per_dir, args.seed)
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+エンドツーエンドのベンチマーク。合成コーパスに対して、アプリと同じコードパスで次を計測し、結果を JSON で保存する。
+
+  - cold_ingest:  空のキャッシュDBからの初回検索（走査 + メタデータ解析 + DB書き込み + 照合）
+  - warm_search:  キャッシュ済みの状態での再検索（同じキーワード・別のキーワード）
+  - suggestions:  キーワード候補の取得レイテンシ
+  - smart_tags:   検索結果からのスマートタグ集計時間
+  - thumbnails:   サムネイル生成のスループット（Tk が使える環境のみ）
+
+  python benchmarks/run_benchmarks.py --files 2000 --output results.json
+
+Tk が使える環境では、非表示の Tk ルートで ImageSearchView / ImageSearchController を組み立て、
+コントローラーの検索スレッド処理をそのまま呼び出す。ディスプレイのない環境（--headless 指定時も）は
+cli.py と同じ経路（並列走査 → インジェストバックエンド → CompiledQuery）で計測し、サムネイルは計測しない。
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import logging
+import platform
+import argparse
+import statistics
+import tempfile
+import multiprocessing
+from dataclasses import asdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from config import AppConfig
+from model import ImageSearchModel
+from ingest import INGEST_BACKENDS, create_ingest_backend
+from scanner import DirectorySnapshot, iter_image_entries, make_suffix_set
+from scheduler import Priority, PriorityScheduler
+from search_query import compile_query
+
+from generate_corpus import generate_corpus
+
+SUGGESTION_PREFIXES = ["lo", "bl", "sm", "ha", "sch", "ca", "sy", "wh"]
+
+def _search_params(dir_path, keyword):
+    return {"dir_path": dir_path, "keyword": keyword, "match_type": "partial", "and_search": True,
+            "include_negative": False, "recursive_search": True}
+
+class ControllerHarness:
+    """非表示の Tk ルート上で実際の View / Controller を使って計測する"""
+    name = "controller"
+
+    def __init__(self, config):
+        import tkinter as tk
+        from view import ImageSearchView
+        from controller import ImageSearchController
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.model = ImageSearchModel(config)
+        self.view = ImageSearchView(self.root, config)
+        self.controller = ImageSearchController(self.model, self.view, config)
+
+    def search(self, dir_path, keyword):
+        """コントローラーの検索スレッド処理をこのスレッドで実行し、UIへ送られた結果を回収する"""
+        self.controller._search_thread(_search_params(dir_path, keyword))
+        matched = []
+        while True:
+            try:
+                msg = self.controller.queue.get_nowait()
+            except queue.Empty:
+                break
+            if msg.get("type") == "results_batch":
+                matched.extend(entry[0] for entry in msg["results"])
+            elif msg.get("type") == "error":
+                raise RuntimeError(msg["message"])
+        return matched
+
+    def suggestions(self, dir_path, prefix):
+        self.view.dir_path_var.set(dir_path)
+        return self.controller.get_keyword_suggestions(prefix)
+
+    def thumbnails(self, file_paths):
+        """ワーカーで縮小し、PhotoImage はアプリと同じく Tk のスレッドで作る"""
+        from PIL import ImageTk
+        futures = [self.view.scheduler.submit(Priority.VISIBLE_THUMB, self.view._create_and_get_webp, p, None)
+                   for p in file_paths]
+        photos = [ImageTk.PhotoImage(img) for img, _ in (f.result() for f in futures) if img is not None]
+        return len(photos)
+
+    def close(self):
+        self.controller.on_closing()
+
+class HeadlessHarness:
+    """Tk を使わずに、cli.py と同じ経路で計測する"""
+    name = "headless"
+
+    def __init__(self, config):
+        self.config = config
+        self.model = ImageSearchModel(config)
+        self.scheduler = PriorityScheduler(config.thread_pool_size, config.reserved_ui_workers, name="bench")
+        self.backend = create_ingest_backend(self.model, config, self.scheduler)
+        self.suffixes = make_suffix_set(config.supported_formats)
+
+    def search(self, dir_path, keyword):
+        query = compile_query(_search_params(dir_path, keyword))
+        snapshot = DirectorySnapshot(self.model, dir_path, self.suffixes) if self.config.enable_dir_snapshot else None
+        entries = iter_image_entries(dir_path, self.suffixes, True, max_workers=self.config.scan_workers, snapshot=snapshot)
+        matched = []
+        for _, records in self.backend.iter_results(entries, max_inflight=self.config.max_inflight_batches):
+            matched.extend(r['file_path'] for r in records if query(r))
+        return matched
+
+    def suggestions(self, dir_path, prefix):
+        return self.model.get_suggestions_from_metadata(dir_path, prefix, limit=self.config.suggestion_db_limit)
+
+    thumbnails = None
+
+    def close(self):
+        self.backend.shutdown()
+        self.scheduler.shutdown()
+        self.model.close()
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {"runs": len(samples), "median": statistics.median(samples), "min": samples[0], "max": samples[-1],
+            "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))]}
+
+def run(args):
+    corpus_dir = os.path.abspath(args.corpus or os.path.join(tempfile.gettempdir(), f"ims_bench_corpus_{args.files}"))
+    logging.info(f"コーパスを準備しています: {corpus_dir}")
+    manifest = generate_corpus(corpus_dir, args.files, args.width, args.height)
+    total_files = manifest["files"]
+
+    # キャッシュDBや設定ファイルはカレントディレクトリに作られるため、作業フォルダを分ける
+    work_dir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="ims_bench_"))
+    os.makedirs(work_dir, exist_ok=True)
+    for name in ("metadata_cache.db", "metadata_cache.db-wal", "metadata_cache.db-shm"):
+        if os.path.exists(os.path.join(work_dir, name)):
+            os.remove(os.path.join(work_dir, name))
+    output = os.path.abspath(args.output)
+    os.chdir(work_dir)
+
+    config = AppConfig()
+    if args.backend:
+        config.ingest_backend = args.backend
+    config.enable_background_indexer = False
+    config.large_search_warning_threshold = 0  # 確認ダイアログを出さない
+
+    harness = None
+    if not args.headless:
+        try:
+            harness = ControllerHarness(config)
+        except Exception as e:
+            logging.warning(f"Tk を初期化できないため、ヘッドレスで計測します: {e}")
+    if harness is None:
+        harness = HeadlessHarness(config)
+
+    metrics = {}
+    try:
+        matched, elapsed = _timed(harness.search, corpus_dir, args.keyword)
+        metrics["cold_ingest"] = {"seconds": elapsed, "files_per_sec": total_files / elapsed, "matched": len(matched)}
+        logging.info(f"cold_ingest: {elapsed:.2f}秒 ({total_files / elapsed:.0f}件/秒)")
+
+        for label, keyword in (("warm_search", args.keyword), ("warm_search_other", args.other_keyword)):
+            samples = []
+            for _ in range(args.repeat):
+                found, elapsed = _timed(harness.search, corpus_dir, keyword)
+                samples.append(elapsed)
+            summary = _summary(samples)
+            metrics[label] = {"keyword": keyword, "seconds": summary, "files_per_sec": total_files / summary["median"],
+                              "matched": len(found)}
+            logging.info(f"{label}: 中央値 {summary['median']:.3f}秒")
+
+        samples = []
+        for _ in range(args.repeat):
+            for prefix in SUGGESTION_PREFIXES:
+                _, elapsed = _timed(harness.suggestions, corpus_dir, prefix)
+                samples.append(elapsed * 1000)
+        metrics["suggestions"] = {"prefixes": SUGGESTION_PREFIXES, "ms": _summary(samples)}
+        logging.info(f"suggestions: 中央値 {metrics['suggestions']['ms']['median']:.1f}ms")
+
+        samples = []
+        for _ in range(args.repeat):
+            tags, elapsed = _timed(harness.model.get_top_tags_from_files, matched, args.keyword)
+            samples.append(elapsed * 1000)
+        metrics["smart_tags"] = {"files": len(matched), "tags": len(tags), "ms": _summary(samples)}
+        logging.info(f"smart_tags: 中央値 {metrics['smart_tags']['ms']['median']:.1f}ms")
+
+        if harness.thumbnails is not None:
+            targets = matched[:args.thumbnails]
+            created, elapsed = _timed(harness.thumbnails, targets)
+            metrics["thumbnails"] = {"files": len(targets), "created": created, "seconds": elapsed,
+                                     "files_per_sec": len(targets) / elapsed if elapsed else None}
+            logging.info(f"thumbnails: {len(targets) / elapsed:.0f}件/秒")
+        else:
+            metrics["thumbnails"] = {"skipped": "Tk を利用できないため計測していません"}
+    finally:
+        harness.close()
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "harness": harness.name,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "pillow": PIL.__version__},
+        "corpus": dict(manifest, dir=corpus_dir),
+        "config": {k: v for k, v in asdict(config).items()
+                   if k in ("ingest_backend", "thread_pool_size", "process_pool_size", "reserved_ui_workers", "ingest_chunk_size",
+                            "max_inflight_batches", "scan_workers", "enable_dir_snapshot", "thumbnail_cache_size")},
+        "metrics": metrics,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    logging.info(f"結果を保存しました: {output}")
+    if not args.workdir and not args.keep_workdir:
+        os.chdir(os.path.dirname(output))
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="画像メタ情報検索くん ベンチマーク")
+    parser.add_argument("--files", type=int, default=2000, help="合成コーパスの画像数")
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=768)
+    parser.add_argument("--corpus", help="コーパスの保存先（同じ条件なら再利用する）")
+    parser.add_argument("--workdir", help="キャッシュDBを作る作業フォルダ（既定は一時フォルダ）")
+    parser.add_argument("--keep-workdir", action="store_true", help="一時作業フォルダを削除しない")
+    parser.add_argument("--output", default="benchmark_results.json", help="結果の JSON ファイル")
+    parser.add_argument("--backend", choices=sorted(INGEST_BACKENDS), help="インジェストバックエンド")
+    parser.add_argument("--keyword", default="1girl smile")
+    parser.add_argument("--other-keyword", default="long hair school uniform")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--thumbnails", type=int, default=200, help="サムネイル生成を計測する件数")
+    parser.add_argument("--headless", action="store_true", help="Tk を使わずに計測する")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] - %(message)s')
+    run(args)
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import sys
+import time
+import threading
+import collections
+from perf import perf
+
+def record_size(record):
+    """レコード（dict）のおおよそのメモリ使用量（バイト）"""
+    return sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values())
+
+class ThreadSafeLRUCache:
+    """
+    スレッドセーフなLRUキャッシュ。件数（capacity）とバイト数（max_bytes、sizer で見積もる）のうち
+    0 より大きい上限を超えると古いものから追い出す。どちらも 0 ならキャッシュしない。
+    ttl（秒）を指定すると、期限切れの項目は見つからなかったものとして扱う。
+    name を指定すると perf に <name>.hit / <name>.miss / <name>.eviction を数える。
+    """
+    def __init__(self, capacity: int, max_bytes: int = 0, sizer=None, ttl=None, name=None):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self.ttl = ttl
+        self.name = name
+        self.cache = collections.OrderedDict()  # key -> (value, 見積もりバイト数, 期限)
+        self.total_bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.capacity > 0 or self.max_bytes > 0
+
+    def _lookup(self, key, now):
+        """ロックを保持した状態で呼ぶ。期限切れなら削除して None を返す"""
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        if item[2] is not None and item[2] <= now:
+            del self.cache[key]
+            self.total_bytes -= item[1]
+            self.expirations += 1
+            return None
+        self.cache.move_to_end(key)
+        return item
+
+    def get(self, key, default=None):
+        now = time.monotonic() if self.ttl else None
+        with self._lock:
+            item = self._lookup(key, now)
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if self.name:
+            perf.count(f"{self.name}.miss" if item is None else f"{self.name}.hit")
+        return default if item is None else item[0]
+
+    def get_many(self, keys):
+        """見つかったものだけを {key: value} で返す（ロックは1回だけ取る）"""
+        now = time.monotonic() if self.ttl else None
+        found = {}
+        with self._lock:
+            for key in keys:
+                item = self._lookup(key, now)
+                if item is not None:
+                    found[key] = item[0]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        if self.name:
+            perf.count(f"{self.name}.hit", len(found))
+            perf.count(f"{self.name}.miss", len(keys) - len(found))
+        return found
+
+    def set(self, key, value):
+        self.set_many(((key, value),))
+
+    def set_many(self, items):
+        if not self.enabled: return
+        sizer = self.sizer
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        # サイズの見積もりはロックの外で済ませる
+        entries = [(key, (value, sizer(value) if sizer else 0, expires)) for key, value in items]
+        evicted = 0
+        with self._lock:
+            for key, entry in entries:
+                old = self.cache.pop(key, None)
+                if old is not None:
+                    self.total_bytes -= old[1]
+                self.cache[key] = entry
+                self.total_bytes += entry[1]
+            while self.cache and ((self.capacity > 0 and len(self.cache) > self.capacity)
+                                  or (self.max_bytes > 0 and self.total_bytes > self.max_bytes)):
+                _, (_, size, _) = self.cache.popitem(last=False)
+                self.total_bytes -= size
+                evicted += 1
+            self.evictions += evicted
+        if evicted and self.name:
+            perf.count(f"{self.name}.eviction", evicted)
+
+    def discard_if(self, predicate):
+        """predicate(key) が真になる項目を削除し、削除件数を返す"""
+        with self._lock:
+            keys = [key for key in self.cache if predicate(key)]
+            for key in keys:
+                self.total_bytes -= self.cache.pop(key)[1]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.cache), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "expirations": self.expirations}
+
+class ShardedLRUCache:
+    """
+    キーのハッシュで ThreadSafeLRUCache を shards 個に振り分けたキャッシュ（ロックストライピング）。
+    多数のワーカーから同時に使っても1つのロックを奪い合わない。上限（件数・バイト数）は各シャードに等分する。
+    インターフェースは ThreadSafeLRUCache と同じ。
+    """
+    def __init__(self, capacity: int = 0, max_bytes: int = 0, sizer=None, ttl=None, shards: int = 16, name=None):
+        if capacity > 0:
+            shards = min(shards, capacity)
+        shards = max(1, shards)
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._shards = [ThreadSafeLRUCache(-(-capacity // shards) if capacity > 0 else 0,
+                                           -(-max_bytes // shards) if max_bytes > 0 else 0,
+                                           sizer, ttl, name)
+                        for _ in range(shards)]
+
+    @property
+    def enabled(self):
+        return self.capacity > 0 or self.max_bytes > 0
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _group(self, keys):
+        groups = collections.defaultdict(list)
+        count = len(self._shards)
+        for key in keys:
+            groups[hash(key) % count].append(key)
+        return groups
+
+    def get(self, key, default=None):
+        return self._shard(key).get(key, default)
+
+    def get_many(self, keys):
+        found = {}
+        for index, shard_keys in self._group(keys).items():
+            found.update(self._shards[index].get_many(shard_keys))
+        return found
+
+    def set(self, key, value):
+        self._shard(key).set(key, value)
+
+    def set_many(self, items):
+        if not self.enabled: return
+        groups = collections.defaultdict(list)
+        count = len(self._shards)
+        for key, value in items:
+            groups[hash(key) % count].append((key, value))
+        for index, shard_items in groups.items():
+            self._shards[index].set_many(shard_items)
+
+    def discard_if(self, predicate):
+        return sum(shard.discard_if(predicate) for shard in self._shards)
+
+    def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def stats(self):
+        total = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        for shard in self._shards:
+            for k, v in shard.stats().items():
+                if k in total: total[k] += v
+        total["max_bytes"] = self.max_bytes
+        total["shards"] = len(self._shards)
+        return total
@@ -0,0 +1,178 @@
+"""
+画像メタ情報検索くん コマンドライン版（Tk を使わないため、サーバーやタスクスケジューラからも実行できる）
+
+  python cli.py index <フォルダ>             キャッシュDBを作成・更新する
+  python cli.py search <フォルダ> <キーワード>  一致した画像を JSON Lines で標準出力に出す
+  python cli.py stats                       キャッシュDBの統計を表示する
+  python cli.py vacuum                      キャッシュDBとサムネイルストアを最適化する（アプリを閉じてから実行する）
+
+GUI 版と同じ app_config.json と metadata_cache.db を使うため、アプリと同じフォルダで実行すること。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import contextlib
+import multiprocessing
+
+from config import AppConfig
+from model import ImageSearchModel
+from ingest import INGEST_BACKENDS, create_ingest_backend
+from scanner import DirectorySnapshot, iter_image_entries, make_suffix_set
+from scheduler import PriorityScheduler
+from search_query import compile_query
+from perf import perf
+
+def _open(args):
+    config = AppConfig.load()
+    if getattr(args, "backend", None):
+        config.ingest_backend = args.backend
+    if getattr(args, "workers", None):
+        config.thread_pool_size = config.process_pool_size = args.workers
+    model = ImageSearchModel(config)
+    if model.db_connection is None:
+        raise SystemExit("キャッシュDBを開けませんでした")
+    return config, model
+
+def _iter_records(config, model, dir_path, recursive):
+    """
+    dir_path 以下の画像を GUI の検索と同じ経路（並列走査 → インジェストバックエンド）で処理する。
+    途中でやめるときは close() してから model を閉じること（処理中のチャンクが終わるのを待ってからワーカーを止める）
+    """
+    suffixes = make_suffix_set(config.supported_formats)
+    snapshot = DirectorySnapshot(model, dir_path, suffixes) if config.enable_dir_snapshot else None
+    scheduler = PriorityScheduler(config.thread_pool_size, reserved_workers=0, name="cli")
+    backend = create_ingest_backend(model, config, scheduler)
+    try:
+        entries = iter_image_entries(dir_path, suffixes, recursive, max_workers=config.scan_workers, snapshot=snapshot)
+        for chunk, records in backend.iter_results(entries, max_inflight=config.max_inflight_batches):
+            yield chunk, records
+    finally:
+        backend.shutdown()
+        scheduler.shutdown(wait=True)
+
+def cmd_index(args):
+    config, model = _open(args)
+    started = time.monotonic()
+    processed = 0
+    try:
+        with contextlib.closing(_iter_records(config, model, args.dir, not args.no_recursive)) as results:
+            for chunk, _ in results:
+                processed += len(chunk)
+                if not args.quiet:
+                    print(f"\r{processed}件 処理済み", end="", file=sys.stderr, flush=True)
+    finally:
+        model.close()
+    if not args.quiet:
+        print(file=sys.stderr)
+    logging.info(f"インデックス作成完了: {processed}件 ({time.monotonic() - started:.1f}秒)")
+    return 0
+
+def cmd_search(args):
+    config, model = _open(args)
+    query = compile_query({"keyword": args.query, "match_type": "exact" if args.exact else "partial",
+                           "and_search": not args.or_search, "include_negative": args.include_negative})
+    matched = 0
+    try:
+        with contextlib.closing(_iter_records(config, model, args.dir, not args.no_recursive)) as results:
+            for _, records in results:
+                for record in records:
+                    if not query(record): continue
+                    row = {"file_path": record["file_path"], "mtime": record["mtime"],
+                           "width": record.get("width"), "height": record.get("height")}
+                    if args.with_meta:
+                        row["meta"] = record["meta"]
+                    sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    matched += 1
+                    if args.limit and matched >= args.limit:
+                        return 0
+    finally:
+        # 出力先が閉じていると flush で BrokenPipeError になるため、先に DB を閉じておく
+        model.close()
+        sys.stdout.flush()
+    return 0
+
+def cmd_stats(args):
+    _, model = _open(args)
+    try:
+        print(json.dumps(model.get_stats(), ensure_ascii=False, indent=2))
+    finally:
+        model.close()
+    return 0
+
+def cmd_vacuum(args):
+    _, model = _open(args)
+    try:
+        if args.prune:
+            logging.info(f"存在しないファイルのレコードを削除しました: {model.prune_missing_records()}件")
+        before = model.get_stats().get("db_bytes", 0)
+        if not model.vacuum():
+            return 1
+        after = model.get_stats().get("db_bytes", 0)
+        logging.info(f"VACUUM 完了: {before:,} → {after:,} バイト")
+    finally:
+        model.close()
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="画像メタ情報検索くん コマンドライン版")
+    parser.add_argument("-v", "--verbose", action="store_true", help="詳細なログを出力する")
+    parser.add_argument("--perf", metavar="JSON", help="処理時間を計測し、終了時に JSON で保存する")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_ingest_options(p):
+        p.add_argument("dir", help="対象フォルダ")
+        p.add_argument("--no-recursive", action="store_true", help="サブフォルダを含めない")
+        p.add_argument("--backend", choices=sorted(INGEST_BACKENDS), help="インジェストバックエンド（既定は設定ファイルの値）")
+        p.add_argument("--workers", type=int, help="並列数")
+
+    p = sub.add_parser("index", help="フォルダ内の画像をキャッシュDBに取り込む")
+    add_ingest_options(p)
+    p.add_argument("-q", "--quiet", action="store_true", help="進捗を表示しない")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser("search", help="キーワードに一致する画像を JSON Lines で出力する")
+    add_ingest_options(p)
+    p.add_argument("query", help="検索キーワード（空白区切りで複数指定）")
+    p.add_argument("--exact", action="store_true", help="完全一致で検索する")
+    p.add_argument("--or", dest="or_search", action="store_true", help="いずれかのキーワードを含むものを返す（既定は AND）")
+    p.add_argument("--include-negative", action="store_true", help="ネガティブプロンプトも検索対象にする")
+    p.add_argument("--limit", type=int, default=0, help="出力する最大件数")
+    p.add_argument("--with-meta", action="store_true", help="メタ情報全文も出力する")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("stats", help="キャッシュDBの統計を表示する")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("vacuum", help="キャッシュDBとサムネイルストアを最適化する（アプリを閉じてから実行する）")
+    p.add_argument("--prune", action="store_true", help="存在しないファイルのレコードを先に削除する")
+    p.set_defaults(func=cmd_vacuum)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # 標準出力は検索結果専用にし、ログは標準エラーへ出す
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s [%(levelname)s] - %(message)s')
+    perf.enabled = bool(args.perf)
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # 出力先（head など）が先に閉じた。終了時の flush で再び例外にならないよう、標準出力を捨て先に向ける
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    except OSError as e:
+        logging.error(f"フォルダにアクセスできません: {e}")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if args.perf:
+            perf.dump_json(args.perf)
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -10,21 +10,46 @@ class AppConfig:
     # 表示とキャッシュ設定
     thumbnail_cache_size: Tuple[int, int] = (400, 400)
     thumbnail_display_size: int = 150
-    max_display_items: int = 50
     window_geometry: str = "1600x900"
     viewer_geometry: str = "1200x800"
     max_thumbnails_memory: int = 200
     
     # パフォーマンス設定
     thread_pool_size: int = os.cpu_count() or 4
+    reserved_ui_workers: int = 1  # 表示中のサムネイル生成だけを受け持つ追加ワーカー数
+    ingest_backend: str = "process"  # "thread" または "process"
+    process_pool_size: int = 0  # 0 の場合は CPU コア数
+    ingest_chunk_size: int = 32
+    max_inflight_batches: int = 0  # 同時に投入するチャンク数の上限。0 の場合はワーカー数の2倍
+    scan_workers: int = 4  # サブフォルダを並列に列挙するスレッド数
+    enable_dir_snapshot: bool = True  # 変化のないフォルダは前回の一覧を再利用する
     display_batch_size: int = 20
+    result_batch_interval_ms: int = 150  # 検索結果・進捗をUIへまとめて送る間隔
+    ui_message_budget_ms: int = 8  # ワーカーからのメッセージ処理に1回で使う時間（超えた分は次のイベントループへ回す）
+    photo_frame_budget_ms: int = 8  # サムネイルの貼り付けに1フレームで使う時間（超えた分は次のフレームへ回す）
     large_search_warning_threshold: int = 20000
+    enable_perf_stats: bool = False  # 処理時間の計測（F12 の統計ダイアログからも切り替え可能）
+    enable_background_indexer: bool = True  # お気に入り・履歴のフォルダを空き時間に取り込んでおく
+    index_idle_delay_sec: int = 10  # 起動・検索終了からこの時間が経ってから取り込みを始める
+    index_duty_cycle: float = 0.25  # 取り込みに使う時間の割合（残りは休む）
+    watch_backend: str = "native"  # "native"（watchdog）または "polling"（ネットワークドライブ向け）
+    watch_poll_interval_sec: int = 5
+    watch_debounce_ms: int = 500  # フォルダ監視: 最後の変更からこの時間が経ったファイルを取り込む
+    watch_batch_size: int = 64
+    watch_stable_timeout_sec: int = 30  # 書き込みが終わらないファイルを諦めるまでの時間
     
     # キャッシュ設定
     enable_predictive_caching: bool = True
-    predictive_pages: int = 1
-    memory_cache_size: int = 2000
+    predictive_pages: int = 1  # スクロール先を何画面分先読みしておくか
+    memory_cache_mb: int = 128  # 解析済みメタデータのメモリキャッシュ上限（MB、0で無効）
+    thumbnail_level_cache_mb: int = 64  # デコード済みサムネイル（各段）のメモリキャッシュ上限（MB）
+    viewer_cache_mb: int = 128  # ビューア用に縮小済みの画像のメモリキャッシュ上限（MB）
+    viewer_prefetch_count: int = 2  # ビューアで前後それぞれ何枚を先に読み込んでおくか
     enable_thumbnail_caching: bool = True
+    thumbnail_storage: str = "pack"  # サムネイルの保存先: "pack"（専用のパックファイル）/ "db"（キャッシュDBの列）
+    thumbnail_compact_ratio: float = 0.3  # パック内の不要な領域がこの割合を超えたら空き時間に詰め直す
+    thumbnail_codec: str = "webp"  # サムネイルの符号化方式: "webp" / "jpeg" / "raw" / "zlib"
+    thumbnail_quality: int = 85  # webp・jpeg の品質
     
     # 対応フォーマット
     supported_formats: Tuple[str, ...] = field(default_factory=lambda: ('.jpg', '.jpeg', '.png', '.tiff', '.webp'))
@@ -44,6 +69,7 @@ class AppConfig:
     suggestion_max_results: int = 10
     suggestion_db_limit: int = 50
     suggestion_history_cache_ttl_sec: int = 5
+    suggestion_cache_ttl_sec: int = 60  # 入力候補のキャッシュ有効期限
     
     # 設定ファイル名
     config_file: str = "app_config.json"
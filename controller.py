@@ -4,7 +4,6 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog, messagebox, simpledialog
 import threading
-import queue
 import time
 import json
 import logging
@@ -15,24 +14,22 @@ import heapq
 import zipfile
 import io
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 from PIL import Image
 
 from view import ImageSearchView, ImageViewerWindow, WebPConversionOptionsDialog
 from draggable_widgets import DropActionDialog, ProgressDialog
 from model import ImageSearchModel
 from config import AppConfig
-
-class NewFileHandler(FileSystemEventHandler):
-    def __init__(self, controller):
-        super().__init__()
-        self.controller = controller
-
-    def on_created(self, event):
-        if event.is_directory: return
-        self.controller.handle_new_file(event.src_path)
+from ingest import create_ingest_backend
+from indexer import BackgroundIndexer
+from scheduler import Priority
+from perf import perf
+from result_set import SortedResultSet
+from scanner import DirectorySnapshot, iter_image_entries, make_suffix_set
+from search_query import CompiledQuery, compile_query
+from watcher import WatchIngestPipeline, create_watch_backend
+from ui_dispatch import UiDispatcher
+from smart_tags import SmartTagAggregator
 
 class ImageSearchController:
     def __init__(self, model: ImageSearchModel, view: ImageSearchView, config: AppConfig):
@@ -40,18 +37,42 @@ class ImageSearchController:
         self.view = view
         self.config = config
         self.view.set_controller(self)
-        self.queue = queue.Queue()
-        self.observer = None
+        # ワーカーからのメッセージは UiDispatcher 経由で UI スレッドの _handle_message に届く
+        self.queue = UiDispatcher(self.view.root, self._handle_message, self.config.ui_message_budget_ms)
         self.sorted_search_history = []
-        self.current_matched_files = []
+        self.results = SortedResultSet(self.view.sort_var.get())
         self.current_matched_files_lock = threading.Lock()
         self.search_cancel_event = threading.Event()
+        self.ingest_backend = create_ingest_backend(self.model, self.config, self.view.scheduler)
+        self.watch_pipeline = WatchIngestPipeline(self.model, self.config,
+                                                  lambda paths: self.ingest_backend.submit_batch(paths, group="watch").result(),
+                                                  self._on_watch_batch)
+        self.watch_pipeline.start()
+        self.watch_backend = create_watch_backend(self.watch_pipeline, self.model, self.config)
+        # スマートタグは検索結果が届くたびにワーカーで数え、累計の上位を UI に送る
+        self.smart_tags = SmartTagAggregator(self.model, self.view.scheduler,
+                                             lambda generation, update, tags: self.queue.put(
+                                                 {"type": "smart_tags", "generation": generation, "update": update, "tags": tags}))
+        self._shown_smart_tags = []
+        self._smart_tags_update = (0, 0)  # 表示中の集計の (世代, 通し番号)
+        # 結果の内訳による絞り込み。外した結果は解除で戻せるよう残しておく
+        self.facet_filters = []  # 適用中の (ファセット, 値)
+        self._facet_hidden = {}  # file_path -> SortedResultSet のエントリ
+        self._facet_generation = 0
+        self.background_indexer = BackgroundIndexer(self.model, self.config, self.ingest_backend,
+                                                    lambda text: self.queue.put({"type": "index_status", "text": text}))
+        if self.config.enable_background_indexer:
+            self.background_indexer.start()
         
         # ★★★ 変更点: サジェスト用のキャッシュ変数を追加 ★★★
         self._suggestion_history_cache = None
         self._suggestion_cache_time = 0
-        
-        self.view.root.after(100, self.process_queue)
+
+    @property
+    def current_matched_files(self):
+        """現在の検索結果（表示順）"""
+        with self.current_matched_files_lock:
+            return self.results.paths()
 
     def refresh_current_search(self):
         """現在の検索条件で検索を再実行する"""
@@ -123,78 +144,89 @@ class ImageSearchController:
         
         if action == "move":
             with self.current_matched_files_lock:
-                moved_files_set = set(self.view.get_selected_files())
-                self.current_matched_files = [f for f in self.current_matched_files if f not in moved_files_set]
+                self.results.remove_many(self.view.get_selected_files())
+            self.view.deselect_all_files()
             self.refresh_current_search()
 
-    def _get_all_files(self, directory, recursive):
-        all_files = []
-        try:
-            if recursive:
-                for root, _, files in os.walk(directory):
-                    if self.search_cancel_event.is_set(): return None
-                    for file in files:
-                        if os.path.splitext(file)[1].lower() in self.config.supported_formats:
-                            all_files.append(os.path.join(root, file))
-            else:
-                with os.scandir(directory) as it:
-                    for entry in it:
-                        if self.search_cancel_event.is_set(): return None
-                        if entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.config.supported_formats:
-                            all_files.append(entry.path)
-            return all_files
-        except OSError as e:
-            logging.error(f"ディレクトリへのアクセスエラー: {directory} -> {e}")
-            self.queue.put({"type": "error", "message": f"フォルダにアクセスできません: {e}"})
-            return None
+    def _iter_image_entries(self, directory, recursive):
+        """対象拡張子の画像を DirEntry として、ディレクトリを並列に走査しながら逐次返す"""
+        suffixes = make_suffix_set(self.config.supported_formats)
+        snapshot = DirectorySnapshot(self.model, directory, suffixes) if self.config.enable_dir_snapshot else None
+        return iter_image_entries(directory, suffixes, recursive, self.search_cancel_event,
+                                  self.config.scan_workers, snapshot)
 
     def _search_thread(self, params):
         self.search_cancel_event.clear()
         self.queue.put({"type": "search_started"})
-        
-        all_files = self._get_all_files(params["dir_path"], params["recursive_search"])
-        if all_files is None: 
-            if not self.search_cancel_event.is_set():
-                self.queue.put({"type": "search_finished"})
-            return
-
-        total_files = len(all_files)
-        if total_files == 0:
-            self.queue.put({"type": "done", "params": params})
+        file_iter = self._iter_image_entries(params["dir_path"], params["recursive_search"])
+        self._execute_search_tasks(file_iter, params)
+
+    def _count_files(self, file_iter, stats):
+        """走査済みファイル数を数えつつパスを流す。件数が警告閾値に達したら続行するか確認する"""
+        threshold = self.config.large_search_warning_threshold
+        for file_path in file_iter:
+            stats["discovered"] += 1
+            if stats["discovered"] == threshold and not self._confirm_large_search(threshold):
+                self.search_cancel_event.set()
+                return
+            yield file_path
+
+    def _confirm_large_search(self, count):
+        """UIスレッドに確認ダイアログを依頼し、回答を待つ"""
+        reply = {"event": threading.Event(), "ok": False}
+        self.queue.put({"type": "confirm_large_search", "count": count, "reply": reply})
+        while not reply["event"].wait(0.1):
+            if self.search_cancel_event.is_set():
+                return False
+        return reply["ok"]
+
+    def _execute_search_tasks(self, file_iter, params):
+        with perf.span("search.total"):
+            self._run_search_tasks(file_iter, params)
+
+    def _run_search_tasks(self, file_iter, params):
+        stats = {"discovered": 0, "processed": 0}
+        interval = self.config.result_batch_interval_ms / 1000
+        pending, last_flush = [], 0.0
+        try:
+            query = compile_query(params)
+            results = self.ingest_backend.iter_results(
+                self._count_files(file_iter, stats), self.search_cancel_event, self.config.max_inflight_batches)
+            for chunk, records in results:
+                with perf.span("search.match"):
+                    for record in records:
+                        if query(record):
+                            pending.append(self._result_entry(record))
+
+                stats["processed"] += len(chunk)
+                # 結果と進捗は一定間隔ごとにまとめてUIスレッドへ送る
+                now = time.monotonic()
+                if now - last_flush >= interval:
+                    self._post_search_batch(pending, stats)
+                    pending, last_flush = [], now
+            self._post_search_batch(pending, stats)
+        except OSError as e:
+            logging.error(f"ディレクトリへのアクセスエラー: {params['dir_path']} -> {e}")
+            self.queue.put({"type": "error", "message": f"フォルダにアクセスできません: {e}"})
+            self.queue.put({"type": "search_finished"})
             return
 
-        if total_files > self.config.large_search_warning_threshold:
-            self.queue.put({"type": "confirm_large_search", "files": all_files, "params": params})
+        if self.search_cancel_event.is_set():
+            self.queue.put({"type": "search_cancelled"})
             return
+        self.queue.put({"type": "done", "params": params})
 
-        self._execute_search_tasks(all_files, params)
-
-    def _execute_search_tasks(self, all_files, params):
-        total_files = len(all_files)
-        
-        with ThreadPoolExecutor(max_workers=self.config.thread_pool_size) as executor:
-            future_to_file = {executor.submit(self.model.get_metadata_and_thumbnail, f): f for f in all_files}
-            
-            for i, future in enumerate(as_completed(future_to_file)):
-                if self.search_cancel_event.is_set():
-                    for f in future_to_file: f.cancel()
-                    self.queue.put({"type": "search_cancelled"})
-                    return
-                
-                try:
-                    metadata, _, file_path = future.result()
-                    text_to_search = metadata
-                    if params.get("include_negative"):
-                         text_to_search = self.model.get_raw_metadata(file_path)
+    @staticmethod
+    def _result_entry(record):
+        """メタデータレコードから SortedResultSet 用のエントリを作る"""
+        return (record['file_path'], record['mtime'], (record.get('width') or 0) * (record.get('height') or 0))
 
-                    if self.match_keyword(params["keyword"], params["match_type"], params["and_search"], text_to_search):
-                        self.queue.put({"type": "result_found", "file_path": file_path})
-                except Exception as e:
-                    logging.error(f"ファイル処理中に例外発生: {future_to_file[future]}", exc_info=True)
-                
-                self.queue.put({"type": "progress", "value": ((i + 1) / total_files) * 100})
-        
-        self.queue.put({"type": "done", "params": params})
+    def _post_search_batch(self, entries, stats):
+        if entries:
+            self.queue.put({"type": "results_batch", "results": entries})
+        if stats["discovered"]:
+            self.queue.put({"type": "progress", "value": (stats["processed"] / stats["discovered"]) * 100,
+                            "text": f"検索中... {stats['processed']}/{stats['discovered']}件"})
 
     def start_search(self, event=None):
         params = self.view.get_search_parameters()
@@ -206,119 +238,205 @@ class ImageSearchController:
             return
         
         with self.current_matched_files_lock:
-            self.current_matched_files.clear()
-        self.view.current_page = 0
-        self.view.layout_results([], refresh=True)
+            self.results.clear()
+            self.results.set_mode(self.view.sort_var.get())
+        self._reset_facets()
+        self.render_results(refresh=True)
+        self.smart_tags.reset(params["keyword"])
         self.view.update_progress(0, "ファイルリスト作成中...")
+        self.watch_pipeline.set_query(compile_query(params))
         self.start_directory_watch(params["dir_path"])
+        self.background_indexer.pause()
         
         threading.Thread(target=self._search_thread, args=(params,), daemon=True).start()
         
-    def process_queue(self):
-        try:
-            while True:
-                msg = self.queue.get_nowait()
-                msg_type = msg.get("type")
-                
-                if msg_type == "search_started":
-                    self.view.show_cancel_button()
-                    self.view.display_smart_tags([])
-                
-                elif msg_type == "progress":
-                    self.view.update_progress(msg.get("value", 0), text=msg.get("text", ""))
-                
-                elif msg_type == "result_found":
-                    with self.current_matched_files_lock:
-                        self.current_matched_files.append(msg["file_path"])
-                    if len(self.current_matched_files) <= self.view.max_display_var.get():
-                        self.on_sort_changed(refresh=False)
-                    else:
-                        total_items = len(self.current_matched_files)
-                        max_items = self.view.max_display_var.get() or 1
-                        self.view.total_pages = (total_items + max_items - 1) // max_items
-                        if self.view.page_info_label:
-                            self.view.page_info_label.config(text=f"ページ {self.view.current_page + 1}/{self.view.total_pages} ({total_items}件)")
-                
-                elif msg_type == "display_specific_files":
-                    with self.current_matched_files_lock:
-                        self.current_matched_files = msg["files"]
-                    self.view.show_search_button()
-                    self.view.current_page = 0
-                    self.on_sort_changed()
-                    self.view.update_progress(100, text=f"{len(self.current_matched_files)} 件表示しました")
-
-                elif msg_type == "done" or msg_type == "search_cancelled" or msg_type == "search_finished":
-                    self.view.show_search_button()
-                    if msg_type == "done":
-                        params = msg.get("params")
-                        if params and params.get("keyword"):
-                            cache_key = (params["dir_path"], params["match_type"], params["keyword"], params["include_negative"], params["and_search"], params["recursive_search"])
-                            self.model.add_history(cache_key)
-                            self.update_history_display()
-                        self.on_sort_changed()
-                        if "text" not in msg:
-                            self.view.update_progress(100, text=f"{len(self.current_matched_files)} 件見つかりました")
-
-                        if params and params.get("keyword"):
-                           top_tags = self.model.get_top_tags_from_files(self.current_matched_files, params.get("keyword"))
-                           self.view.display_smart_tags(top_tags)
-
-                    elif msg_type == "search_cancelled":
-                        self.view.update_progress(0, text="検索がキャンセルされました")
-                        self.view.display_smart_tags([])
-                    
-                    elif msg_type == "search_finished":
-                         self.view.show_search_button()
+    def _handle_message(self, msg):
+        """ワーカーから届いたメッセージを UI スレッドで処理する（UiDispatcher から呼ばれる）"""
+        msg_type = msg.get("type")
+        
+        if msg_type == "search_started":
+            self.view.show_cancel_button()
+            self._show_smart_tags([])
+        
+        elif msg_type == "progress":
+            self.view.update_progress(msg.get("value", 0), text=msg.get("text", ""))
+        
+        elif msg_type == "results_batch":
+            with self.current_matched_files_lock:
+                first_index = self.results.add_many(msg["results"])
+            self._on_results_changed(first_index)
+            self.smart_tags.add([entry[0] for entry in msg["results"]])
+
+        elif msg_type == "smart_tags":
+            update = (msg["generation"], msg["update"])
+            if msg["generation"] == self.smart_tags.generation and update > self._smart_tags_update:
+                self._smart_tags_update = update
+                self._show_smart_tags(msg["tags"])
+
+        elif msg_type == "facets":
+            if msg["generation"] == self._facet_generation:
+                self.view.display_facets(msg["facets"], self.facet_filters)
+
+        elif msg_type == "facet_filter":
+            if msg["generation"] == self._facet_generation:
+                self._apply_facet_filter_result(msg["facet"], msg["value"], msg["matched"])
+        
+        elif msg_type == "display_specific_files":
+            with self.current_matched_files_lock:
+                self.results.reset(msg["results"])
+            self.smart_tags.reset(active=False)
+            self._show_smart_tags([])
+            self._reset_facets()
+            self._request_facets()
+            self.view.show_search_button()
+            self.background_indexer.resume()
+            self.on_sort_changed()
+            self.view.update_progress(100, text=f"{len(self.results)} 件表示しました")
+
+        elif msg_type == "done" or msg_type == "search_cancelled" or msg_type == "search_finished":
+            self.view.show_search_button()
+            self.background_indexer.resume()
+            if msg_type == "done":
+                params = msg.get("params")
+                if params and params.get("keyword"):
+                    cache_key = (params["dir_path"], params["match_type"], params["keyword"], params["include_negative"], params["and_search"], params["recursive_search"])
+                    self.model.add_history(cache_key)
+                    self.update_history_display()
+                    self.background_indexer.refresh_targets()
+                if not self.results:
+                    self.render_results(refresh=True)
+                else:
+                    self.view.update_result_count(len(self.results))
+                if "text" not in msg:
+                    self.view.update_progress(100, text=f"{len(self.results)} 件見つかりました")
+                self._request_facets()
+
+            elif msg_type == "search_cancelled":
+                self.view.update_progress(0, text="検索がキャンセルされました")
+                self.smart_tags.reset(active=False)
+                self._show_smart_tags([])
+            
+            elif msg_type == "search_finished":
+                 self.view.show_search_button()
 
-                elif msg_type == "new_file_matched":
-                    with self.current_matched_files_lock:
-                        if msg["file_path"] not in self.current_matched_files:
-                            self.current_matched_files.append(msg["file_path"])
-                    self.on_sort_changed(refresh=False)
+        elif msg_type == "watch_batch":
+            self._apply_watch_batch(msg)
 
-                elif msg_type == "error":
-                    messagebox.showerror("エラー", msg["message"])
-                
-                elif msg_type == "confirm_large_search":
-                    if messagebox.askokcancel("大規模検索の警告", f"{len(msg['files'])}件のファイルを検索します。\n処理に時間がかかる可能性があります。続行しますか？"):
-                         threading.Thread(target=self._execute_search_tasks, args=(msg['files'], msg['params']), daemon=True).start()
-                    else:
-                        self.queue.put({"type": "search_cancelled"})
+        elif msg_type == "index_status":
+            self.view.update_index_status(msg["text"])
+
+        elif msg_type == "error":
+            messagebox.showerror("エラー", msg["message"])
+        
+        elif msg_type == "confirm_large_search":
+            reply = msg["reply"]
+            reply["ok"] = messagebox.askokcancel("大規模検索の警告", f"{msg['count']}件以上のファイルを検索します。\n処理に時間がかかる可能性があります。続行しますか？")
+            reply["event"].set()
+
+    def _show_smart_tags(self, tags):
+        # 集計のたびに届くので、上位が変わったときだけボタンを作り直す
+        if tags == self._shown_smart_tags: return
+        self._shown_smart_tags = tags
+        self.view.display_smart_tags(tags)
+
+    def _reset_facets(self):
+        """新しい結果を表示するときに、内訳と絞り込みを捨てる"""
+        self._facet_generation += 1
+        self.facet_filters = []
+        self._facet_hidden.clear()
+        self.view.display_facets({}, [])
+
+    def _request_facets(self):
+        """今の結果の内訳をワーカーで集計し、facets メッセージで UI に送る"""
+        generation, file_paths = self._facet_generation, self.current_matched_files
+        def task():
+            facets = self.model.get_facet_counts(file_paths)
+            self.queue.put({"type": "facets", "generation": generation, "facets": facets})
+        self.view.scheduler.submit(Priority.SEARCH, task, group="facets")
+
+    def apply_facet_filter(self, facet, value):
+        """結果をファセットの値で絞り込む（DB の索引列で判定し、合わないものを結果から外す）"""
+        generation, file_paths = self._facet_generation, self.current_matched_files
+        def task():
+            matched = self.model.filter_by_facet(file_paths, facet, value)
+            self.queue.put({"type": "facet_filter", "generation": generation, "facet": facet, "value": value, "matched": matched})
+        self.view.scheduler.submit(Priority.SEARCH, task, group="facets")
+
+    def _apply_facet_filter_result(self, facet, value, matched):
+        with self.current_matched_files_lock:
+            removed = [p for p in self.results.paths() if p not in matched]
+            self._facet_hidden.update((entry[0], entry) for entry in self.results.entries(removed))
+            self.results.remove_many(removed)
+        self.facet_filters.append((facet, value))
+        self._facet_generation += 1  # 絞り込む前の結果で集計した内訳は捨てる
+        self.view.deselect_all_files()
+        self.render_results(refresh=True)
+        self.view.update_progress(100, text=f"{len(self.results)} 件に絞り込みました")
+        self._request_facets()
+
+    def clear_facet_filters(self):
+        with self.current_matched_files_lock:
+            self.results.add_many(self._facet_hidden.values())
+        self._facet_hidden.clear()
+        self.facet_filters = []
+        self._facet_generation += 1
+        self.render_results(refresh=True)
+        self.view.update_progress(100, text=f"{len(self.results)} 件表示しました")
+        self._request_facets()
+
+    def _on_results_changed(self, first_index):
+        """結果の追加・削除後、グリッドに並べている範囲に影響がある場合だけタイルを差し替える"""
+        if first_index is not None and first_index < self.view.grid_range()[1]:
+            self.render_results(refresh=False)
+        else:
+            self.view.update_result_count(len(self.results))
+
+    def _apply_watch_batch(self, msg):
+        """監視で取り込んだ変更を検索結果に反映する（変更・削除・移動されたファイルは一度外してから入れ直す）"""
+        with self.current_matched_files_lock:
+            removed = set(msg["unmatched"]) | set(msg["removed"]) | {entry[0] for entry in msg["matched"]}
+            for dir_path in msg["removed_dirs"]:
+                prefix = os.path.join(dir_path, "")
+                removed.update(p for p in self.results.paths() if p.startswith(prefix))
+            indexes = [self.results.remove_many(removed), self.results.add_many(msg["matched"])]
+            for file_path in removed:
+                self._facet_hidden.pop(file_path, None)
+        indexes = [i for i in indexes if i is not None]
+        if indexes:
+            self._on_results_changed(min(indexes))
 
-        except queue.Empty:
-            pass
-        finally:
-            self.view.root.after(100, self.process_queue)
-    
     def on_sort_changed(self, event=None, refresh=True):
         with self.current_matched_files_lock:
-            sorted_files = self.model.apply_sort(list(self.current_matched_files), self.view.sort_var.get())
-        
-        if self.config.enable_predictive_caching:
-            self._trigger_predictive_caching(sorted_files)
-        
-        files_with_thumbs = [(path, self.model._get_from_db(path).get('thumbnail') if self.model._get_from_db(path) else None) for path in sorted_files]
-        self.view.layout_results(files_with_thumbs, refresh=refresh)
-    
-    def _trigger_predictive_caching(self, sorted_files):
-        start_index = (self.view.current_page + 1) * self.view.max_display_var.get()
-        end_index = start_index + (self.config.predictive_pages * self.view.max_display_var.get())
-        files_to_preload = sorted_files[start_index:end_index]
+            self.results.set_mode(self.view.sort_var.get())
+        self.render_results(refresh=refresh)
 
-        if files_to_preload:
-            threading.Thread(target=self._predictive_cache_task, args=(files_to_preload,), daemon=True).start()
+    def render_results(self, refresh=True):
+        with self.current_matched_files_lock:
+            total_items = len(self.results)
+        self.view.set_results(total_items, refresh=refresh)
 
-    def _predictive_cache_task(self, file_paths):
-        for file_path in file_paths:
-            _, cached_thumb, _ = self.model.get_metadata_and_thumbnail(file_path)
-            if cached_thumb:
-                continue
-            future = self.view.thumbnail_executor.submit(self.view._create_and_get_webp, file_path, None)
-            future.add_done_callback(lambda f, p=file_path: self._on_predictive_cached(f, p))
+    def get_result_range(self, start, end):
+        """表示順で [start, end) の範囲の結果（グリッドのタイルに割り当てる分）"""
+        with self.current_matched_files_lock:
+            return self.results.page(start, end)
+
+    def get_cached_thumbnails(self, file_paths):
+        return self.model.get_cached_thumbnails(file_paths, self.view.thumb_size_var.get())
+
+    def prefetch_thumbnails(self, start, end):
+        """スクロール先 [start, end) のサムネイルを空きワーカーで作っておく"""
+        # 先読みはスクロールが止まるたびに作り直す（前の位置用の未処理分は捨てる）
+        self.view.scheduler.new_generation(Priority.PREFETCH)
+        if not self.config.enable_predictive_caching: return
+        for file_path in self.get_result_range(start, end):
+            self.view.scheduler.submit(Priority.PREFETCH, self._predictive_cache_task, file_path)
     
-    def _on_predictive_cached(self, future, file_path):
+    def _predictive_cache_task(self, file_path):
         try:
-            _, webp_bytes = future.result()
+            _, cached_thumb, _ = self.model.get_metadata_and_thumbnail(file_path)
+            if cached_thumb:
+                return
+            _, webp_bytes = self.view._create_and_get_webp(file_path, None)
             if webp_bytes:
                 self.model.cache_thumbnail(file_path, webp_bytes)
         except Exception:
@@ -331,31 +449,22 @@ class ImageSearchController:
         
     def on_closing(self):
         self.cancel_search()
+        self.queue.close()
+        self.background_indexer.stop()
+        self.watch_backend.stop()
+        self.watch_pipeline.stop()
         self.view.shutdown_executors()
+        self.ingest_backend.shutdown()
         if self.view.root.winfo_exists():
             self.config.window_geometry = self.view.root.geometry()
             self.config.last_ui_mode = self.view.ui_mode.get()
             self.config.thumbnail_display_size = self.view.thumb_size_var.get()
         self.config.save()
-        if self.observer:
-            self.observer.stop()
-            self.observer.join()
         self.model.close()
         self.view.root.destroy()
         
     def match_keyword(self, keyword, match_type, is_and, text):
-        if not text:
-            return False
-        tokens = keyword.split()
-        if not tokens:
-            return True
-        text_lower = text.lower()
-        if match_type == "exact":
-            return keyword.lower() == text_lower
-        if is_and:
-            return all(token.lower() in text_lower for token in tokens)
-        else:
-            return any(token.lower() in text_lower for token in tokens)
+        return CompiledQuery(keyword, match_type, is_and).matches_text(text)
     
     def update_history_display(self):
         history = self.model.load_history()
@@ -446,8 +555,7 @@ class ImageSearchController:
         selected_files = self.view.get_selected_files()
         if self._file_operation(shutil.move, "移動"):
             with self.current_matched_files_lock:
-                moved_files_set = set(selected_files)
-                self.current_matched_files = [f for f in self.current_matched_files if f not in moved_files_set]
+                self.results.remove_many(selected_files)
             self.refresh_current_search()
 
     def _file_operation(self, func, op_name):
@@ -550,8 +658,7 @@ class ImageSearchController:
             messagebox.showerror("エラー", "指定のキャラクターネガティブが見つかりませんでした。")
 
     def show_full_image(self, file_path):
-        with self.current_matched_files_lock:
-            sorted_files = self.model.apply_sort(list(self.current_matched_files), self.view.sort_var.get())
+        sorted_files = self.current_matched_files
         try:
             ImageViewerWindow(self.view.root, self, sorted_files, sorted_files.index(file_path))
         except ValueError:
@@ -614,10 +721,10 @@ class ImageSearchController:
             "include_negative": self.view.include_negative_var.get(),
             "and_search": self.view.and_search_var.get(),
             "recursive_search": self.view.recursive_search_var.get(),
-            "max_display": self.view.max_display_var.get(),
             "novel_ai_count": self.view.novel_ai_count_var.get()
         }
         if self.model.save_favorite_settings(settings):
+            self.background_indexer.refresh_targets()
             messagebox.showinfo("情報", "お気に入り設定を保存しました。")
         else:
             messagebox.showerror("エラー", "お気に入り設定の保存に失敗しました。")
@@ -651,20 +758,23 @@ class ImageSearchController:
             logging.info(f"最新ファイル検索開始: フォルダ={directory}, 上限={count}件")
             
             with self.current_matched_files_lock:
-                self.current_matched_files.clear()
-            self.view.layout_results([], refresh=True)
+                self.results.clear()
+            self.render_results(refresh=True)
             self.view.keyword_var.set(f"最新 {count} 件を表示")
+            self.watch_pipeline.set_query(None)
             self.queue.put({"type": "search_started"})
             self.view.update_progress(0, "ファイルをスキャン中...")
             
-            threading.Thread(target=self._latest_images_thread, args=(directory, count), daemon=True).start()
+            recursive = self.view.recursive_search_var.get()
+            self.background_indexer.pause()
+            threading.Thread(target=self._latest_images_thread, args=(directory, count, recursive), daemon=True).start()
             
         except Exception as e:
             error_msg = f"最新ファイル検索の開始に失敗しました: {e}"
             logging.error(error_msg, exc_info=True)
             messagebox.showerror("エラー", error_msg)
 
-    def _latest_images_thread(self, directory, count):
+    def _latest_images_thread(self, directory, count, recursive):
         """
         指定されたディレクトリ内の全画像ファイルをスキャンし、
         更新日時が最新のN件を効率的に見つけ出す。
@@ -672,43 +782,29 @@ class ImageSearchController:
         try:
             self.search_cancel_event.clear()
             
-            all_files = self._get_all_files(directory, self.view.recursive_search_var.get())
-            if all_files is None:
-                if not self.search_cancel_event.is_set():
-                    self.queue.put({"type": "search_finished"})
-                return
-            
-            total_files = len(all_files)
-            if total_files == 0:
-                self.queue.put({"type": "display_specific_files", "files": []})
-                return
-
             top_files_heap = []
 
-            for i, file_path in enumerate(all_files):
-                if self.search_cancel_event.is_set():
-                    self.queue.put({"type": "search_cancelled"})
-                    return
-                
-                if (i + 1) % 100 == 0:
-                    progress = ((i + 1) / total_files) * 100
-                    self.queue.put({"type": "progress", "value": progress})
+            for i, entry in enumerate(self._iter_image_entries(directory, recursive)):
+                if (i + 1) % 500 == 0:
+                    self.queue.put({"type": "progress", "value": 0, "text": f"スキャン中... {i + 1}件"})
                 
                 try:
-                    mtime = os.path.getmtime(file_path)
+                    mtime = entry.stat().st_mtime
                     if len(top_files_heap) < count:
-                        heapq.heappush(top_files_heap, (mtime, file_path))
+                        heapq.heappush(top_files_heap, (mtime, entry.path))
                     elif mtime > top_files_heap[0][0]:
-                        heapq.heapreplace(top_files_heap, (mtime, file_path))
+                        heapq.heapreplace(top_files_heap, (mtime, entry.path))
                 except FileNotFoundError:
                     continue
                 except Exception as e:
-                    logging.warning(f"ファイル日時の取得に失敗: {file_path}, {e}")
+                    logging.warning(f"ファイル日時の取得に失敗: {entry.path}, {e}")
+
+            if self.search_cancel_event.is_set():
+                self.queue.put({"type": "search_cancelled"})
+                return
 
-            top_files_heap.sort(key=lambda x: x[0], reverse=True)
             final_files = [file_path for mtime, file_path in top_files_heap]
-            
-            self.queue.put({"type": "display_specific_files", "files": final_files})
+            self.queue.put({"type": "display_specific_files", "results": self.model.get_result_entries(final_files)})
 
         except Exception as e:
             logging.error(f"最新ファイル検索スレッドでエラー: {e}", exc_info=True)
@@ -716,40 +812,20 @@ class ImageSearchController:
             self.queue.put({"type": "search_finished"})
 
     def start_directory_watch(self, directory):
-        if self.observer:
-            self.observer.stop()
-            self.observer.join()
+        """監視対象を切り替える。同じフォルダ・同じ再帰設定なら既存の監視をそのまま使う"""
         if not os.path.isdir(directory):
+            self.watch_backend.unwatch()
             return
-        event_handler = NewFileHandler(self)
-        self.observer = Observer()
-        self.observer.schedule(event_handler, directory, recursive=self.view.recursive_search_var.get())
-        self.observer.start()
+        try:
+            self.watch_backend.watch(directory, self.view.recursive_search_var.get())
+        except OSError as e:
+            logging.error(f"フォルダ監視の開始に失敗: {directory} -> {e}")
+
+    def _on_watch_batch(self, matched, unmatched, removed, removed_dirs):
+        """WatchIngestPipeline のスレッドから呼ばれる。結果の反映はUIスレッドで行う"""
+        self.queue.put({"type": "watch_batch", "matched": [self._result_entry(r) for r in matched],
+                        "unmatched": unmatched, "removed": removed, "removed_dirs": removed_dirs})
 
-    def handle_new_file(self, file_path):
-        if os.path.splitext(file_path)[1].lower() not in self.config.supported_formats:
-            return
-        for _ in range(5):
-            if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-                try:
-                    with open(file_path, 'rb') as f:
-                        f.read(1024)
-                except OSError:
-                    time.sleep(0.1)
-                    continue
-                else:
-                    break
-            else:
-                time.sleep(0.1)
-        else:
-            logging.warning(f"ファイルにアクセスできなかったためスキップ: {file_path}")
-            return
-        
-        params = self.view.get_search_parameters()
-        metadata, _, _ = self.model.get_metadata_and_thumbnail(file_path)
-        if self.match_keyword(params["keyword"], params["match_type"], params["and_search"], metadata):
-            self.queue.put({"type": "new_file_matched", "file_path": file_path})
-    
     def cache_thumbnail(self, file_path, webp_bytes):
         self.model.cache_thumbnail(file_path, webp_bytes)
 
@@ -131,9 +131,8 @@ class DraggableImageLabel(ttk.Label):
 
     def on_ctrl_click(self, event):
         """Ctrl+クリックで選択状態を反転"""
-        var = self.controller.view.selected_files_vars.get(self.file_path)
-        if var:
-            var.set(not var.get())
+        if self.file_path:
+            self.controller.view.toggle_file_selected(self.file_path)
         return "break"
 
 # === 以下は変更なしのクラス群 ===
@@ -0,0 +1,78 @@
+"""
+検索結果の内訳（ファセット）の定義。
+集計・絞り込みの SQL は metadata_cache を m として、検索結果のパスを入れた一時テーブルと結合して使う。
+値が空文字の項目は「不明」として表示する。
+"""
+import time
+
+FACETS = {
+    "generator": "生成元",
+    "model": "モデル",
+    "resolution": "解像度",
+    "aspect": "縦横比",
+    "month": "更新月",
+}
+
+# (表示名, 下限, 上限) 画素数
+RESOLUTION_BUCKETS = [
+    ("1MP未満", 1, 1_000_000),
+    ("1〜2MP", 1_000_000, 2_000_000),
+    ("2〜4MP", 2_000_000, 4_000_000),
+    ("4〜8MP", 4_000_000, 8_000_000),
+    ("8MP以上", 8_000_000, None),
+]
+
+# 幅 / 高さ がこの範囲なら正方形として扱う
+SQUARE_RATIO = (0.9, 1.1)
+
+MONTH_LIMIT = 12  # 更新月は新しい順にこの数だけ表示する
+
+_PIXELS = "m.width * m.height"  # idx_pixels と同じ式（インデックスを使わせるため）
+
+_ASPECT = (f"CASE WHEN NOT (m.width > 0 AND m.height > 0) THEN '' "
+           f"WHEN m.width < m.height * {SQUARE_RATIO[0]} THEN '縦長' "
+           f"WHEN m.width > m.height * {SQUARE_RATIO[1]} THEN '横長' ELSE '正方形' END")
+
+_GROUP_SQL = {
+    "generator": "m.generator",
+    "model": "m.model_name",
+    "resolution": ("CASE " + " ".join(f"WHEN {_PIXELS} >= {low} THEN '{label}'" for label, low, _ in reversed(RESOLUTION_BUCKETS))
+                   + " ELSE '' END"),
+    "aspect": _ASPECT,
+    "month": "strftime('%Y-%m', m.mtime, 'unixepoch', 'localtime')",
+}
+
+def group_sql(facet):
+    """facet の値を求める SQL 式"""
+    return _GROUP_SQL[facet]
+
+def order_sql(facet):
+    """集計結果の並び順。更新月は新しい順（ヒストグラム）、それ以外は件数の多い順"""
+    return "value DESC" if facet == "month" else "count DESC, value"
+
+def filter_sql(facet, value):
+    """facet が value の行に絞り込む (WHERE 句, パラメータ)。インデックスのある列はその列で比較する"""
+    if facet == "generator":
+        return "m.generator = ?", (value,)
+    if facet == "model":
+        return "m.model_name = ?", (value,)
+    if facet == "resolution":
+        for label, low, high in RESOLUTION_BUCKETS:
+            if label == value:
+                if high is None:
+                    return f"{_PIXELS} >= ?", (low,)
+                return f"{_PIXELS} >= ? AND {_PIXELS} < ?", (low, high)
+        return f"NOT ({_PIXELS} > 0)", ()
+    if facet == "aspect":
+        return f"{_ASPECT} = ?", (value,)
+    if facet == "month":
+        if not value:
+            return "m.mtime IS NULL", ()
+        year, month = map(int, value.split("-"))
+        start = time.mktime((year, month, 1, 0, 0, 0, 0, 0, -1))
+        end = time.mktime((year + month // 12, month % 12 + 1, 1, 0, 0, 0, 0, 0, -1))
+        return "m.mtime >= ? AND m.mtime < ?", (start, end)
+    raise KeyError(facet)
+
+def value_label(value):
+    return value or "不明"
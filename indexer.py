@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+import itertools
+
+from config import AppConfig
+from model import ImageSearchModel
+from scanner import DirectorySnapshot, iter_image_entries, make_suffix_set
+from scheduler import Priority
+
+class BackgroundIndexer:
+    """
+    お気に入り・検索履歴のフォルダを、アプリが操作されていない間に少しずつキャッシュDBへ取り込んでおく。
+    - 検索中は pause() で止め、resume() から index_idle_delay_sec 経過するまで再開しない
+    - 1チャンク処理するごとに、処理時間に応じて休む（index_duty_cycle の割合しか動かない）
+    - 進捗は on_progress(text) で通知する（空文字は表示を消す）
+    """
+    def __init__(self, model: ImageSearchModel, config: AppConfig, ingest_backend, on_progress):
+        self.model = model
+        self.config = config
+        self.ingest_backend = ingest_backend
+        self.on_progress = on_progress
+        self.suffixes = make_suffix_set(config.supported_formats)
+        self.idle_delay = max(0, config.index_idle_delay_sec)
+        self.duty_cycle = min(1.0, max(0.05, config.index_duty_cycle))
+        self._cond = threading.Condition()
+        self._paused = False
+        self._idle_since = time.monotonic()
+        self._refresh = True
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="bg-indexer")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def pause(self):
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._idle_since = time.monotonic()
+            self._cond.notify_all()
+
+    def refresh_targets(self):
+        """お気に入り・履歴が変わったときに呼ぶ。次の空き時間に対象フォルダを走査し直す"""
+        with self._cond:
+            self._refresh = True
+            self._cond.notify_all()
+
+    def _targets(self):
+        """(フォルダ, 再帰するか) のリスト。お気に入りを先に、履歴は新しい順に並べる"""
+        targets, seen = [], set()
+        favorite = self.model.load_favorite_settings()
+        candidates = [(favorite.get("dir_path"), favorite.get("recursive_search", True))]
+        for item in reversed(self.model.load_history()):
+            # 履歴は [dir_path, match_type, keyword, include_negative, and_search, recursive_search]
+            if isinstance(item, (list, tuple)) and item:
+                candidates.append((item[0], item[5] if len(item) > 5 else True))
+        for dir_path, recursive in candidates:
+            if not dir_path or not os.path.isdir(dir_path): continue
+            key = os.path.normcase(os.path.normpath(dir_path))
+            if key in seen: continue
+            seen.add(key)
+            targets.append((dir_path, bool(recursive)))
+        return targets
+
+    def _wait_idle(self):
+        """一時停止が解除され、最後の操作から idle_delay 秒経つまで待つ。停止されたら False"""
+        with self._cond:
+            while not self._stop_event.is_set():
+                if not self._paused:
+                    remaining = self.idle_delay - (time.monotonic() - self._idle_since)
+                    if remaining <= 0:
+                        return True
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+        return False
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._cond:
+                while not self._refresh and not self._stop_event.is_set():
+                    self._cond.wait()
+                self._refresh = False
+            if not self._wait_idle(): return
+            try:
+                for dir_path, recursive in self._targets():
+                    if not self._index_directory(dir_path, recursive): return
+                # 空き時間のうちに、サムネイルストアの不要な領域を詰め直しておく
+                if not self._wait_idle(): return
+                self.model.compact_thumb_store()
+                # 古い版のレコードのタグ索引も作り直しておく（操作が始まったら途中でやめる）
+                self.model.backfill_prompt_tags(lambda: self._stop_event.is_set() or self._paused)
+            except Exception:
+                logging.error("バックグラウンドインデックス作成中にエラーが発生しました", exc_info=True)
+            self.on_progress("")
+
+    def _index_directory(self, dir_path, recursive):
+        name = os.path.basename(os.path.normpath(dir_path)) or dir_path
+        snapshot = DirectorySnapshot(self.model, dir_path, self.suffixes) if self.config.enable_dir_snapshot else None
+        entries = iter_image_entries(dir_path, self.suffixes, recursive, self._stop_event, 1, snapshot)
+        processed = 0
+        try:
+            while True:
+                if not self._wait_idle(): return False
+                chunk = list(itertools.islice(entries, self.config.ingest_chunk_size))
+                if not chunk: break
+                started = time.monotonic()
+                self.ingest_backend.submit_batch(chunk, Priority.INDEX, group=dir_path).result()
+                processed += len(chunk)
+                self.on_progress(f"インデックス作成中: {name} ({processed}件)")
+                # 前景の操作を邪魔しないよう、処理時間に比例して休む
+                busy = time.monotonic() - started
+                if self._stop_event.wait(busy * (1 / self.duty_cycle - 1)): return False
+        except OSError as e:
+            logging.warning(f"バックグラウンドインデックス作成をスキップ: {dir_path} -> {e}")
+        finally:
+            entries.close()
+        logging.info(f"バックグラウンドインデックス作成完了: {dir_path} ({processed}件)")
+        return True
@@ -0,0 +1,135 @@
+import os
+import logging
+import threading
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from config import AppConfig
+from model import ImageSearchModel, parse_image_batch, parse_image_batch_timed
+from perf import perf
+from scheduler import Priority, PriorityScheduler
+
+class ThreadIngestBackend:
+    """共有ワーカープールのスレッドでファイルを1件ずつ解析する従来方式のバックエンド"""
+    name = "thread"
+
+    def __init__(self, model: ImageSearchModel, config: AppConfig, scheduler: PriorityScheduler):
+        self.model = model
+        self.scheduler = scheduler
+        self.chunk_size = max(1, config.ingest_chunk_size)
+        self.max_workers = max(1, config.thread_pool_size)
+
+    def submit_batch(self, file_paths, priority=Priority.SEARCH, group=None):
+        """ファイル群の解析を投入し、レコードのリストを返す Future を返す"""
+        return self.scheduler.submit(priority, self._ingest_batch, list(file_paths), group=group)
+
+    def iter_results(self, file_paths, cancel_event=None, max_inflight=0):
+        """
+        パスのイテラブルを遅延的に読み進めながらチャンク単位で投入し、完了したチャンクから順に
+        (チャンク, レコードのリスト) を返すジェネレータ。
+        投入済みで未完了のチャンク数を max_inflight 以下に抑える（バックプレッシャー）ため、
+        ファイル総数によらずメモリ使用量は一定で、キャンセル時も破棄するのは投入中の分だけで済む。
+        """
+        max_inflight = max_inflight or self.max_workers * 2
+        path_iter = iter(file_paths)
+        inflight = {}
+
+        def fill():
+            while len(inflight) < max_inflight:
+                if cancel_event is not None and cancel_event.is_set(): return
+                chunk = list(itertools.islice(path_iter, self.chunk_size))
+                if not chunk: return
+                inflight[self.submit_batch(chunk)] = chunk
+
+        try:
+            fill()
+            while inflight:
+                if cancel_event is not None and cancel_event.is_set(): return
+                done, _ = wait(inflight, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = inflight.pop(future)
+                    try:
+                        records = future.result()
+                    except Exception:
+                        logging.error(f"ファイル処理中に例外発生: {os.fspath(chunk[0])} ほか{len(chunk)}件", exc_info=True)
+                        records = []
+                    yield chunk, records
+                fill()
+        finally:
+            for future in inflight: future.cancel()
+
+    def _ingest_batch(self, file_paths):
+        perf.count("ingest.files", len(file_paths))
+        records = []
+        for file_path in file_paths:
+            record = self.model.get_metadata_record(os.fspath(file_path))
+            if record is not None:
+                records.append(record)
+        return records
+
+    def shutdown(self):
+        pass
+
+class ProcessIngestBackend(ThreadIngestBackend):
+    """
+    GILに縛られる解析処理（exifread・正規表現・JSONブロック抽出）をプロセスプールで並列化するバックエンド。
+    鮮度チェックとDB書き込みは親プロセス（共有ワーカープールのスレッド）で行い、
+    ワーカープロセスには要解析のパスだけをチャンク単位で渡す。
+    """
+    name = "process"
+
+    def __init__(self, model: ImageSearchModel, config: AppConfig, scheduler: PriorityScheduler):
+        self.model = model
+        self.scheduler = scheduler
+        self.chunk_size = max(1, config.ingest_chunk_size)
+        self.max_workers = max(1, config.process_pool_size or os.cpu_count() or 4)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def _ingest_batch(self, file_paths):
+        perf.count("ingest.files", len(file_paths))
+        records, stale = self.model.split_fresh_records(file_paths)
+        if not stale:
+            return records
+
+        try:
+            if perf.enabled:
+                # ワーカープロセス内の計測値は親の計測器に取り込む
+                parsed, spans = self._get_pool().submit(parse_image_batch_timed, stale).result()
+                perf.merge(spans)
+            else:
+                parsed = self._get_pool().submit(parse_image_batch, stale).result()
+        except BrokenProcessPool:
+            logging.error("解析プロセスが異常終了しました。プロセスプールを再作成し、このチャンクはスレッドで解析します。")
+            with self._pool_lock:
+                self._pool = None
+            parsed = parse_image_batch(stale)
+
+        self.model.save_records(parsed)
+        records.extend(parsed)
+        return records
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+INGEST_BACKENDS = {
+    ThreadIngestBackend.name: ThreadIngestBackend,
+    ProcessIngestBackend.name: ProcessIngestBackend,
+}
+
+def create_ingest_backend(model: ImageSearchModel, config: AppConfig, scheduler: PriorityScheduler):
+    backend_cls = INGEST_BACKENDS.get(config.ingest_backend)
+    if backend_cls is None:
+        logging.warning(f"不明なインジェストバックエンド '{config.ingest_backend}' です。'thread' を使用します。")
+        backend_cls = ThreadIngestBackend
+    return backend_cls(model, config, scheduler)
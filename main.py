@@ -1,12 +1,14 @@
 import tkinter as tk
 from tkinter import messagebox
 import logging
+import multiprocessing
 import tkinterdnd2
 
 from config import AppConfig
 from model import ImageSearchModel
 from view import ImageSearchView
 from controller import ImageSearchController
+from perf import perf
 
 def main():
     # ★★★ 変更点: デバッグレベルのロギングを有効化 ★★★
@@ -16,6 +18,7 @@ def main():
     )
     
     config = AppConfig.load()
+    perf.enabled = config.enable_perf_stats
     model = None
     try:
         root = tkinterdnd2.Tk()
@@ -47,4 +50,6 @@ def main():
         logging.info("アプリケーションを終了しました")
 
 if __name__ == "__main__":
+    # exe化した環境でプロセスプール（インジェストバックエンド）を使うために必要
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -3,39 +3,182 @@ import exifread
 import json
 import re
 import logging
+import heapq
 import collections
 import sqlite3
-import threading
 from PIL import Image
 from config import AppConfig
+from perf import InstrumentedLock, PerfRecorder, perf
+from cache import ShardedLRUCache, record_size
+from thumbnails import LEVEL_COLUMNS, THUMBNAIL_COLUMNS, TOP_COLUMN, codec_of, column_for, pick_level, recode
+from thumbstore import ThumbStore
+from facets import FACETS, MONTH_LIMIT, filter_sql, group_sql, order_sql
 
-class ThreadSafeLRUCache:
-    def __init__(self, capacity: int):
-        self.capacity = capacity
-        self.cache = collections.OrderedDict()
-        self._lock = threading.RLock()
-    def get(self, key, default=None):
-        with self._lock:
-            if key not in self.cache: return default
-            self.cache.move_to_end(key)
-            return self.cache[key]
-    def set(self, key, value):
-        with self._lock:
-            if self.capacity <= 0: return
-            if key in self.cache: self.cache.move_to_end(key)
-            elif len(self.cache) >= self.capacity: self.cache.popitem(last=False)
-            self.cache[key] = value
+# SQLiteのホストパラメータ上限（古いビルドでは999）に収まるチャンクサイズ
+SQLITE_MAX_PARAMS = 900
+
+# サムネイル列（後から追加した段の列を含む）は位置に頼らず列名で指定する
+INSERT_RECORD_SQL = ("INSERT OR REPLACE INTO metadata_cache (file_path, mtime, meta, meta_no_neg, width, height, thumbnail, "
+                     "generator, model_name, tags_version) VALUES (?,?,?,?,?,?,?,?,?,?)")
+
+# meta から作る索引（prompt_tags と generator・model_name 列）の抽出方法を変えたら上げる。
+# 古い版のレコードは空き時間と集計時に作り直す
+TAGS_VERSION = 2
+
+# --- メタデータ解析（プロセスプールのワーカーからも呼ばれるため、モジュール関数として定義） ---
+
+def extract_json_block(text, start_key):
+    if not isinstance(text, str): return None
+    start_index = text.find(start_key)
+    if start_index == -1: return None
+    first_brace = text.find('{', start_index)
+    if first_brace == -1: return None
+    stack, in_string, escape, end_index = [], False, False, None
+    for i in range(first_brace, len(text)):
+        char = text[i]
+        if char == '"' and not escape:
+            in_string = not in_string
+        if char == '\\' and not escape:
+            escape = True
+        else:
+            escape = False
+        if not in_string:
+            if char == '{':
+                stack.append('{')
+            elif char == '}':
+                if stack:
+                    stack.pop()
+                    if not stack:
+                        end_index = i + 1
+                        break
+    if end_index is None: return None
+    return re.sub(r',\s*([}\]])', r'\1', text[first_brace:end_index])
+
+def extract_char_captions(meta_text):
+    """メタデータ文字列からキャラクタープロンプトのリストを抽出する"""
+    json_str = extract_json_block(meta_text, '"v4_prompt"')
+    if json_str:
+        try:
+            return [c.get("char_caption", "") for c in json.loads(json_str).get("caption", {}).get("char_captions", [])]
+        except json.JSONDecodeError:
+            pass
+    return []
+
+def extract_prompt_tags(meta_text):
+    """スマートタグの集計に使う {タグ: 出現回数}（キャラクタープロンプトのカンマ区切り、1文字のタグは除く）"""
+    counts = collections.Counter()
+    for caption in extract_char_captions(meta_text):
+        counts.update(tag for tag in (t.strip() for t in caption.split(',')) if len(tag) > 1)
+    return counts
+
+def detect_generator(meta_text):
+    """メタデータ文字列から (生成元, モデル名) を推定する。分からなければ空文字"""
+    if not isinstance(meta_text, str) or not meta_text:
+        return "", ""
+    if 'NovelAI' in meta_text or '"v4_prompt"' in meta_text:
+        source = re.search(r'(NovelAI Diffusion[^\n"]*?)(?:\s+[0-9A-F]{8})?\s*(?:\n|"|$)', meta_text)
+        return "NovelAI", source.group(1).strip() if source else ""
+    if '"class_type"' in meta_text:
+        ckpt = re.search(r'"ckpt_name"\s*:\s*"([^"]+)"', meta_text)
+        # JSON 内のパス区切り（\ を \\ とエスケープしたもの）を / にそろえる
+        return "ComfyUI", os.path.splitext(os.path.basename(ckpt.group(1).replace('\\\\', '/')))[0] if ckpt else ""
+    if re.search(r'(?:^|\n)Steps: \d+', meta_text):
+        model = re.search(r'(?:^|[,\n]\s*)Model: ([^,\n]+)', meta_text)
+        return "Stable Diffusion WebUI", model.group(1).strip() if model else ""
+    return "", ""
+
+def rank_tags(counts, exclude_keywords=None, limit=20):
+    """タグの出現回数から、検索キーワード（カンマ・空白区切り）を除いた上位 limit 件を [(タグ, 回数)] で返す"""
+    excluded = {kw.lower() for kw in re.split(r'[, ]+', exclude_keywords or "") if kw}
+    return heapq.nlargest(limit, ((tag, count) for tag, count in counts.items() if tag.lower() not in excluded),
+                          key=lambda item: item[1])
+
+def filter_negative_prompt(raw_meta):
+    if not isinstance(raw_meta, str): return ""
+    text_parts = []
+    prompt_match = re.search(r'"prompt"\s*:\s*"([^"]*)"', raw_meta)
+    if prompt_match: text_parts.append(prompt_match.group(1))
+    a1111_match = re.search(r'^(.*?)\nNegative prompt: ', raw_meta, re.DOTALL)
+    if a1111_match: text_parts.append(a1111_match.group(1).strip())
+    base_match = re.search(r'"base_caption"\s*:\s*"([^"]*)"', raw_meta, re.IGNORECASE | re.DOTALL)
+    if base_match: text_parts.append(base_match.group(1))
+    text_parts.extend(extract_char_captions(raw_meta))
+    return " ".join(filter(None, text_parts)).strip()
+
+def _read_exif_text(file_path):
+    with open(file_path, 'rb') as f:
+        return "\n".join(str(v) for v in exifread.process_file(f, details=False, stop_tag='JPEGThumbnail').values())
+
+def read_image_metadata(file_path):
+    """ファイルから (生メタデータ, 幅, 高さ) を読み取る。PNG/WebPは1回のopenで両方取得する"""
+    ext = os.path.splitext(file_path)[1].lower()
+    raw_meta, width, height = "", 0, 0
+    try:
+        if ext in ('.png', '.webp'):
+            with Image.open(file_path) as img:
+                width, height = img.size
+                raw_meta = "\n".join(str(v) for v in img.info.values())
+            return raw_meta, width, height
+        if ext in ('.jpg', '.jpeg', '.tiff'):
+            raw_meta = _read_exif_text(file_path)
+    except Exception as e:
+        logging.warning(f"ディスク読込エラー: {file_path} -> {e}")
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+    except Exception:
+        pass
+    return raw_meta, width, height
+
+def parse_image_file(file_path, mtime, recorder=perf):
+    """1ファイルを解析し、metadata_cacheに保存できる形式のレコードを返す"""
+    with recorder.span("extract" + os.path.splitext(file_path)[1].lower()):
+        raw_meta, width, height = read_image_metadata(file_path)
+    generator, model_name = detect_generator(raw_meta)
+    return {'file_path': file_path, 'mtime': mtime, 'meta': raw_meta,
+            'meta_no_neg': filter_negative_prompt(raw_meta), 'width': width, 'height': height,
+            'tags': extract_prompt_tags(raw_meta), 'generator': generator, 'model_name': model_name}
+
+def parse_image_batch(items, recorder=perf):
+    """(file_path, mtime) のリストをまとめて解析する。プロセスプールのワーカー用"""
+    records = []
+    for file_path, mtime in items:
+        try:
+            records.append(parse_image_file(file_path, mtime, recorder))
+        except Exception as e:
+            logging.warning(f"メタデータ解析エラー: {file_path} -> {e}")
+    return records
+
+def parse_image_batch_timed(items):
+    """parse_image_batch と同じだが、ワーカープロセス内で計測した形式別の解析時間も返す"""
+    recorder = PerfRecorder(enabled=True)
+    return parse_image_batch(items, recorder), recorder.export_spans()
+
+def like_prefix(path):
+    """path 配下（path 自身を除く）に一致する LIKE パターンを返す。ESCAPE '\\' と組み合わせて使う"""
+    escaped = path.rstrip('\\/').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + ('\\\\' if os.sep == '\\' else os.sep) + '%'
+
+def _entry_mtime(item):
+    """パス文字列または DirEntry の mtime を返す。DirEntry ならキャッシュ済みの stat を使う"""
+    stat = getattr(item, 'stat', None)
+    return stat().st_mtime if stat else os.path.getmtime(item)
 
 class ImageSearchModel:
     def __init__(self, config: AppConfig):
         self.config = config
         self.history_file = "search_history.json"
         self.favorites_file = "favorites.json"
-        self.memory_cache = ThreadSafeLRUCache(self.config.memory_cache_size)
+        # 解析済みメタデータのL1キャッシュ（(file_path, mtime) をキーにし、見積もりバイト数で追い出す）。
+        # ヒットすればDBロックを取らずに済むため、再検索や右クリックメニューの操作がDBと競合しない
+        self.memory_cache = ShardedLRUCache(max_bytes=max(0, self.config.memory_cache_mb) * 1024 * 1024,
+                                            sizer=record_size, name="metadata_memory")
         self.db_path = "metadata_cache.db"
-        self.db_lock = threading.Lock()
+        self.thumb_store_path = "thumbnail_store"
+        self.db_lock = InstrumentedLock("db")
         self.db_connection = None
         self._init_database()
+        self.thumb_store = self._open_thumb_store()
         self.search_history = self.load_history()
         self.current_matched_files = []
 
@@ -52,34 +195,130 @@ class ImageSearchModel:
                                   meta_no_neg TEXT, width INTEGER, height INTEGER,
                                   thumbnail BLOB)''')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_mtime ON metadata_cache(mtime)')
+                # サムネイルピラミッドの段の列（既存のDBには後から追加する）
+                cursor.execute('PRAGMA table_info(metadata_cache)')
+                columns = {row[1] for row in cursor.fetchall()}
+                for column in LEVEL_COLUMNS.values():
+                    if column not in columns:
+                        cursor.execute(f'ALTER TABLE metadata_cache ADD COLUMN {column} BLOB')
+                # 結果の内訳（ファセット）で数える・絞り込む列
+                for column in ('generator', 'model_name'):
+                    if column not in columns:
+                        cursor.execute(f"ALTER TABLE metadata_cache ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_generator ON metadata_cache(generator, model_name)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_model_name ON metadata_cache(model_name)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_pixels ON metadata_cache(width * height)')
+                # meta から作る索引の抽出方法の版（既存のレコードは 0 になり、後から作り直す）
+                if 'tags_version' not in columns:
+                    cursor.execute('ALTER TABLE metadata_cache ADD COLUMN tags_version INTEGER NOT NULL DEFAULT 0')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_tags_version ON metadata_cache(tags_version)')
+                # スマートタグ用のタグ索引。検索結果との結合と GROUP BY だけで集計できる
+                cursor.execute('''CREATE TABLE IF NOT EXISTS prompt_tags (
+                                  file_path TEXT NOT NULL, tag TEXT NOT NULL, count INTEGER NOT NULL,
+                                  PRIMARY KEY (file_path, tag)) WITHOUT ROWID''')
+                cursor.execute('''CREATE TABLE IF NOT EXISTS dir_snapshot (
+                                  dir_path TEXT PRIMARY KEY, mtime REAL NOT NULL, formats TEXT NOT NULL,
+                                  files TEXT NOT NULL, subdirs TEXT NOT NULL)''')
                 self.db_connection.commit()
         except sqlite3.Error as e:
             logging.error(f"データベース初期化失敗: {e}")
             if self.db_connection: self.db_connection.close()
     
+    def _open_thumb_store(self):
+        """config.thumbnail_storage が "pack" なら、サムネイル用のパックファイルを開く（失敗したらDBに保存する）"""
+        if self.config.thumbnail_storage != "pack":
+            return None
+        try:
+            return ThumbStore(self.thumb_store_path)
+        except (OSError, ValueError) as e:
+            logging.error(f"サムネイルストアを開けません。DBに保存します: {e}")
+            return None
+
     def get_metadata_and_thumbnail(self, file_path):
+        record = self.get_metadata_record(file_path)
+        if record is None:
+            return "", None, file_path
+        return record['meta_no_neg'], self.get_cached_thumbnail(file_path), file_path
+
+    def get_metadata_record(self, file_path):
+        """最新のメタデータレコードを返す。キャッシュが古い場合はディスクから再解析して保存する"""
         try:
             current_mtime = os.path.getmtime(file_path)
-        except FileNotFoundError:
-            return "", None, file_path
+        except OSError:
+            return None
+
+        record = self.memory_cache.get((file_path, current_mtime))
+        if record is not None:
+            return record
 
         db_data = self._get_from_db(file_path)
         if db_data and db_data['mtime'] == current_mtime:
-            return db_data['meta_no_neg'], db_data.get('thumbnail'), file_path
+            perf.count("metadata_cache.hit")
+            return self._remember(db_data)
 
-        raw_meta = self._read_raw_metadata_from_disk(file_path)
-        width, height = self._get_image_dimensions(file_path)
-        meta_no_neg = self._filter_negative_prompt(raw_meta)
-        
-        new_db_data = {'file_path': file_path, 'mtime': current_mtime, 'meta': raw_meta, 'meta_no_neg': meta_no_neg, 'width': width, 'height': height, 'thumbnail': None}
-        self._save_to_db(new_db_data)
-        
-        return meta_no_neg, None, file_path
+        perf.count("metadata_cache.miss")
+        record = parse_image_file(file_path, current_mtime)
+        self._save_to_db(record)
+        return record
 
-    def get_raw_metadata(self, file_path):
+    def split_fresh_records(self, file_paths):
+        """
+        ファイル群（パスまたは DirEntry）をキャッシュ済み（mtime一致）と要再解析に振り分ける。
+        戻り値: (キャッシュ済みレコードのリスト, 要解析の (file_path, mtime) リスト)
+        """
+        with perf.span("ingest.freshness"):
+            mtimes = {}
+            for item in file_paths:
+                try:
+                    mtimes[os.fspath(item)] = _entry_mtime(item)
+                except OSError:
+                    continue
+
+            # まずメモリキャッシュを引き、残りだけDBへ問い合わせる
+            in_memory = self.memory_cache.get_many(list(mtimes.items()))
+            fresh = list(in_memory.values())
+            remaining = [file_path for file_path, mtime in mtimes.items() if (file_path, mtime) not in in_memory]
+            cached = self._get_many_from_db(remaining) if remaining else {}
+            from_db, stale = [], []
+            for file_path in remaining:
+                mtime = mtimes[file_path]
+                row = cached.get(file_path)
+                if row and row['mtime'] == mtime:
+                    from_db.append(row)
+                else:
+                    stale.append((file_path, mtime))
+            self.memory_cache.set_many(((row['file_path'], row['mtime']), row) for row in from_db)
+            fresh.extend(from_db)
+        perf.count("metadata_cache.hit", len(from_db))
+        perf.count("metadata_cache.miss", len(stale))
+        return fresh, stale
+
+    def _remember(self, record):
+        """レコードをメモリキャッシュに載せて返す（サムネイル列は載せない）"""
+        if not THUMBNAIL_COLUMNS.isdisjoint(record):
+            record = {k: v for k, v in record.items() if k not in THUMBNAIL_COLUMNS}
+        self.memory_cache.set((record['file_path'], record['mtime']), record)
+        return record
+
+    def _get_known_record(self, file_path):
+        """メモリキャッシュ、なければDBのレコードを返す（mtime が一致するDBのレコードはメモリに載せる）"""
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            mtime = None
+        if mtime is not None:
+            record = self.memory_cache.get((file_path, mtime))
+            if record is not None:
+                return record
         db_data = self._get_from_db(file_path)
-        if db_data and db_data.get('meta') is not None:
-            return db_data['meta']
+        if db_data and db_data['mtime'] == mtime:
+            return self._remember(db_data)
+        return db_data
+
+    def get_raw_metadata(self, file_path):
+        record = self._get_known_record(file_path)
+        if record and record.get('meta') is not None:
+            return record['meta']
         return self._read_raw_metadata_from_disk(file_path)
 
     def _get_from_db(self, file_path):
@@ -93,37 +332,383 @@ class ImageSearchModel:
                 logging.error(f"DB読込エラー: {file_path}, {e}")
                 return None
 
+    def _get_many_from_db(self, file_paths):
+        """複数パスのレコードをまとめて取得する（サムネイル列は除く）"""
+        rows = {}
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                for i in range(0, len(file_paths), SQLITE_MAX_PARAMS):
+                    chunk = file_paths[i:i + SQLITE_MAX_PARAMS]
+                    placeholders = ','.join('?' for _ in chunk)
+                    cursor.execute(f"SELECT file_path, mtime, meta, meta_no_neg, width, height FROM metadata_cache WHERE file_path IN ({placeholders})", chunk)
+                    for row in cursor.fetchall():
+                        rows[row['file_path']] = dict(row)
+            except sqlite3.Error as e:
+                logging.error(f"DB一括読込エラー: {e}")
+        return rows
+
+    def save_records(self, records):
+        """解析済みレコードを1トランザクションでまとめて保存する"""
+        if not records: return
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.executemany(INSERT_RECORD_SQL,
+                                   [(r['file_path'], r['mtime'], r['meta'], r['meta_no_neg'],
+                                     r['width'], r['height'], r.get('thumbnail'), *self._record_generator(r), TAGS_VERSION)
+                                    for r in records])
+                self._write_prompt_tags(cursor, [(r['file_path'], self._pop_record_tags(r)) for r in records])
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"DB一括書込エラー: {e}")
+                return
+        self.memory_cache.set_many(((r['file_path'], r['mtime']), r) for r in records if 'thumbnail' not in r)
+
     def _save_to_db(self, data):
         with self.db_lock:
             try:
                 cursor = self.db_connection.cursor()
-                cursor.execute("INSERT OR REPLACE INTO metadata_cache VALUES (?,?,?,?,?,?,?)",
+                cursor.execute(INSERT_RECORD_SQL,
                                (data['file_path'], data['mtime'], data['meta'], data['meta_no_neg'],
-                                data['width'], data['height'], data.get('thumbnail')))
+                                data['width'], data['height'], data.get('thumbnail'), *self._record_generator(data), TAGS_VERSION))
+                self._write_prompt_tags(cursor, [(data['file_path'], self._pop_record_tags(data))])
                 self.db_connection.commit()
             except sqlite3.Error as e:
                 logging.error(f"DB書込エラー: {data['file_path']}, {e}")
+                return
+        self._remember(data)
     
+    @staticmethod
+    def _pop_record_tags(record):
+        """解析時に抽出したタグを取り出す（メモリキャッシュには持たせない）。なければ meta から抽出する"""
+        tags = record.pop('tags', None)
+        return extract_prompt_tags(record['meta']) if tags is None else tags
+
+    @staticmethod
+    def _record_generator(record):
+        if 'generator' in record:
+            return record['generator'], record['model_name']
+        return detect_generator(record['meta'])
+
+    @staticmethod
+    def _write_prompt_tags(cursor, items):
+        """[(file_path, {タグ: 回数})] で prompt_tags を置き換える（呼び出し側で db_lock を取り、コミットする）"""
+        cursor.executemany("DELETE FROM prompt_tags WHERE file_path = ?", [(file_path,) for file_path, _ in items])
+        cursor.executemany("INSERT INTO prompt_tags (file_path, tag, count) VALUES (?,?,?)",
+                           [(file_path, tag, count) for file_path, tags in items for tag, count in tags.items()])
+
+    def _rebuild_prompt_tags(self, cursor, rows):
+        """古い版の prompt_tags と generator・model_name 列を (file_path, meta) の行から作り直す"""
+        self._write_prompt_tags(cursor, [(row[0], extract_prompt_tags(row[1])) for row in rows])
+        cursor.executemany("UPDATE metadata_cache SET generator = ?, model_name = ?, tags_version = ? WHERE file_path = ?",
+                           [(*detect_generator(row[1]), TAGS_VERSION, row[0]) for row in rows])
+
+    def backfill_prompt_tags(self, should_stop=None, batch_size=500):
+        """
+        prompt_tags が古い版（または未作成）のレコードを batch_size 件ずつ作り直す。
+        1バッチごとに DB ロックを手放し、should_stop() が真になったら途中でやめる。作り直した件数を返す
+        """
+        total = 0
+        while not (should_stop and should_stop()):
+            with self.db_lock:
+                try:
+                    cursor = self.db_connection.cursor()
+                    rows = cursor.execute("SELECT file_path, meta FROM metadata_cache WHERE tags_version < ? LIMIT ?",
+                                          (TAGS_VERSION, batch_size)).fetchall()
+                    if not rows: break
+                    with perf.span("smart_tags.backfill"):
+                        self._rebuild_prompt_tags(cursor, rows)
+                    self.db_connection.commit()
+                except sqlite3.Error as e:
+                    logging.error(f"タグ索引の作成エラー: {e}")
+                    break
+            total += len(rows)
+        if total:
+            logging.info(f"タグ索引を作成しました: {total}件")
+        return total
+
+    def load_dir_snapshots(self, root, formats_key):
+        """root とその配下のディレクトリスナップショットを {dir_path: (mtime, ファイル名リスト, サブディレクトリ名リスト)} で返す"""
+        snapshots = {}
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.execute("SELECT dir_path, mtime, files, subdirs FROM dir_snapshot WHERE formats = ? AND (dir_path = ? OR dir_path LIKE ? ESCAPE '\\')",
+                               (formats_key, root, like_prefix(root)))
+                for row in cursor.fetchall():
+                    snapshots[row['dir_path']] = (row['mtime'], json.loads(row['files']), json.loads(row['subdirs']))
+            except (sqlite3.Error, ValueError) as e:
+                logging.error(f"ディレクトリスナップショット読込エラー: {root}, {e}")
+        return snapshots
+
+    def save_dir_snapshots(self, snapshots, formats_key, removed_dirs=()):
+        """ディレクトリスナップショットを保存し、消えたディレクトリのスナップショットを削除する"""
+        if not snapshots and not removed_dirs: return
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.executemany("INSERT OR REPLACE INTO dir_snapshot VALUES (?,?,?,?,?)",
+                                   [(dir_path, mtime, formats_key, json.dumps(files, ensure_ascii=False), json.dumps(subdirs, ensure_ascii=False))
+                                    for dir_path, (mtime, files, subdirs) in snapshots.items()])
+                cursor.executemany("DELETE FROM dir_snapshot WHERE dir_path = ?", [(d,) for d in removed_dirs])
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"ディレクトリスナップショット保存エラー: {e}")
+
+    def get_cached_thumbnail(self, file_path):
+        """最上位のサムネイルを返す（パックにあれば memoryview、なければDBの bytes）"""
+        if self.thumb_store is not None:
+            try:
+                levels = self.thumb_store.get_levels(file_path, os.path.getmtime(file_path))
+            except OSError:
+                return None
+            if levels:
+                return levels[max(levels)]
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.execute("SELECT thumbnail FROM metadata_cache WHERE file_path = ?", (file_path,))
+                row = cursor.fetchone()
+                return row['thumbnail'] if row else None
+            except sqlite3.Error as e:
+                logging.error(f"サムネイルキャッシュ読込エラー: {file_path}, {e}")
+                return None
+
+    def get_cached_thumbnails(self, file_paths, display_size):
+        """
+        各ファイルについて、保存済みのサムネイルの段のうち表示サイズに最も合うものを
+        {file_path: (段, WebP)} で返す（サムネイルがないファイルは含めない）
+        """
+        selected = {}
+        remaining = list(file_paths)
+        if self.thumb_store is not None:
+            # パックにあるものは mmap のスライスをそのまま渡す（DBのロックもコピーも不要）
+            remaining = []
+            for file_path in file_paths:
+                try:
+                    available = self.thumb_store.get_levels(file_path, os.path.getmtime(file_path))
+                except OSError:
+                    continue
+                if available:
+                    selected[file_path] = pick_level(available, display_size)
+                else:
+                    remaining.append(file_path)
+            if not remaining:
+                return selected
+
+        top_size = max(self.config.thumbnail_cache_size)
+        levels = {column: level for level, column in LEVEL_COLUMNS.items() if level < top_size}
+        levels[TOP_COLUMN] = top_size
+        migrated = []
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                for i in range(0, len(remaining), SQLITE_MAX_PARAMS):
+                    chunk = remaining[i:i + SQLITE_MAX_PARAMS]
+                    placeholders = ','.join('?' for _ in chunk)
+                    cursor.execute(f"SELECT file_path, mtime, {', '.join(levels)} FROM metadata_cache WHERE file_path IN ({placeholders})", chunk)
+                    for row in cursor.fetchall():
+                        available = {level: row[column] for column, level in levels.items() if row[column]}
+                        if available:
+                            selected[row['file_path']] = pick_level(available, display_size)
+                            migrated.extend((row['file_path'], row['mtime'], level, data) for level, data in available.items())
+            except sqlite3.Error as e:
+                logging.error(f"サムネイルキャッシュ一括読込エラー: {e}")
+        # 以前のバージョンでDBに保存したサムネイルはパックへ移しておく
+        if migrated and self.thumb_store is not None:
+            self.thumb_store.put_many(migrated)
+        return selected
+
+    def get_result_entries(self, file_paths):
+        """検索結果のソートに必要な (file_path, mtime, 解像度) のリストを返す"""
+        mtimes = {}
+        for file_path in file_paths:
+            try:
+                mtimes[file_path] = os.path.getmtime(file_path)
+            except OSError:
+                continue
+        in_memory = self.memory_cache.get_many(list(mtimes.items()))
+        rows = {key[0]: record for key, record in in_memory.items()}
+        remaining = [file_path for file_path in mtimes if file_path not in rows]
+        if remaining:
+            rows.update(self._get_many_from_db(remaining))
+        entries = []
+        for file_path, mtime in mtimes.items():
+            row = rows.get(file_path)
+            if row and row.get('width') and row.get('height'):
+                resolution = row['width'] * row['height']
+            else:
+                w, h = self._get_image_dimensions(file_path)
+                resolution = w * h
+            entries.append((file_path, mtime, resolution))
+        return entries
+
     def cache_thumbnail(self, file_path, thumbnail_bytes):
-        if not self.config.enable_thumbnail_caching: return
+        """thumbnail_bytes は最上位の WebP、またはピラミッドの段ごとの {段: WebP}"""
+        if not self.config.enable_thumbnail_caching or not thumbnail_bytes: return
+        top_size = max(self.config.thumbnail_cache_size)
+        levels = thumbnail_bytes if isinstance(thumbnail_bytes, dict) else {top_size: thumbnail_bytes}
+        if self.thumb_store is not None:
+            try:
+                mtime = os.path.getmtime(file_path)
+            except OSError:
+                return
+            try:
+                self.thumb_store.put_many((file_path, mtime, level, data) for level, data in levels.items())
+            except (OSError, ValueError) as e:
+                logging.error(f"サムネイルキャッシュ保存エラー: {file_path}, {e}")
+            return
+        assignments = {column_for(level, top_size): data for level, data in levels.items()}
         with self.db_lock:
             try:
                 cursor = self.db_connection.cursor()
-                cursor.execute("UPDATE metadata_cache SET thumbnail = ? WHERE file_path = ?", (thumbnail_bytes, file_path))
+                cursor.execute(f"UPDATE metadata_cache SET {', '.join(f'{column} = ?' for column in assignments)} WHERE file_path = ?",
+                               (*assignments.values(), file_path))
                 self.db_connection.commit()
             except sqlite3.Error as e:
                 logging.error(f"サムネイルキャッシュ保存エラー: {file_path}, {e}")
 
+    def delete_records(self, file_paths):
+        """削除されたファイルのレコードをまとめて削除する"""
+        if not file_paths: return
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.executemany("DELETE FROM metadata_cache WHERE file_path = ?", [(p,) for p in file_paths])
+                cursor.executemany("DELETE FROM prompt_tags WHERE file_path = ?", [(p,) for p in file_paths])
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"DB削除エラー: {e}")
+        removed = set(file_paths)
+        self.memory_cache.discard_if(lambda key: key[0] in removed)
+        if self.thumb_store is not None:
+            self.thumb_store.discard(removed)
+
+    def delete_records_under(self, dir_path):
+        """削除されたフォルダ配下のレコードとディレクトリスナップショットを削除する"""
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.execute("DELETE FROM metadata_cache WHERE file_path LIKE ? ESCAPE '\\'", (like_prefix(dir_path),))
+                cursor.execute("DELETE FROM prompt_tags WHERE file_path LIKE ? ESCAPE '\\'", (like_prefix(dir_path),))
+                cursor.execute("DELETE FROM dir_snapshot WHERE dir_path = ? OR dir_path LIKE ? ESCAPE '\\'", (dir_path, like_prefix(dir_path)))
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"DB削除エラー: {dir_path}, {e}")
+        self._forget_under(dir_path)
+        if self.thumb_store is not None:
+            self.thumb_store.discard_under(dir_path)
+
+    def rename_records(self, src_path, dest_path):
+        """
+        移動・名前変更されたファイル（またはフォルダ配下）のレコードを新しいパスへ付け替える。
+        mtime は移動では変わらないため、再解析せずにキャッシュをそのまま使える。
+        """
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.execute("UPDATE OR REPLACE metadata_cache SET file_path = ? WHERE file_path = ?", (dest_path, src_path))
+                cursor.execute("UPDATE OR REPLACE metadata_cache SET file_path = ? || substr(file_path, ?) WHERE file_path LIKE ? ESCAPE '\\'",
+                               (dest_path, len(src_path) + 1, like_prefix(src_path)))
+                cursor.execute("DELETE FROM prompt_tags WHERE file_path = ? OR file_path LIKE ? ESCAPE '\\'", (dest_path, like_prefix(dest_path)))
+                cursor.execute("UPDATE prompt_tags SET file_path = ? WHERE file_path = ?", (dest_path, src_path))
+                cursor.execute("UPDATE prompt_tags SET file_path = ? || substr(file_path, ?) WHERE file_path LIKE ? ESCAPE '\\'",
+                               (dest_path, len(src_path) + 1, like_prefix(src_path)))
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"DB更新エラー: {src_path} -> {dest_path}, {e}")
+        # メモリ上のレコードは file_path を含むため付け替えずに捨て、次回DBから読み直す
+        self.memory_cache.discard_if(lambda key: key[0] == src_path)
+        self._forget_under(src_path)
+        if self.thumb_store is not None:
+            self.thumb_store.rename(src_path, dest_path)
+
+    def _forget_under(self, dir_path):
+        """dir_path 配下のレコードをメモリキャッシュから削除する"""
+        prefix = dir_path.rstrip('\\/') + os.sep
+        self.memory_cache.discard_if(lambda key: key[0].startswith(prefix))
+
+    def get_stats(self):
+        """キャッシュDBの統計情報を返す"""
+        stats = {"db_path": os.path.abspath(self.db_path)}
+        with self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                cursor.execute("SELECT COUNT(*), COUNT(thumbnail), MIN(mtime), MAX(mtime) FROM metadata_cache")
+                stats["records"], stats["thumbnails"], stats["oldest_mtime"], stats["newest_mtime"] = cursor.fetchone()
+                cursor.execute("SELECT COUNT(*) FROM dir_snapshot")
+                stats["dir_snapshots"] = cursor.fetchone()[0]
+                cursor.execute("PRAGMA page_count")
+                page_count = cursor.fetchone()[0]
+                cursor.execute("PRAGMA page_size")
+                page_size = cursor.fetchone()[0]
+                cursor.execute("PRAGMA freelist_count")
+                stats["free_bytes"] = cursor.fetchone()[0] * page_size
+                stats["db_bytes"] = page_count * page_size
+            except sqlite3.Error as e:
+                logging.error(f"DB統計取得エラー: {e}")
+        stats["memory_cache"] = self.memory_cache.stats()
+        if self.thumb_store is not None:
+            stats["thumbnail_store"] = self.thumb_store.stats()
+        return stats
+
+    def prune_missing_records(self):
+        """ファイルが存在しなくなったレコードを削除し、削除件数を返す"""
+        with self.db_lock:
+            try:
+                paths = [row[0] for row in self.db_connection.execute("SELECT file_path FROM metadata_cache")]
+            except sqlite3.Error as e:
+                logging.error(f"DB読込エラー: {e}")
+                return 0
+        missing = [p for p in paths if not os.path.exists(p)]
+        self.delete_records(missing)
+        return len(missing)
+
+    def vacuum(self):
+        """WALをチェックポイントしてから VACUUM し、DBファイルの空き領域を解放する"""
+        with self.db_lock:
+            try:
+                self.db_connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self.db_connection.execute("VACUUM")
+            except sqlite3.Error as e:
+                logging.error(f"VACUUM 失敗: {e}")
+                return False
+        self.compact_thumb_store(force=True)
+        return True
+
+    def compact_thumb_store(self, force=False):
+        """
+        サムネイルストアの不要な領域が増えていれば詰め直す（force なら常に）。
+        設定と違う方式で保存されたサムネイルがあれば、詰め直すときに設定の方式へ符号化し直す
+        """
+        if self.thumb_store is None:
+            return False
+        codec, quality = self.config.thumbnail_codec, self.config.thumbnail_quality
+        foreign = self.thumb_store.count_entries(lambda data: codec_of(data) != codec)
+        if not force and not foreign and not self.thumb_store.needs_compaction(self.config.thumbnail_compact_ratio):
+            return False
+
+        broken = []
+        def transform(data):
+            try:
+                return recode(data, codec, quality)
+            except Exception:
+                broken.append(len(data))
+                return None
+
+        before = self.thumb_store.stats()["pack_bytes"]
+        with perf.span("thumb_store.compact"):
+            compacted = self.thumb_store.compact(transform if foreign else None)
+        if broken:
+            logging.warning(f"読み込めないサムネイルを破棄しました: {len(broken)}件")
+        if compacted:
+            logging.info(f"サムネイルストアを詰め直しました: {before:,} → {self.thumb_store.stats()['pack_bytes']:,} バイト"
+                         + (f"（{foreign}件を {codec} に変換）" if foreign else ""))
+        return compacted
+
     def _read_raw_metadata_from_disk(self, file_path):
-        ext = os.path.splitext(file_path)[1].lower()
-        try:
-            if ext in ('.jpg', '.jpeg', '.tiff'):
-                return self._extract_exif_text(file_path)
-            elif ext in ('.png', '.webp'):
-                return self._extract_png_text(file_path)
-        except Exception as e:
-            logging.warning(f"ディスク読込エラー: {file_path} -> {e}")
-        return ""
+        return read_image_metadata(file_path)[0]
 
     def _get_image_dimensions(self, file_path):
         try:
@@ -133,40 +718,18 @@ class ImageSearchModel:
             return (0, 0)
     
     def _filter_negative_prompt(self, raw_meta):
-        if not isinstance(raw_meta, str): return ""
-        text_parts = []
-        prompt_match = re.search(r'"prompt"\s*:\s*"([^"]*)"', raw_meta)
-        if prompt_match: text_parts.append(prompt_match.group(1))
-        a1111_match = re.search(r'^(.*?)\nNegative prompt: ', raw_meta, re.DOTALL)
-        if a1111_match: text_parts.append(a1111_match.group(1).strip())
-        base_match = re.search(r'"base_caption"\s*:\s*"([^"]*)"', raw_meta, re.IGNORECASE | re.DOTALL)
-        if base_match: text_parts.append(base_match.group(1))
-        char_captions = self._extract_char_captions_from_meta(raw_meta)
-        text_parts.extend(char_captions)
-        return " ".join(filter(None, text_parts)).strip()
+        return filter_negative_prompt(raw_meta)
     
     def get_resolution(self, file_path):
-        db_data = self._get_from_db(file_path)
+        db_data = self._get_known_record(file_path)
         if db_data and db_data.get('width') and db_data.get('height'):
             return db_data['width'] * db_data['height']
         w, h = self._get_image_dimensions(file_path)
         return w * h
 
-    def _extract_exif_text(self, file_path):
-        try:
-            with open(file_path, 'rb') as f:
-                return "\n".join(str(v) for v in exifread.process_file(f, details=False, stop_tag='JPEGThumbnail').values())
-        except Exception:
-            return ""
-    
-    def _extract_png_text(self, file_path):
-        try:
-            with Image.open(file_path) as img:
-                return "\n".join(str(v) for v in img.info.values())
-        except Exception:
-            return ""
-    
     def close(self):
+        if self.thumb_store is not None:
+            self.thumb_store.close()
         if self.db_connection:
             self.db_connection.close()
     
@@ -226,31 +789,7 @@ class ImageSearchModel:
             return False
 
     def extract_json_block(self, text, start_key):
-        if not isinstance(text, str): return None
-        start_index = text.find(start_key)
-        if start_index == -1: return None
-        first_brace = text.find('{', start_index)
-        if first_brace == -1: return None
-        stack, in_string, escape, end_index = [], False, False, None
-        for i in range(first_brace, len(text)):
-            char = text[i]
-            if char == '"' and not escape:
-                in_string = not in_string
-            if char == '\\' and not escape:
-                escape = True
-            else:
-                escape = False
-            if not in_string:
-                if char == '{':
-                    stack.append('{')
-                elif char == '}':
-                    if stack:
-                        stack.pop()
-                        if not stack:
-                            end_index = i + 1
-                            break
-        if end_index is None: return None
-        return re.sub(r',\s*([}\]])', r'\1', text[first_brace:end_index])
+        return extract_json_block(text, start_key)
         
     def apply_sort(self, file_list, mode):
         reverse = "降順" in mode
@@ -334,51 +873,90 @@ class ImageSearchModel:
 
     def _extract_char_captions_from_meta(self, meta_text):
         """メタデータ文字列からキャラクタープロンプトのリストを抽出する"""
-        json_str = self.extract_json_block(meta_text, '"v4_prompt"')
-        if json_str:
-            try:
-                return [c.get("char_caption", "") for c in json.loads(json_str).get("caption", {}).get("char_captions", [])]
-            except json.JSONDecodeError:
-                pass
-        return []
+        return extract_char_captions(meta_text)
 
     def get_char_captions(self, file_path):
         """ファイルパスからキャラクタープロンプトのリストを取得する"""
         meta_text = self.get_raw_metadata(file_path)
         return self._extract_char_captions_from_meta(meta_text)
 
-    def get_top_tags_from_files(self, file_paths, exclude_keywords=None, limit=20):
+    def count_prompt_tags(self, file_paths):
         """
-        指定されたファイルパスのリストから、キャラクタープロンプト内の頻出タグを抽出する。
+        file_paths のスマートタグの出現回数を Counter で返す。
+        パスは一時テーブルに入れて prompt_tags と結合し、GROUP BY で数える（IN 句のパラメータ数の上限に縛られない）。
+        prompt_tags が古い版のレコードは、ここで作り直してから数える。
         """
+        counts = collections.Counter()
         if not file_paths:
-            return []
+            return counts
+        with perf.span("smart_tags.count"), self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                self._fill_scope(cursor, file_paths)
+                cursor.execute("SELECT t.tag, SUM(t.count) FROM result_scope s JOIN prompt_tags t ON t.file_path = s.file_path GROUP BY t.tag")
+                counts.update(dict(cursor.fetchall()))
+                cursor.execute("DELETE FROM result_scope")
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"スマートタグの集計エラー: {e}")
+                self.db_connection.rollback()
+        return counts
 
-        if exclude_keywords is None:
-            exclude_keywords = set()
-        else:
-            exclude_keywords = {kw.lower() for kw in re.split(r'[, ]+', exclude_keywords) if kw}
+    def _fill_scope(self, cursor, file_paths):
+        """
+        検索結果のパスを一時テーブル result_scope に入れる（呼び出し側で db_lock を取り、後で空にする）。
+        meta から作る索引が古い版のレコードは、ここで作り直しておく
+        """
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS result_scope (file_path TEXT PRIMARY KEY) WITHOUT ROWID")
+        cursor.execute("DELETE FROM result_scope")
+        cursor.executemany("INSERT OR IGNORE INTO result_scope (file_path) VALUES (?)", ((p,) for p in file_paths))
+        stale = cursor.execute("SELECT m.file_path, m.meta FROM result_scope s JOIN metadata_cache m ON m.file_path = s.file_path "
+                               "WHERE m.tags_version < ?", (TAGS_VERSION,)).fetchall()
+        if stale:
+            self._rebuild_prompt_tags(cursor, stale)
 
-        tag_counter = collections.Counter()
-        
-        placeholders = ','.join('?' for _ in file_paths)
-        query = f"SELECT meta FROM metadata_cache WHERE file_path IN ({placeholders})"
+    def get_facet_counts(self, file_paths, limit=8):
+        """file_paths の内訳を {ファセット: [(値, 件数)]} で返す（更新月は新しい順に MONTH_LIMIT 件、ほかは件数の多い順に limit 件）"""
+        facets = {}
+        if not file_paths:
+            return facets
+        with perf.span("facets.count"), self.db_lock:
+            try:
+                cursor = self.db_connection.cursor()
+                self._fill_scope(cursor, file_paths)
+                for facet in FACETS:
+                    cursor.execute(f"SELECT {group_sql(facet)} AS value, COUNT(*) AS count FROM result_scope s "
+                                   f"JOIN metadata_cache m ON m.file_path = s.file_path GROUP BY value "
+                                   f"ORDER BY {order_sql(facet)} LIMIT ?", (MONTH_LIMIT if facet == "month" else limit,))
+                    facets[facet] = [(row[0] or "", row[1]) for row in cursor.fetchall()]
+                cursor.execute("DELETE FROM result_scope")
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"結果の内訳の集計エラー: {e}")
+                self.db_connection.rollback()
+                return {}
+        return facets
 
-        try:
-            with self.db_lock:
+    def filter_by_facet(self, file_paths, facet, value):
+        """file_paths のうち、facet が value のものを set で返す"""
+        if not file_paths:
+            return set()
+        where, params = filter_sql(facet, value)
+        with perf.span("facets.filter"), self.db_lock:
+            try:
                 cursor = self.db_connection.cursor()
-                cursor.execute(query, file_paths)
-                for row in cursor.fetchall():
-                    meta_text = row['meta']
-                    if not meta_text: continue
-                    
-                    char_captions = self._extract_char_captions_from_meta(meta_text)
-                    for caption in char_captions:
-                        tags = [tag.strip() for tag in caption.split(',') if tag.strip()]
-                        valid_tags = [t for t in tags if t.lower() not in exclude_keywords and len(t) > 1]
-                        tag_counter.update(valid_tags)
-        except sqlite3.Error as e:
-            logging.error(f"スマートタグ用のメタデータ取得エラー: {e}")
-            return []
+                self._fill_scope(cursor, file_paths)
+                cursor.execute(f"SELECT m.file_path FROM result_scope s JOIN metadata_cache m ON m.file_path = s.file_path "
+                               f"WHERE {where}", params)
+                matched = {row[0] for row in cursor.fetchall()}
+                cursor.execute("DELETE FROM result_scope")
+                self.db_connection.commit()
+            except sqlite3.Error as e:
+                logging.error(f"結果の絞り込みエラー: {e}")
+                self.db_connection.rollback()
+                return set(file_paths)
+        return matched
 
-        return tag_counter.most_common(limit)
\ No newline at end of file
+    def get_top_tags_from_files(self, file_paths, exclude_keywords=None, limit=20):
+        """指定されたファイルパスのリストから、キャラクタープロンプト内の頻出タグを [(タグ, 回数)] で返す"""
+        return rank_tags(self.count_prompt_tags(file_paths), exclude_keywords, limit)
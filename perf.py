@@ -0,0 +1,143 @@
+import json
+import time
+import threading
+
+class _NullSpan:
+    """計測無効時に返す何もしないスパン"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'started')
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.add(self.name, time.perf_counter() - self.started)
+        return False
+
+class PerfRecorder:
+    """
+    処理時間（スパン）と回数（カウンタ）を名前ごとに集計する。
+    無効時は span() が共有の空スパンを返し、count() もすぐ戻るため、ホットパスに置いたままでよい。
+    スパンは [回数, 合計秒, 最大秒] で保持する。
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._started = time.time()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name, seconds):
+        with self._lock:
+            stat = self._spans.get(name)
+            if stat is None:
+                self._spans[name] = [1, seconds, seconds]
+            else:
+                stat[0] += 1
+                stat[1] += seconds
+                if seconds > stat[2]: stat[2] = seconds
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def export_spans(self):
+        """別プロセスから親へ渡すための集計値（merge() で取り込む）"""
+        with self._lock:
+            return {name: list(stat) for name, stat in self._spans.items()}
+
+    def merge(self, spans):
+        with self._lock:
+            for name, (count, total, peak) in spans.items():
+                stat = self._spans.get(name)
+                if stat is None:
+                    self._spans[name] = [count, total, peak]
+                else:
+                    stat[0] += count
+                    stat[1] += total
+                    stat[2] = max(stat[2], peak)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._started = time.time()
+
+    def snapshot(self):
+        """現在の集計を辞書で返す（ミリ秒単位。ヒット率は *.hit / *.miss の組から計算する）"""
+        with self._lock:
+            spans = {name: {"count": c, "total_ms": t * 1000, "avg_ms": t * 1000 / c if c else 0.0, "max_ms": m * 1000}
+                     for name, (c, t, m) in sorted(self._spans.items())}
+            counters = dict(sorted(self._counters.items()))
+        hit_rates = {}
+        for name, hits in counters.items():
+            if not name.endswith(".hit"): continue
+            base = name[:-len(".hit")]
+            total = hits + counters.get(base + ".miss", 0)
+            hit_rates[base] = hits / total if total else 0.0
+        return {"enabled": self.enabled, "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started)),
+                "spans": spans, "counters": counters, "hit_rates": hit_rates}
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+# アプリ全体で共有する計測器（AppConfig.enable_perf_stats または統計ダイアログで有効にする）
+perf = PerfRecorder()
+
+class InstrumentedLock:
+    """
+    threading.Lock の代わりに使い、計測有効時は「<name>.lock_wait」（取得待ち）と
+    「<name>.lock_hold」（保持時間）を記録する。無効時はそのまま Lock に委譲する。
+    """
+    def __init__(self, name, recorder=perf):
+        self._lock = threading.Lock()
+        self._recorder = recorder
+        self._wait_name = f"{name}.lock_wait"
+        self._hold_name = f"{name}.lock_hold"
+        self._acquired_at = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._recorder.enabled:
+            return self._lock.acquire(blocking, timeout)
+        started = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            self._acquired_at = time.perf_counter()
+            self._recorder.add(self._wait_name, self._acquired_at - started)
+        return acquired
+
+    def release(self):
+        acquired_at, self._acquired_at = self._acquired_at, None
+        self._lock.release()
+        if acquired_at is not None:
+            self._recorder.add(self._hold_name, time.perf_counter() - acquired_at)
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
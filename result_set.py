@@ -0,0 +1,104 @@
+import os
+import bisect
+import itertools
+
+class SortedResultSet:
+    """
+    検索結果を、アクティブなソートキーで常に整列した状態で保持する。
+    結果が届くたびに全件を並べ替えるのではなく、bisect で挿入位置を求めて差し込む。
+    各エントリは (file_path, mtime, resolution) で、ソートに必要な値を結果と一緒に受け取る。
+    """
+    def __init__(self, mode="更新日時降順"):
+        self._entries = {}
+        self._keys = []
+        self._seq = itertools.count()
+        self._order = {}
+        self.mode = None
+        self.reverse = False
+        self.set_mode(mode)
+
+    def _sort_key(self, file_path):
+        mtime, resolution = self._entries[file_path]
+        if "ファイル名" in self.mode:
+            key = os.path.basename(file_path).lower()
+        elif "更新日時" in self.mode:
+            key = mtime
+        elif "解像度" in self.mode:
+            key = resolution
+        else:
+            key = self._order[file_path]
+        return (key, file_path)
+
+    def set_mode(self, mode):
+        """ソートモードを変更する。変更がなければ何もしない"""
+        if mode == self.mode: return False
+        self.mode = mode
+        self.reverse = "降順" in mode
+        self._keys = sorted(self._sort_key(path) for path in self._entries)
+        return True
+
+    def _to_display_index(self, sorted_index):
+        return len(self._keys) - 1 - sorted_index if self.reverse else sorted_index
+
+    def add_many(self, entries):
+        """
+        エントリをまとめて挿入する。
+        戻り値: 挿入されたエントリのうち最も前に表示される位置（挿入がなければ None）
+        """
+        inserted_keys = []
+        for file_path, mtime, resolution in entries:
+            if file_path in self._entries: continue
+            self._entries[file_path] = (mtime or 0, resolution or 0)
+            self._order[file_path] = next(self._seq)
+            key = self._sort_key(file_path)
+            bisect.insort(self._keys, key)
+            inserted_keys.append(key)
+        if not inserted_keys: return None
+        # 全件挿入後の位置で判定する（途中の挿入で前のエントリの位置がずれるため）
+        return min(self._to_display_index(bisect.bisect_left(self._keys, key)) for key in inserted_keys)
+
+    def remove_many(self, file_paths):
+        """エントリを削除する。戻り値: 削除されたエントリのうち最も前に表示されていた位置（なければ None）"""
+        first_index = None
+        for file_path in file_paths:
+            if file_path not in self._entries: continue
+            key = self._sort_key(file_path)
+            sorted_index = bisect.bisect_left(self._keys, key)
+            display_index = self._to_display_index(sorted_index)
+            first_index = display_index if first_index is None else min(first_index, display_index)
+            del self._keys[sorted_index]
+            del self._entries[file_path]
+            del self._order[file_path]
+        return first_index
+
+    def reset(self, entries):
+        self.clear()
+        self.add_many(entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._order.clear()
+        self._keys = []
+
+    def page(self, start, end):
+        """表示順で [start, end) の範囲のファイルパスを返す"""
+        start, end = max(0, start), min(len(self._keys), end)
+        if start >= end: return []
+        if self.reverse:
+            n = len(self._keys)
+            return [self._keys[i][1] for i in range(n - 1 - start, n - 1 - end, -1)]
+        return [key[1] for key in self._keys[start:end]]
+
+    def paths(self):
+        """全結果を表示順で返す"""
+        return self.page(0, len(self._keys))
+
+    def entries(self, file_paths):
+        """file_paths のうち結果にあるものを add_many() に渡せる (file_path, mtime, resolution) のリストで返す"""
+        return [(file_path, *self._entries[file_path]) for file_path in file_paths if file_path in self._entries]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, file_path):
+        return file_path in self._entries
@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from perf import perf
+
+def make_suffix_set(formats):
+    """拡張子判定用の集合を作る（例: ('.jpg', '.PNG') -> {'.jpg', '.png'}）"""
+    return frozenset(f.lower() for f in formats)
+
+def has_suffix(name, suffixes):
+    """os.path.splitext を使わずに拡張子を判定する。'.png' のような隠しファイル名は対象外"""
+    dot = name.rfind('.')
+    return dot > 0 and name[dot:].lower() in suffixes
+
+def snapshot_formats_key(suffixes):
+    """ディレクトリスナップショットを対象拡張子ごとに区別するためのキー"""
+    return ",".join(sorted(suffixes))
+
+def scan_directory(path, suffixes):
+    """1ディレクトリを列挙し、(対象ファイルの DirEntry リスト, サブディレクトリのパスリスト) を返す"""
+    files, subdirs = [], []
+    with perf.span("scan.list_dir"), os.scandir(path) as it:
+        for entry in it:
+            try:
+                # 対象拡張子で終わる名前のフォルダもあるため、フォルダかどうかを先に調べる
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif has_suffix(entry.name, suffixes) and entry.is_file():
+                    files.append(entry)
+            except OSError:
+                continue
+    return files, subdirs
+
+class SnapshotEntry:
+    """スナップショットから復元したファイルエントリ。DirEntry と同じ path / name / stat() を持つ"""
+    __slots__ = ('path', 'name', '_stat')
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_file(self):
+        return True
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"<SnapshotEntry {self.name!r}>"
+
+class DirectorySnapshot:
+    """
+    ディレクトリごとの (mtime, 対象ファイル名, サブディレクトリ名) をキャッシュDBに保持し、
+    mtime が変わっていないディレクトリは再列挙せずに前回の一覧を使う。
+    ディレクトリの mtime は直下のエントリの追加・削除・名前変更でしか変わらないため、
+    変化のない深いツリーはディレクトリ1つにつき stat 1回で済む。
+    """
+    # 列挙直後に同じ mtime のまま変更される可能性があるため、更新直後のディレクトリは記録しない
+    SETTLE_SECONDS = 2.0
+
+    def __init__(self, store, root, suffixes):
+        self.store = store
+        self.root = root
+        self.formats_key = snapshot_formats_key(suffixes)
+        self._known = store.load_dir_snapshots(root, self.formats_key)
+        self._updates = {}
+        self._visited = set()
+        self._lock = threading.Lock()
+
+    def scan(self, path, suffixes):
+        """scan_directory と同じ戻り値を、可能ならスナップショットから返す"""
+        dir_mtime = os.stat(path).st_mtime
+        with self._lock:
+            self._visited.add(path)
+        known = self._known.get(path)
+        if known and known[0] == dir_mtime:
+            perf.count("dir_snapshot.hit")
+            _, file_names, subdir_names = known
+            return ([SnapshotEntry(os.path.join(path, name), name) for name in file_names],
+                    [os.path.join(path, name) for name in subdir_names])
+
+        perf.count("dir_snapshot.miss")
+        files, subdirs = scan_directory(path, suffixes)
+        if time.time() - dir_mtime >= self.SETTLE_SECONDS:
+            with self._lock:
+                self._updates[path] = (dir_mtime, [e.name for e in files], [os.path.basename(d) for d in subdirs])
+        return files, subdirs
+
+    def save(self, complete):
+        """変化したディレクトリを保存する。complete=True（最後まで走査した）ときは消えたディレクトリも削除する"""
+        with self._lock:
+            updates, self._updates = self._updates, {}
+            removed = [d for d in self._known if d not in self._visited] if complete else []
+        self.store.save_dir_snapshots(updates, self.formats_key, removed)
+
+def iter_image_entries(root, suffixes, recursive=True, cancel_event=None, max_workers=4, snapshot=None):
+    """
+    root 以下の対象画像を DirEntry として逐次返すジェネレータ。
+    サブディレクトリの列挙は小さなスレッドプールで並列に行い、列挙が終わったディレクトリから順に返すため、
+    ツリー全体の列挙を待たずに後段の処理を始められる。DirEntry の stat 結果はキャッシュされる（Windowsでは列挙時に取得済み）。
+    snapshot (DirectorySnapshot) を渡すと、変化のないディレクトリは前回の一覧を再利用する。
+    root 自体にアクセスできない場合は OSError を送出し、配下のディレクトリのエラーはログに残して読み飛ばす。
+    """
+    scan = snapshot.scan if snapshot is not None else scan_directory
+    complete = False
+    try:
+        if recursive:
+            yield from _iter_recursive(root, suffixes, scan, cancel_event, max_workers)
+        else:
+            files, _ = scan(root, suffixes)
+            for entry in files:
+                if cancel_event is not None and cancel_event.is_set(): return
+                yield entry
+        complete = recursive and not (cancel_event is not None and cancel_event.is_set())
+    finally:
+        if snapshot is not None:
+            snapshot.save(complete)
+
+def _iter_recursive(root, suffixes, scan, cancel_event, max_workers):
+    max_workers = max(1, max_workers)
+    max_pending = max_workers * 4
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan")
+    waiting_dirs = collections.deque()
+    pending = {executor.submit(scan, root, suffixes): root}
+    try:
+        while pending or waiting_dirs:
+            # 先読みしすぎないよう、列挙中のディレクトリ数を制限する
+            while waiting_dirs and len(pending) < max_pending:
+                next_dir = waiting_dirs.popleft()
+                pending[executor.submit(scan, next_dir, suffixes)] = next_dir
+            if cancel_event is not None and cancel_event.is_set(): return
+            done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_path = pending.pop(future)
+                try:
+                    files, subdirs = future.result()
+                except OSError as e:
+                    if dir_path == root: raise
+                    logging.warning(f"ディレクトリの列挙に失敗: {dir_path} -> {e}")
+                    continue
+                waiting_dirs.extend(subdirs)
+                for entry in files:
+                    yield entry
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,131 @@
+import enum
+import threading
+import collections
+from concurrent.futures import Future
+
+class Priority(enum.IntEnum):
+    """値が小さいほど先に実行される"""
+    VISIBLE_THUMB = 0  # 表示中のサムネイル
+    VIEWER = 1         # ビューアで表示中の画像と、その前後の先読み
+    SEARCH = 2         # 前景の検索・監視での取り込み
+    PREFETCH = 3       # スクロール先のサムネイル先読み
+    INDEX = 4          # バックグラウンドインデックス作成
+
+class _Task:
+    __slots__ = ('future', 'fn', 'args', 'kwargs')
+
+    def __init__(self, future, fn, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+class PriorityScheduler:
+    """
+    検索・サムネイル・先読み・インデックス作成で共有するワーカープール。
+    - 空いたワーカーは常に優先度の高いクラスのタスクから取り出す
+    - 同じクラスの中では group ごとに順番に取り出す（1つの依頼元が大量に投入しても他を待たせない）
+    - new_generation() でそのクラスの未実行タスクをまとめてキャンセルできる（ページ移動時など）。
+      依頼元ごとに取り消すときは cancel_group() を使う（同じクラスの他の依頼元のタスクは残る）
+    - reserved_workers 本のワーカーは VISIBLE_THUMB 専用で、重い検索チャンクが全ワーカーを占有していても
+      表示中のサムネイルはすぐに処理される
+    submit() は concurrent.futures.Future を返すので、ThreadPoolExecutor と同じように扱える。
+    """
+    def __init__(self, max_workers, reserved_workers=1, name="worker"):
+        self._cond = threading.Condition()
+        # クラスごとに group -> タスクのキュー。OrderedDict の並び順がラウンドロビンの順番になる
+        self._queues = [collections.OrderedDict() for _ in Priority]
+        self._generations = [0] * len(Priority)
+        self._shutdown = False
+        self._threads = []
+        for i in range(max(1, max_workers)):
+            self._start_worker(f"{name}-{i}", max(Priority))
+        for i in range(max(0, reserved_workers)):
+            self._start_worker(f"{name}-ui-{i}", Priority.VISIBLE_THUMB)
+
+    def _start_worker(self, thread_name, max_priority):
+        thread = threading.Thread(target=self._worker, args=(max_priority,), daemon=True, name=thread_name)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, priority, fn, *args, group=None, **kwargs):
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            queue = self._queues[priority]
+            if group not in queue:
+                queue[group] = collections.deque()
+            queue[group].append(_Task(future, fn, args, kwargs))
+            self._cond.notify_all()
+        return future
+
+    def new_generation(self, priority):
+        """priority クラスの世代を進め、それまでに投入された未実行タスクをキャンセルする。新しい世代番号を返す"""
+        with self._cond:
+            self._generations[priority] += 1
+            stale = [task for tasks in self._queues[priority].values() for task in tasks]
+            self._queues[priority].clear()
+            generation = self._generations[priority]
+        for task in stale:
+            task.future.cancel()
+        return generation
+
+    def cancel_group(self, priority, group):
+        """priority クラスの group の未実行タスクだけをキャンセルする（世代は進めない）。キャンセルした件数を返す"""
+        with self._cond:
+            stale = self._queues[priority].pop(group, ())
+        for task in stale:
+            task.future.cancel()
+        return len(stale)
+
+    def pending_count(self, priority=None):
+        with self._cond:
+            queues = self._queues if priority is None else [self._queues[priority]]
+            return sum(len(tasks) for queue in queues for tasks in queue.values())
+
+    def _pop(self, max_priority):
+        for priority in range(max_priority + 1):
+            queue = self._queues[priority]
+            if not queue: continue
+            group, tasks = next(iter(queue.items()))
+            task = tasks.popleft()
+            if tasks:
+                queue.move_to_end(group)
+            else:
+                del queue[group]
+            return task
+        return None
+
+    def _worker(self, max_priority):
+        while True:
+            with self._cond:
+                task = self._pop(max_priority)
+                while task is None and not self._shutdown:
+                    self._cond.wait()
+                    task = self._pop(max_priority)
+            if task is None:
+                return
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = task.fn(*task.args, **task.kwargs)
+            except BaseException as e:
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+
+    def shutdown(self, wait=False, cancel_futures=True):
+        with self._cond:
+            self._shutdown = True
+            stale = []
+            if cancel_futures:
+                for queue in self._queues:
+                    stale.extend(task for tasks in queue.values() for task in tasks)
+                    queue.clear()
+            self._cond.notify_all()
+        for task in stale:
+            task.future.cancel()
+        if wait:
+            for thread in self._threads:
+                thread.join()
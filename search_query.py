@@ -0,0 +1,32 @@
+class CompiledQuery:
+    """
+    検索条件を一度だけ前処理（小文字化・トークン分割）しておき、レコードごとの判定を軽くする。
+    Tkの変数には触れないため、ワーカースレッドや監視スレッドからそのまま呼び出せる。
+    """
+    def __init__(self, keyword, match_type="partial", and_search=True, include_negative=False):
+        self.keyword = keyword
+        self.match_type = match_type
+        self.and_search = and_search
+        self.include_negative = include_negative
+        self._keyword_lower = keyword.lower()
+        self._tokens = [token.lower() for token in keyword.split()]
+
+    def matches_text(self, text):
+        if not text:
+            return False
+        if not self._tokens:
+            return True
+        text_lower = text.lower()
+        if self.match_type == "exact":
+            return self._keyword_lower == text_lower
+        if self.and_search:
+            return all(token in text_lower for token in self._tokens)
+        return any(token in text_lower for token in self._tokens)
+
+    def __call__(self, record):
+        """メタデータレコード（dict）が条件に一致するか判定する"""
+        return self.matches_text(record.get('meta') if self.include_negative else record.get('meta_no_neg'))
+
+def compile_query(params):
+    """get_search_parameters() 形式の辞書から CompiledQuery を作る"""
+    return CompiledQuery(params["keyword"], params["match_type"], params["and_search"], params.get("include_negative", False))
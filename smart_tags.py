@@ -0,0 +1,57 @@
+import logging
+import threading
+import collections
+
+from model import ImageSearchModel, rank_tags
+from scheduler import Priority, PriorityScheduler
+
+class SmartTagAggregator:
+    """
+    検索結果のスマートタグを、結果が届くたびにワーカーで数えて足し込む。
+    - add() は UI スレッドから呼ぶ。届いた分だけを prompt_tags から数えるので、検索の終了を待たずに表示を更新できる
+    - 集計が終わるたびに on_update(generation, update, [(タグ, 回数)]) を呼ぶ（ワーカースレッドから、ロックの外で呼ばれる）。
+      update は世代内の通し番号で、届く順番が前後したときは大きい方が新しい累計
+    - reset() で世代を進めると、それより前に投入された集計の結果は捨てる
+    """
+    def __init__(self, model: ImageSearchModel, scheduler: PriorityScheduler, on_update, limit=20):
+        self.model = model
+        self.scheduler = scheduler
+        self.on_update = on_update
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self._exclude_keywords = None
+        self._active = False
+        self._updates = 0
+        self.generation = 0
+
+    def reset(self, exclude_keywords=None, active=True):
+        """新しい検索の集計を始める（active が偽なら集計しない）。新しい世代番号を返す"""
+        with self._lock:
+            self.generation += 1
+            self._counts.clear()
+            self._exclude_keywords = exclude_keywords
+            self._active = active
+            self._updates = 0
+            return self.generation
+
+    def add(self, file_paths):
+        if not self._active or not file_paths: return
+        self.scheduler.submit(Priority.SEARCH, self._count, self.generation, list(file_paths), group="smart_tags")
+
+    def _count(self, generation, file_paths):
+        if generation != self.generation: return
+        try:
+            counts = self.model.count_prompt_tags(file_paths)
+        except Exception:
+            logging.error("スマートタグの集計中にエラーが発生しました", exc_info=True)
+            return
+        with self._lock:
+            if generation != self.generation: return
+            self._counts.update(counts)
+            tags = rank_tags(self._counts, self._exclude_keywords, self.limit)
+            self._updates += 1
+            update = self._updates
+        # 通知は UI スレッドの応答を待つことがあるため、ロックを手放してから送る（reset() と待ち合って止まらないように）。
+        # 前後して届いても、UI 側で古い世代と古い通し番号を捨てる
+        self.on_update(generation, update, tags)
@@ -0,0 +1,178 @@
+"""
+サムネイルのピラミッド（複数解像度）とその符号化。
+
+最上位（AppConfig.thumbnail_cache_size）に加えて、それより小さい 128px・256px の段も保存する。
+表示サイズ以上で最も小さい段から縮小すれば、サムネイルサイズを変えても元画像をデコードし直さずに済む。
+
+符号化方式（AppConfig.thumbnail_codec）:
+  webp  小さいが符号化・復号が遅い
+  jpeg  Pillow の libjpeg（libjpeg-turbo）で、WebP より速い
+  raw   無圧縮の RGB。最も速いが大きい
+  zlib  RGB を zlib（レベル1）で圧縮したもの
+保存したデータは先頭のマジックで方式がわかるため、方式を変えても古いキャッシュはそのまま読める。
+"""
+import io
+import zlib
+import struct
+from PIL import Image
+
+try:
+    LANCZOS_RESAMPLING = Image.Resampling.LANCZOS
+    BILINEAR_RESAMPLING = Image.Resampling.BILINEAR
+    _Transpose = Image.Transpose
+except AttributeError:
+    LANCZOS_RESAMPLING = Image.LANCZOS
+    BILINEAR_RESAMPLING = Image.BILINEAR
+    _Transpose = Image
+
+# EXIF の Orientation と、正しい向きに戻すための変換（ImageOps.exif_transpose と同じ対応）
+EXIF_ORIENTATION = 0x0112
+_ORIENTATION_TRANSPOSE = {
+    2: _Transpose.FLIP_LEFT_RIGHT, 3: _Transpose.ROTATE_180, 4: _Transpose.FLIP_TOP_BOTTOM,
+    5: _Transpose.TRANSPOSE, 6: _Transpose.ROTATE_270, 7: _Transpose.TRANSVERSE, 8: _Transpose.ROTATE_90,
+}
+# 最終的な LANCZOS の前に、目標の何倍までは粗い縮小（draft / reduce）で済ませるか
+REDUCING_GAP = 2.0
+
+# 最上位より小さい段と、その保存先の列
+LEVEL_COLUMNS = {128: "thumb_128", 256: "thumb_256"}
+TOP_COLUMN = "thumbnail"
+THUMBNAIL_COLUMNS = frozenset((TOP_COLUMN, *LEVEL_COLUMNS.values()))
+DEFAULT_QUALITY = 85
+
+CODECS = ("webp", "jpeg", "raw", "zlib")
+_RAW_MAGIC = b"RGB0"
+_ZLIB_MAGIC = b"RGBZ"
+_RGB_HEADER = struct.Struct("<4sHH")  # マジック, 幅, 高さ
+
+def pyramid_levels(top_size):
+    """段の一覧（昇順）。最上位より小さい段だけを使う"""
+    return [level for level in LEVEL_COLUMNS if level < top_size] + [top_size]
+
+def level_for(display_size, top_size):
+    """表示サイズ以上で最も小さい段（なければ最上位）"""
+    for level in pyramid_levels(top_size):
+        if level >= display_size:
+            return level
+    return top_size
+
+def column_for(level, top_size):
+    return TOP_COLUMN if level >= top_size else LEVEL_COLUMNS[level]
+
+def pick_level(available, display_size):
+    """{段: データ} から、表示サイズ以上で最も小さい段を選ぶ。なければ最も大きい段。(段, データ) を返す"""
+    if not available:
+        return None
+    larger = [level for level in available if level >= display_size]
+    level = min(larger) if larger else max(available)
+    return level, available[level]
+
+def load_source(file_path, top_box):
+    """
+    元画像を最上位の大きさ（top_box に収まる大きさ）まで縮小してデコードし、向きを補正した RGB 画像を返す。
+    JPEG は draft で DCT 領域のまま縮小してからデコードし、それ以外は reduce で整数分の1にしてから
+    LANCZOS で仕上げる。向きの補正は縮小後の小さい画像に対して行う。
+    """
+    with Image.open(file_path) as source:
+        img = source
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        # 90度回転する向きでは、回転前の画像に対する枠の縦横が入れ替わる
+        box = (top_box[1], top_box[0]) if orientation in (5, 6, 7, 8) else tuple(top_box)
+        scale = min(box[0] / img.width, box[1] / img.height, 1.0)
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+
+        if img.format == 'JPEG' and scale < 1:
+            img.draft('RGB', (int(size[0] * REDUCING_GAP), int(size[1] * REDUCING_GAP)))
+        if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGBA' if 'transparency' in img.info or 'A' in img.getbands() else 'RGB')
+        factor = int(min(img.width / size[0], img.height / size[1]) / REDUCING_GAP)
+        if factor > 1:
+            img = img.reduce(factor)
+        if img.size != size:
+            img = img.resize(size, LANCZOS_RESAMPLING)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        transpose = _ORIENTATION_TRANSPOSE.get(orientation)
+        if transpose is not None:
+            img = img.transpose(transpose)
+        # 縮小も変換もしていなければ、ファイルを閉じる前に読み込んでおく
+        return img.copy() if img is source else img
+
+def build_pyramid(top_img, top_size):
+    """最上位の画像から各段を作り {段: 画像} で返す。小さい段は1つ上の段から縮小する"""
+    images = {top_size: top_img}
+    current = top_img
+    for level in reversed(pyramid_levels(top_size)[:-1]):
+        current = current.copy()
+        current.thumbnail((level, level), LANCZOS_RESAMPLING)
+        images[level] = current
+    return images
+
+def reduce_to(img, level):
+    reduced = img.copy()
+    reduced.thumbnail((level, level), LANCZOS_RESAMPLING)
+    return reduced
+
+def encode(img, codec="webp", quality=DEFAULT_QUALITY):
+    """RGB 画像を指定した方式で符号化する"""
+    if codec in ("raw", "zlib"):
+        pixels = img.tobytes()
+        if codec == "zlib":
+            return _RGB_HEADER.pack(_ZLIB_MAGIC, img.width, img.height) + zlib.compress(pixels, 1)
+        return _RGB_HEADER.pack(_RAW_MAGIC, img.width, img.height) + pixels
+    buffer = io.BytesIO()
+    if codec == "jpeg":
+        img.save(buffer, format="JPEG", quality=quality)
+    elif codec == "webp":
+        img.save(buffer, format="WEBP", quality=quality)
+    else:
+        raise ValueError(f"未対応のサムネイル形式です: {codec}")
+    return buffer.getvalue()
+
+def codec_of(data):
+    """符号化済みデータの方式（先頭のマジックで判定する）"""
+    head = bytes(data[:4])
+    if head == _RAW_MAGIC: return "raw"
+    if head == _ZLIB_MAGIC: return "zlib"
+    if head[:2] == b"\xff\xd8": return "jpeg"
+    if head == b"RIFF": return "webp"
+    return None
+
+def decode(data):
+    """encode() の逆。data は bytes または memoryview（WebP・JPEG は Pillow が自分で読み込む）"""
+    codec = codec_of(data)
+    if codec in ("raw", "zlib"):
+        _, width, height = _RGB_HEADER.unpack_from(data)
+        pixels = data[_RGB_HEADER.size:]
+        if codec == "zlib":
+            pixels = zlib.decompress(pixels)
+        return Image.frombytes("RGB", (width, height), bytes(pixels))
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+def recode(data, codec, quality=DEFAULT_QUALITY):
+    """別の方式で保存されたデータを codec で符号化し直す（同じ方式ならそのまま返す）"""
+    if codec_of(data) == codec:
+        return data
+    img = decode(data)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return encode(img, codec, quality)
+
+def scale_to(img, display_size, fast=False, upscale=False):
+    """
+    表示サイズに収まるように縮小した画像を返す（元の画像は変更しない）。
+    fast ならスライダー操作中向けに BILINEAR、そうでなければ LANCZOS。
+    upscale は小さい段しか手元にないときの仮表示用。
+    """
+    scale = display_size / max(img.size)
+    if scale >= 1 and not upscale:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, BILINEAR_RESAMPLING if fast else LANCZOS_RESAMPLING)
+
+def image_bytes(img):
+    """デコード済み画像のおおよそのメモリ使用量（キャッシュの sizer 用）"""
+    return img.width * img.height * len(img.getbands())
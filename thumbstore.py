@@ -0,0 +1,309 @@
+"""
+サムネイル専用の追記型パックファイル。
+
+  thumbnail_store.pack  ファイルヘッダ + レコード（ヘッダ・パス・WebP）を追記していく
+  thumbnail_store.idx   オフセット索引のスナップショット（JSON）。索引より後ろに追記された分は開くときに読み直す
+
+読み込みは mmap したパックのスライス（memoryview）を返すだけなので、SQLite のロックも bytes のコピーも発生しない。
+差し替え・削除されたレコードはパック内に残るため、無駄な領域が増えたら compact() で詰め直す。
+"""
+import os
+import json
+import mmap
+import struct
+import logging
+import secrets
+import threading
+
+_MAGIC = b"IMSTHUMB"
+_VERSION = 1
+_FILE_HEADER = struct.Struct("<8sIQ")   # マジック, バージョン, パックID
+_RECORD_HEADER = struct.Struct("<HHdI")  # パスの長さ, 段（0は削除）, mtime, データ長
+_TOMBSTONE = 0
+
+def _encode_path(path):
+    return path.encode("utf-8", "surrogateescape")
+
+def _decode_path(data):
+    return bytes(data).decode("utf-8", "surrogateescape")
+
+class ThumbStore:
+    """
+    (file_path, 段) ごとに最新のサムネイルを持つ追記型ストア。スレッドセーフ。
+    mtime が一致しないものは見つからなかったものとして扱う。
+    """
+    def __init__(self, base_path="thumbnail_store"):
+        self.pack_path = base_path + ".pack"
+        self.index_path = base_path + ".idx"
+        self._lock = threading.RLock()
+        self._index = {}       # file_path -> {段: (mtime, データのオフセット, データ長)}
+        self._dead_bytes = 0   # 差し替え・削除で不要になったバイト数
+        self._dirty = False    # 索引のスナップショットより新しいレコードがあるか
+        self._map = None
+        self._open()
+
+    # --- 開く・索引の復元 ---
+
+    def _open(self):
+        if not os.path.exists(self.pack_path) or os.path.getsize(self.pack_path) < _FILE_HEADER.size:
+            self._create_pack(self.pack_path)
+        self._file = open(self.pack_path, "r+b")
+        magic, version, self._pack_id = _FILE_HEADER.unpack(self._file.read(_FILE_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"サムネイルストアの形式が不正です: {self.pack_path}")
+        self._size = self._file.seek(0, os.SEEK_END)
+        self._remap()
+        scan_from = self._load_index_snapshot()
+        self._scan(scan_from)
+
+    @staticmethod
+    def _create_pack(path):
+        with open(path, "wb") as f:
+            f.write(_FILE_HEADER.pack(_MAGIC, _VERSION, secrets.randbits(63)))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load_index_snapshot(self):
+        """索引のスナップショットを読み込み、続きを走査すべきオフセットを返す"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("pack_id") != self._pack_id or snapshot.get("size", 0) > self._size:
+                raise ValueError("パックと一致しません")
+            self._index = {path: {int(level): tuple(entry) for level, entry in levels.items()}
+                           for path, levels in snapshot["entries"].items()}
+            self._dead_bytes = snapshot.get("dead", 0)
+            return snapshot["size"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            logging.info(f"サムネイル索引を作り直します: {e}")
+        self._index, self._dead_bytes = {}, 0
+        return _FILE_HEADER.size
+
+    def _scan(self, offset):
+        """offset 以降のレコードを索引に反映する。途中で切れたレコード（書き込み中の終了）は切り捨てる"""
+        view = self._map
+        while offset + _RECORD_HEADER.size <= self._size:
+            key_len, level, mtime, data_len = _RECORD_HEADER.unpack_from(view, offset)
+            key_start = offset + _RECORD_HEADER.size
+            data_start = key_start + key_len
+            if data_start + data_len > self._size:
+                break
+            self._apply(_decode_path(view[key_start:data_start]), level, mtime, data_start, data_len,
+                        data_start + data_len - offset)
+            offset = data_start + data_len
+            self._dirty = True
+        if offset < self._size:
+            logging.warning(f"サムネイルストアの末尾の壊れたレコードを切り捨てます: {self._size - offset}バイト")
+            self._map = None
+            self._file.truncate(offset)
+            self._size = offset
+            self._remap()
+
+    def _apply(self, path, level, mtime, data_offset, data_len, record_len):
+        levels = self._index.get(path)
+        if level == _TOMBSTONE:
+            if levels:
+                self._dead_bytes += sum(entry[2] for entry in levels.values()) + record_len
+                del self._index[path]
+            return
+        if levels is None:
+            levels = self._index[path] = {}
+        # ファイルが更新されていれば（mtime が違えば）、ほかの段も古くなっている
+        for old_level, old in list(levels.items()):
+            if old_level == level or old[0] != mtime:
+                self._dead_bytes += old[2]
+                del levels[old_level]
+        levels[level] = (mtime, data_offset, data_len)
+
+    def _remap(self):
+        # 古いマップは閉じずに手放す（呼び出し側が持っている memoryview が使えなくならないように）
+        self._map = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+
+    # --- 読み込み ---
+
+    def get_levels(self, file_path, mtime):
+        """mtime が一致する段を {段: memoryview} で返す（なければ空の辞書）"""
+        with self._lock:
+            levels = self._index.get(file_path)
+            if not levels:
+                return {}
+            if any(offset + length > len(self._map) for _, offset, length in levels.values()):
+                self._remap()
+            view = memoryview(self._map)
+            return {level: view[offset:offset + length]
+                    for level, (entry_mtime, offset, length) in levels.items() if entry_mtime == mtime}
+
+    def get(self, file_path, mtime, level):
+        return self.get_levels(file_path, mtime).get(level)
+
+    def __contains__(self, file_path):
+        return file_path in self._index
+
+    # --- 書き込み ---
+
+    def put_many(self, items):
+        """(file_path, mtime, 段, データ) を追記する"""
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            for file_path, mtime, level, data in items:
+                key = _encode_path(file_path)
+                header = _RECORD_HEADER.pack(len(key), level, mtime, len(data))
+                self._file.write(header)
+                self._file.write(key)
+                self._file.write(data)
+                data_start = self._size + len(header) + len(key)
+                self._apply(file_path, level, mtime, data_start, len(data), data_start + len(data) - self._size)
+                self._size = data_start + len(data)
+                self._dirty = True
+            self._file.flush()
+
+    def put(self, file_path, mtime, level, data):
+        self.put_many(((file_path, mtime, level, data),))
+
+    def discard(self, file_paths):
+        """指定したファイルの全ての段を削除する（削除レコードを追記する）"""
+        with self._lock:
+            targets = [p for p in file_paths if p in self._index]
+            self.put_many((p, 0.0, _TOMBSTONE, b"") for p in targets)
+        return len(targets)
+
+    def discard_under(self, dir_path):
+        prefix = dir_path.rstrip("\\/") + os.sep
+        with self._lock:
+            return self.discard([p for p in self._index if p.startswith(prefix)])
+
+    def rename(self, src_path, dest_path):
+        """移動・名前変更されたファイル（またはフォルダ配下）のサムネイルを新しいパスへ付け替える"""
+        prefix = src_path.rstrip("\\/") + os.sep
+        with self._lock:
+            moved = [p for p in self._index if p == src_path or p.startswith(prefix)]
+            if not moved: return
+            self._remap()
+            view = memoryview(self._map)
+            items = [(dest_path + p[len(src_path):], mtime, level, bytes(view[offset:offset + length]))
+                     for p in moved for level, (mtime, offset, length) in self._index[p].items()]
+            self.discard(moved)
+            self.put_many(items)
+
+    # --- 詰め直し ---
+
+    def needs_compaction(self, ratio=0.3, min_bytes=8 * 1024 * 1024):
+        return self._dead_bytes >= min_bytes and self._dead_bytes >= self._size * ratio
+
+    def count_entries(self, predicate):
+        """predicate(データの memoryview) が真になる段の数"""
+        with self._lock:
+            self._remap()
+            view = memoryview(self._map)
+            try:
+                return sum(1 for levels in self._index.values() for _, offset, length in levels.values()
+                           if predicate(view[offset:offset + length]))
+            finally:
+                view.release()
+
+    def compact(self, transform=None):
+        """
+        有効なレコードだけを新しいパックに書き出して置き換える。コピー中も読み書きできるよう、
+        索引のスナップショットを取ってロックの外でコピーし、その間に追記・削除された分だけを最後にロック内で反映する。
+        transform(データ) を指定すると、書き出す前に各データを変換する（符号化方式の変更など。None を返したものは捨てる）
+        """
+        tmp_path = self.pack_path + ".tmp"
+        with self._lock:
+            self._remap()
+            source = self._map
+            snapshot = {path: dict(levels) for path, levels in self._index.items()}
+        try:
+            self._create_pack(tmp_path)
+            f = open(tmp_path, "r+b")
+            try:
+                _, _, new_id = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+                new_index = {}
+                size = self._copy_records(f, snapshot, source, new_index, f.seek(0, os.SEEK_END), transform)
+                del source
+                with self._lock:
+                    self._remap()
+                    changed = {}
+                    for path, levels in self._index.items():
+                        for level, entry in levels.items():
+                            if snapshot.get(path, {}).get(level) != entry:
+                                changed.setdefault(path, {})[level] = entry
+                    new_index = {path: {level: entry for level, entry in levels.items() if level in self._index.get(path, ())}
+                                 for path, levels in new_index.items() if path in self._index}
+                    self._copy_records(f, changed, self._map, new_index, size, transform)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+                    self._map = None
+                    self._file.close()
+                    try:
+                        os.replace(tmp_path, self.pack_path)
+                    finally:
+                        self._file = open(self.pack_path, "r+b")
+                        self._size = self._file.seek(0, os.SEEK_END)
+                        self._remap()
+                    self._pack_id = new_id
+                    self._index = new_index
+                    self._dead_bytes = 0
+                    self.save_index()
+            finally:
+                f.close()
+            return True
+        except OSError as e:
+            # Windows では読み込み中の memoryview が残っていると置き換えられない。次の機会にやり直す
+            logging.warning(f"サムネイルストアの詰め直しに失敗しました: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    @staticmethod
+    def _copy_records(f, entries, source, new_index, size, transform=None):
+        for path, levels in entries.items():
+            key = _encode_path(path)
+            for level, (mtime, offset, length) in levels.items():
+                data = source[offset:offset + length]
+                if transform is not None:
+                    data = transform(data)
+                    if data is None: continue  # 変換できないデータは捨てる（表示時に作り直される）
+                    length = len(data)
+                header = _RECORD_HEADER.pack(len(key), level, mtime, length)
+                f.write(header)
+                f.write(key)
+                f.write(data)
+                data_start = size + len(header) + len(key)
+                new_index.setdefault(path, {})[level] = (mtime, data_start, length)
+                size = data_start + length
+        return size
+
+    # --- 後始末・統計 ---
+
+    def save_index(self):
+        """索引のスナップショットを書き出す（次回の起動で全体を走査しなくて済むように）"""
+        with self._lock:
+            snapshot = {"pack_id": self._pack_id, "size": self._size, "dead": self._dead_bytes,
+                        "entries": {path: {str(level): list(entry) for level, entry in levels.items()}
+                                    for path, levels in self._index.items()}}
+            self._dirty = False
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logging.error(f"サムネイル索引の保存に失敗しました: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._index), "thumbnails": sum(len(levels) for levels in self._index.values()),
+                    "pack_bytes": self._size, "dead_bytes": self._dead_bytes, "pack_path": os.path.abspath(self.pack_path)}
+
+    def close(self):
+        with self._lock:
+            if self._file.closed: return
+            if self._dirty:
+                self.save_index()
+            self._map = None
+            self._file.close()
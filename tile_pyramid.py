@@ -0,0 +1,66 @@
+"""
+ビューアの拡大表示用に、元画像から見えている部分だけを描く。
+
+元画像に加えて 1/2, 1/4, ... の段を必要になったときに作っておき、縮小表示では拡大率以上で最も小さい段から描く。
+どの拡大率でも、出力は表示する範囲の大きさ（タイルやウィンドウの大きさ）にしかならない。
+"""
+import threading
+from PIL import Image
+
+try:
+    NEAREST_RESAMPLING = Image.Resampling.NEAREST
+    BILINEAR_RESAMPLING = Image.Resampling.BILINEAR
+    LANCZOS_RESAMPLING = Image.Resampling.LANCZOS
+except AttributeError:
+    NEAREST_RESAMPLING = Image.NEAREST
+    BILINEAR_RESAMPLING = Image.BILINEAR
+    LANCZOS_RESAMPLING = Image.LANCZOS
+
+class TilePyramid:
+    """元画像とその縮小段。render() はワーカースレッドから同時に呼んでよい"""
+    def __init__(self, image):
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        image.load()
+        self.size = image.size
+        self._levels = {1: image}  # 縮小率の逆数 -> 画像
+        self._lock = threading.Lock()
+
+    def level_for(self, zoom):
+        """拡大率 zoom で描くときに使う段（1, 2, 4, ...）。段の解像度が表示より粗くならない範囲で最も小さい段"""
+        factor = 1
+        while factor * 2 * zoom <= 1 and min(self.size) // (factor * 2) >= 1:
+            factor *= 2
+        return factor
+
+    def _level(self, factor):
+        with self._lock:
+            img = self._levels.get(factor)
+            if img is None:
+                # 1つ上の段から reduce(2) で順に作る
+                current = max(f for f in self._levels if f < factor)
+                img = self._levels[current]
+                while current < factor:
+                    img = img.reduce(2)
+                    current *= 2
+                    self._levels[current] = img
+            return img
+
+    def render(self, zoom, box, resample=LANCZOS_RESAMPLING):
+        """
+        拡大率 zoom で表示したときの box=(x0, y0, x1, y1)（表示座標）の部分を描く。
+        box は表示したときの画像の範囲に切り詰める。範囲外なら None
+        """
+        x0, y0 = max(0, box[0]), max(0, box[1])
+        x1, y1 = min(box[2], round(self.size[0] * zoom)), min(box[3], round(self.size[1] * zoom))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        factor = self.level_for(zoom)
+        img = self._level(factor)
+        scale = zoom * factor  # 段の1ピクセルが表示で何ピクセルになるか
+        source = (x0 / scale, y0 / scale, min(img.width, x1 / scale), min(img.height, y1 / scale))
+        return img.resize((x1 - x0, y1 - y0), resample, box=source)
+
+    def preview_resample(self, zoom):
+        """操作中の仮表示に使う補間（拡大は NEAREST、縮小は BILINEAR）"""
+        return NEAREST_RESAMPLING if zoom >= 1 else BILINEAR_RESAMPLING
@@ -0,0 +1,78 @@
+import time
+import queue
+import logging
+import threading
+import collections
+import tkinter as tk
+
+from perf import perf
+
+WAKE_EVENT = "<<WorkerWake>>"
+
+class UiDispatcher:
+    """
+    ワーカースレッドから UI スレッドへメッセージを渡す。
+    - put() はどのスレッドから呼んでもよい。UI スレッドへは仮想イベント <<WorkerWake>> で知らせ、
+      未処理のメッセージがある間は何度 put() されてもイベントは1回しか送らない
+    - UI スレッドでは budget_ms の間だけ handler(msg) を呼び、残りは次のイベントループに回す
+    一定間隔で見に行くポーリングと違い、何も届かない間は UI スレッドを起こさない。
+    queue.Queue と同じ put() / get_nowait() を持つので、これまでのキューの代わりにそのまま使える。
+    """
+    def __init__(self, root, handler, budget_ms=8):
+        self.root = root
+        self.handler = handler
+        self.budget = max(1, budget_ms) / 1000
+        self._messages = collections.deque()
+        self._lock = threading.Lock()
+        self._wake_pending = False
+        self._closed = False
+        root.bind(WAKE_EVENT, self._drain)
+
+    def put(self, msg):
+        self._messages.append(msg)
+        with self._lock:
+            if self._wake_pending or self._closed: return
+            self._wake_pending = True
+        try:
+            self.root.event_generate(WAKE_EVENT, when="tail")
+        except (RuntimeError, tk.TclError):
+            # 終了処理中（ウィンドウ破棄後・メインループ終了後）は届けない
+            with self._lock:
+                self._wake_pending = False
+
+    def get_nowait(self):
+        """UI スレッド以外でメッセージを直接取り出す（ベンチマークなど、イベントループを回さない場合に使う）"""
+        try:
+            return self._messages.popleft()
+        except IndexError:
+            raise queue.Empty from None
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+
+    def _drain(self, event=None):
+        started = time.perf_counter()
+        deadline = started + self.budget
+        handled = 0
+        while True:
+            try:
+                msg = self._messages.popleft()
+            except IndexError:
+                with self._lock:
+                    if not self._messages:
+                        self._wake_pending = False
+                        break
+                continue
+            try:
+                self.handler(msg)
+            except Exception:
+                logging.error(f"UIメッセージの処理中にエラーが発生しました: {msg.get('type')}", exc_info=True)
+            handled += 1
+            if time.perf_counter() >= deadline:
+                # 入力や再描画を先に処理させてから続きを処理する（_wake_pending は立てたままにしておく）
+                self.root.after(1, self._drain)
+                break
+        if perf.enabled:
+            perf.add("ui.dispatch", time.perf_counter() - started)
+            perf.count("ui.dispatch_messages", handled)
@@ -8,6 +8,8 @@ import concurrent.futures
 import io
 import tkinterdnd2 as tkdnd
 import threading
+import time
+import collections
 
 try:
     from PIL import Image, ImageTk, ImageOps
@@ -15,13 +17,30 @@ except ImportError:
     raise
 
 from config import AppConfig
+from scheduler import Priority, PriorityScheduler
+from perf import perf
+from cache import ShardedLRUCache
+import thumbnails
 from draggable_widgets import DraggableImageLabel, DroppableEntry
+from tile_pyramid import TilePyramid
+from facets import FACETS, value_label
 
 try:
     LANCZOS_RESAMPLING = Image.Resampling.LANCZOS
 except AttributeError:
     LANCZOS_RESAMPLING = Image.LANCZOS
 
+# 結果グリッドのタイル配置
+TILE_GAP = 10  # タイル同士の間隔
+TILE_CAPTION_HEIGHT = 75  # チェックボックスとファイル名（2行）の分の高さ
+GRID_OVERSCAN_ROWS = 1  # 画面の上下に余分に用意しておく行数
+THUMB_REQUEST_DELAY_MS = 50  # スクロールが止まってからサムネイル生成を依頼するまでの時間
+
+# ビューアの拡大表示
+VIEWER_TILE_SIZE = 512  # 高画質で描くタイルの大きさ（表示座標）
+VIEWER_REFINE_DELAY_MS = 150  # 拡大・移動が止まってから高画質のタイルを描くまでの時間
+VIEWER_MAX_TILES = 48  # 保持するタイル数の上限（超えたら画面から遠いものを捨てる）
+
 class Tooltip:
     def __init__(self, widget, text):
         self.widget = widget
@@ -173,7 +192,8 @@ class SmartSearchBar(ttk.Frame):
         
         # ★★★ 変更点: サジェスト機能用の変数を追加 ★★★
         self._suggestion_timer = None
-        self._suggestion_cache = {}
+        # (フォルダ, 接頭辞) -> 候補。フォルダの内容は変わるため期限付きで持つ
+        self._suggestion_cache = ShardedLRUCache(capacity=256, ttl=view.config.suggestion_cache_ttl_sec, shards=4)
         self._suggestion_thread = None
 
         self.search_frame_container = ttk.Frame(self, style='Card.TFrame')
@@ -316,8 +336,10 @@ class SmartSearchBar(ttk.Frame):
             self._hide_suggestions()
             return
             
-        if prefix in self._suggestion_cache:
-            self._update_suggestion_listbox(self._suggestion_cache[prefix])
+        cache_key = (self.view.dir_path_var.get(), prefix)
+        cached = self._suggestion_cache.get(cache_key)
+        if cached is not None:
+            self._update_suggestion_listbox(cached)
             return
 
         if self._suggestion_thread and self._suggestion_thread.is_alive():
@@ -325,16 +347,16 @@ class SmartSearchBar(ttk.Frame):
             
         self._suggestion_thread = threading.Thread(
             target=self._fetch_suggestions_worker,
-            args=(text, prefix),
+            args=(text, cache_key),
             daemon=True
         )
         self._suggestion_thread.start()
 
-    def _fetch_suggestions_worker(self, text, prefix):
+    def _fetch_suggestions_worker(self, text, cache_key):
         """ワーカースレッドで実際にサジェストを取得する"""
         try:
             suggestions = self.controller.get_keyword_suggestions(text)
-            self._suggestion_cache[prefix] = suggestions
+            self._suggestion_cache.set(cache_key, suggestions)
             
             # UIスレッドで更新をスケジュールする
             self.after_idle(lambda: self._update_suggestion_listbox(suggestions))
@@ -398,6 +420,27 @@ class SmartSearchBar(ttk.Frame):
                 self._hide_suggestions()
         self.after(200, check_and_hide)
 
+class ResultTile:
+    """結果グリッドの1マス。ウィジェットは作り直さずに使い回し、担当するファイルだけを差し替える"""
+    def __init__(self, canvas, controller):
+        self.index = None
+        self.file_path = None
+        self.var = tk.BooleanVar(value=False)
+        self.frame = ttk.Frame(canvas, style='TFrame', padding=5)
+        ttk.Checkbutton(self.frame, variable=self.var, style="Large.TCheckbutton").pack(anchor=tk.W)
+        self.label = DraggableImageLabel(self.frame, controller, None, text="読込中...", cursor="hand2")
+        self.label.pack()
+        self.name_label = ttk.Label(self.frame)
+        self.name_label.pack(fill=tk.X)
+        self.item = canvas.create_window(0, 0, window=self.frame, anchor="nw", state="hidden", tags="tile")
+
+    def set_image(self, tk_thumb):
+        if tk_thumb is None:
+            self.label.configure(image="", text="読込中...")
+        else:
+            self.label.configure(image=tk_thumb)
+        self.label.current_photo_image = tk_thumb
+
 class ImageSearchView:
     def __init__(self, root, config: AppConfig):
         self.root = root
@@ -408,11 +451,29 @@ class ImageSearchView:
         self.thumbnails = {}
         self.thumb_size = (self.config.thumbnail_display_size, self.config.thumbnail_display_size)
         self.max_thumbnails = self.config.max_thumbnails_memory
-        self.selected_files_vars = {}
-        self.current_page = 0
-        self.total_pages = 1
+        # デコード済みのサムネイルの段 (file_path, mtime, 段) -> PIL画像。サイズ変更時はここから縮小する
+        self.thumb_levels = ShardedLRUCache(max_bytes=max(0, self.config.thumbnail_level_cache_mb) * 1024 * 1024,
+                                            sizer=thumbnails.image_bytes, name="thumb_level")
+        # ビューアのフィット表示用に縮小済みの画像 (file_path, mtime, 枠) -> PIL画像。前後の画像もここに先読みする
+        self.viewer_images = ShardedLRUCache(max_bytes=max(0, self.config.viewer_cache_mb) * 1024 * 1024,
+                                             sizer=thumbnails.image_bytes, shards=4, name="viewer_image")
+        # 結果グリッド（_render_grid）の状態
+        self._tiles = []
+        self._total_items = 0
+        self._scroll_offset = 0
+        self._grid_cols = 1
+        self._pool_rows = 0
+        self._grid_display_size = self.config.thumbnail_display_size
+        self._thumb_requests = {}  # file_path -> 生成中の Future
+        self._thumb_request_job = None
+        self.selected_files = {}  # 選択中のファイル（選択順を保つため dict を集合として使う）
         self._resize_after_id = None
-        self.thumbnail_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.config.thread_pool_size)
+        # ワーカーが作った縮小済み画像。PhotoImage への変換は Tk のスレッドでフレームごとに少しずつ行う
+        self._pending_photos = collections.deque()
+        self._photo_lock = threading.Lock()
+        self._photo_drain_scheduled = False
+        # サムネイル生成・検索・先読み・インデックス作成で共有するワーカープール
+        self.scheduler = PriorityScheduler(self.config.thread_pool_size, self.config.reserved_ui_workers)
 
         self.dir_path_var = tk.StringVar()
         self.keyword_var = tk.StringVar()
@@ -425,14 +486,13 @@ class ImageSearchView:
         self.dest_path_var = tk.StringVar()
         self.novel_ai_count_var = tk.IntVar(value=10)
         self.sort_var = tk.StringVar(value="更新日時降順")
-        self.max_display_var = tk.IntVar(value=self.config.max_display_items)
-        self.page_jump_var = tk.StringVar()
         
         self.ui_mode = tk.StringVar(value=self.config.last_ui_mode)
         self.ui_mode.trace_add('write', self._update_ui_layout)
         self.thumb_size_var = tk.IntVar(value=self.config.thumbnail_display_size)
         self.thumb_size_var.trace_add('write', self._schedule_thumb_resize)
         self._thumb_resize_job = None
+        self._thumb_refine_job = None
 
         self.top_controls_frame = None 
         
@@ -443,9 +503,8 @@ class ImageSearchView:
         self.cancel_button = None
         self.progress = None
         self.progress_label = None
+        self.index_status_label = None
         self.page_info_label = None
-        self.prev_page_btn = None
-        self.next_page_btn = None
         
         self.button_manager_mode = None
         self.action_bar_frame = None
@@ -459,50 +518,146 @@ class ImageSearchView:
         self.controller = controller
 
     def shutdown_executors(self):
-        self.thumbnail_executor.shutdown(wait=False, cancel_futures=True)
-
-    def _create_and_get_webp(self, file_path, cached_thumb_bytes):
+        self.scheduler.shutdown(wait=False, cancel_futures=True)
+
+    def _create_and_get_webp(self, file_path, cached_thumb):
+        """
+        表示サイズに縮小したサムネイル（RGB の PIL画像）と、保存すべきピラミッドの段 {段: 符号化済みデータ}（なければ None）を返す。
+        cached_thumb は model.get_cached_thumbnails() の (段, データ)。メモリ上に段があればデコードもしない。
+        ワーカースレッドで呼ばれるため Tk には触れない（PhotoImage は _drain_photos で作る）
+        """
         try:
-            img_to_process = None
-            if cached_thumb_bytes:
-                img_to_process = Image.open(io.BytesIO(cached_thumb_bytes))
-            else:
-                with Image.open(file_path) as img:
-                    img = ImageOps.exif_transpose(img)
-                    img.thumbnail(self.config.thumbnail_cache_size, LANCZOS_RESAMPLING)
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    img_to_process = img.copy()
-            
-            webp_buffer = io.BytesIO()
-            img_to_process.save(webp_buffer, format="WEBP", quality=85)
-            webp_bytes_to_cache = webp_buffer.getvalue() if not cached_thumb_bytes else None
-            
             display_size = self.thumb_size_var.get()
-            img_to_process.thumbnail((display_size, display_size), LANCZOS_RESAMPLING)
-
-            return ImageTk.PhotoImage(img_to_process), webp_bytes_to_cache
+            top_size = max(self.config.thumbnail_cache_size)
+            target = thumbnails.level_for(display_size, top_size)
+            mtime = os.path.getmtime(file_path)
+            level_img = self.thumb_levels.get((file_path, mtime, target))
+            to_store = None
+            if level_img is None and cached_thumb:
+                perf.count("thumb_db.hit")
+                level, data = cached_thumb
+                with perf.span("thumb.decode_cached"):
+                    level_img = thumbnails.decode(data)
+                if level > target:
+                    # 表示サイズ用の段がまだ保存されていない（段を持たない古いキャッシュ）ので、ここで作って保存する
+                    level_img = thumbnails.reduce_to(level_img, target)
+                    with perf.span("thumb.encode"):
+                        to_store = {target: self._encode_thumbnail(level_img)}
+                    level = target
+                self.thumb_levels.set((file_path, mtime, level), level_img)
+            elif level_img is None:
+                perf.count("thumb_db.miss")
+                with perf.span("thumb.decode" + os.path.splitext(file_path)[1].lower()):
+                    top_img = thumbnails.load_source(file_path, self.config.thumbnail_cache_size)
+                pyramid = thumbnails.build_pyramid(top_img, top_size)
+                with perf.span("thumb.encode"):
+                    to_store = {level: self._encode_thumbnail(img) for level, img in pyramid.items()}
+                self.thumb_levels.set_many(((file_path, mtime, level), img) for level, img in pyramid.items())
+                level_img = pyramid[target]
+
+            with perf.span("thumb.scale"):
+                return thumbnails.scale_to(level_img, display_size), to_store
         except Exception as e:
             logging.error(f"サムネイル生成/キャッシュエラー: {file_path} -> {e}")
             return None, None
+
+    def _encode_thumbnail(self, img):
+        return thumbnails.encode(img, self.config.thumbnail_codec, self.config.thumbnail_quality)
+
+    def _create_interim_thumbnail(self, file_path, display_size):
+        """
+        スライダー操作中の仮サムネイル。メモリ上の段だけを使い、BILINEAR で縮小する。
+        目的の段がなければ近い段（大きい段を優先）で代用し、どの段もなければ None を返す
+        """
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            return None
+        top_size = max(self.config.thumbnail_cache_size)
+        target = thumbnails.level_for(display_size, top_size)
+        levels = thumbnails.pyramid_levels(top_size)
+        candidates = sorted(levels, key=lambda level: (level < target, abs(level - target)))
+        for level in candidates:
+            level_img = self.thumb_levels.get((file_path, mtime, level))
+            if level_img is not None:
+                return thumbnails.scale_to(level_img, display_size, fast=True, upscale=level < target)
+        return None
+
+    def _queue_photo(self, future, apply, *args):
+        """
+        ワーカーの完了を受け取り、Tk のスレッドで apply(future, *args) を呼ぶよう積む（どのスレッドから呼んでもよい）。
+        完了ごとに after_idle を積むのではなく、溜まった分を _drain_photos がまとめて処理する
+        """
+        self._pending_photos.append((apply, future, args))
+        with self._photo_lock:
+            if self._photo_drain_scheduled: return
+            self._photo_drain_scheduled = True
+        try:
+            self.root.after_idle(self._drain_photos)
+        except (RuntimeError, tk.TclError):
+            pass  # 終了処理中
+
+    def _drain_photos(self):
+        """1フレームの予算（photo_frame_budget_ms）内で PhotoImage を作って貼り、残りは次のフレームに回す"""
+        started = time.perf_counter()
+        deadline = started + max(1, self.config.photo_frame_budget_ms) / 1000
+        applied = 0
+        while self._pending_photos:
+            apply, future, args = self._pending_photos.popleft()
+            apply(future, *args)
+            applied += 1
+            if time.perf_counter() >= deadline: break
+        if perf.enabled:
+            perf.add("ui.photo_drain", time.perf_counter() - started)
+            perf.count("ui.photo_applied", applied)
+        with self._photo_lock:
+            if not self._pending_photos:
+                self._photo_drain_scheduled = False
+                return
+        # 入力や再描画を先に処理させてから続きを貼る
+        self.root.after(1, self._drain_photos)
+
+    def _tile_for(self, file_path):
+        """file_path を表示しているタイル（なければ None）"""
+        for tile in self._tiles:
+            if tile.file_path == file_path:
+                return tile
+        return None
+
+    def _apply_interim_thumbnail(self, future, file_path):
+        tile = self._tile_for(file_path)
+        if tile is None: return  # スクロールで見えなくなった
+        try:
+            img = future.result()
+            if img:
+                with perf.span("thumb.photoimage"):
+                    tile.set_image(ImageTk.PhotoImage(img))
+        except concurrent.futures.CancelledError:
+            pass
+        except Exception as e:
+            logging.debug(f"仮サムネイル更新エラー: {e}")
     
-    def _update_thumbnail(self, future, file_path, label):
-        if not label.winfo_exists(): return
+    def _update_thumbnail(self, future, file_path):
+        # 後から同じファイルを依頼し直していれば、この結果は古い（保存だけして表示には使わない）
+        current = self._thumb_requests.get(file_path) is future
+        if current:
+            del self._thumb_requests[file_path]
         try:
-            tk_thumb, webp_bytes = future.result()
-            if tk_thumb:
+            img, webp_bytes = future.result()
+            if webp_bytes and self.config.enable_thumbnail_caching:
+                self.controller.cache_thumbnail(file_path, webp_bytes)
+            if img and current:
+                with perf.span("thumb.photoimage"):
+                    tk_thumb = ImageTk.PhotoImage(img)
                 self.thumbnails[file_path] = tk_thumb
-                label.configure(image=tk_thumb)
-                
-                if isinstance(label, DraggableImageLabel):
-                    label.current_photo_image = tk_thumb
-                
-                if webp_bytes and self.config.enable_thumbnail_caching:
-                    self.controller.cache_thumbnail(file_path, webp_bytes)
+                tile = self._tile_for(file_path)
+                if tile is not None:
+                    tile.set_image(tk_thumb)
         except concurrent.futures.CancelledError: 
             pass
         except Exception as e:
-            if label.winfo_exists(): label.configure(text="表示エラー")
+            tile = self._tile_for(file_path)
+            if tile is not None: tile.label.configure(image="", text="表示エラー")
             logging.error(f"サムネイルUI更新エラー: {file_path}, {e}", exc_info=True)
 
     def _clear_offscreen_thumbnails(self, visible_files_set):
@@ -512,121 +667,245 @@ class ImageSearchView:
             del self.thumbnails[path]
         if to_delete: gc.collect()
 
-    def _on_item_enter(self, frame, var):
-        if not var.get():
-            frame.configure(style='Hover.TFrame')
-
-    def _on_item_leave(self, frame, var):
-        if not var.get():
-            frame.configure(style='TFrame')
-            
-    def _update_selection_visuals(self, frame, var, *args):
-        if not frame.winfo_exists():
-            return
-
-        if var.get():
-            frame.configure(style='Selected.TFrame')
+    def _on_item_enter(self, tile):
+        if tile.file_path not in self.selected_files:
+            tile.frame.configure(style='Hover.TFrame')
+
+    def _on_item_leave(self, tile):
+        if tile.file_path not in self.selected_files:
+            tile.frame.configure(style='TFrame')
+
+    def _sync_tile_selection(self, tile):
+        """タイルのチェックボックスと枠の色を、選択状態（selected_files）に合わせる"""
+        selected = tile.file_path in self.selected_files
+        if tile.var.get() != selected:
+            updating, self._is_updating_layout = self._is_updating_layout, True
+            try:
+                tile.var.set(selected)
+            finally:
+                self._is_updating_layout = updating
+        tile.frame.configure(style='Selected.TFrame' if selected else 'TFrame')
+
+    def _on_tile_check(self, tile):
+        if self._is_updating_layout or tile.file_path is None: return
+        self.set_file_selected(tile.file_path, tile.var.get())
+
+    def set_file_selected(self, file_path, selected):
+        if selected:
+            self.selected_files[file_path] = None
         else:
-            frame.configure(style='TFrame')
-
-    def _handle_selection_change(self, frame, var, *args):
-        if self._is_updating_layout:
-            return
-        self._update_selection_visuals(frame, var)
+            self.selected_files.pop(file_path, None)
+        tile = self._tile_for(file_path)
+        if tile is not None:
+            self._sync_tile_selection(tile)
         self.schedule_action_bar_update()
 
+    def toggle_file_selected(self, file_path):
+        self.set_file_selected(file_path, file_path not in self.selected_files)
+
     def schedule_action_bar_update(self):
         if self._selection_update_job:
             self.root.after_cancel(self._selection_update_job)
         self._selection_update_job = self.root.after(50, self._update_contextual_actions)
     
-    def layout_results(self, files_with_thumbs, refresh=True):
+    # --- 結果グリッド ---
+    # 見えている行と前後 GRID_OVERSCAN_ROWS 行分のタイルだけを作り、スクロールに合わせて表示するファイルを差し替える。
+    # キャンバス自体はスクロールさせず、仮想的なスクロール位置（_scroll_offset）からタイルの座標を計算する
+    # （結果が10万件でもキャンバス座標が大きくならない）
+
+    def _grid_metrics(self, display_size=None):
+        """(タイル幅, タイル高さ, 列の間隔, 行の間隔)"""
+        if display_size is None:
+            display_size = self._grid_display_size
+        tile_w, tile_h = display_size + 20, display_size + TILE_CAPTION_HEIGHT
+        return tile_w, tile_h, tile_w + TILE_GAP, tile_h + TILE_GAP
+
+    def _thumb_column_count(self, display_size):
+        _, _, cell_w, _ = self._grid_metrics(display_size)
+        return max(1, (self.canvas.winfo_width() - TILE_GAP) // cell_w)
+
+    def _content_height(self):
+        rows = (self._total_items + self._grid_cols - 1) // self._grid_cols
+        return TILE_GAP + rows * self._grid_metrics()[3]
+
+    def grid_range(self):
+        """タイルを割り当てている範囲 [start, end)（結果件数を超える部分も含む）"""
+        row_h = self._grid_metrics()[3]
+        first_row = max(0, self._scroll_offset // row_h - GRID_OVERSCAN_ROWS)
+        return first_row * self._grid_cols, (first_row + self._pool_rows) * self._grid_cols
+
+    def _ensure_tile_pool(self, display_size=None):
+        """キャンバスの大きさとサムネイルサイズから列数・タイル数を決め、タイルを作り足す（余った分は捨てる）"""
+        if display_size is not None:
+            self._grid_display_size = display_size
+        display_size = self._grid_display_size
+        tile_w, tile_h, _, row_h = self._grid_metrics()
+        self._grid_cols = self._thumb_column_count(display_size)
+        visible_rows = -(-max(1, self.canvas.winfo_height()) // row_h) + 1
+        self._pool_rows = visible_rows + GRID_OVERSCAN_ROWS * 2
+        pool_size = self._pool_rows * self._grid_cols
+        while len(self._tiles) < pool_size:
+            self._tiles.append(self._create_tile())
+        for tile in self._tiles[pool_size:]:
+            self.canvas.delete(tile.item)
+            tile.frame.destroy()
+        del self._tiles[pool_size:]
+        for tile in self._tiles:
+            self.canvas.itemconfigure(tile.item, width=tile_w, height=tile_h)
+            tile.name_label.configure(wraplength=display_size)
+
+    def _create_tile(self):
+        tile = ResultTile(self.canvas, self.controller)
+        tile.var.trace_add('write', lambda *args, t=tile: self._on_tile_check(t))
+        tile.label.bind("<Double-Button-1>", lambda e, t=tile: t.file_path and self.controller.show_full_image(t.file_path))
+        tile.label.bind("<Button-3>", lambda e, t=tile: t.file_path and self.show_context_menu(e, t.file_path))
+        for widget in [tile.frame] + tile.frame.winfo_children():
+            widget.bind("<Enter>", lambda e, t=tile: self._on_item_enter(t))
+            widget.bind("<Leave>", lambda e, t=tile: self._on_item_leave(t))
+        return tile
+
+    def _bind_tile(self, tile, index, file_path):
+        if tile.index == index and tile.file_path == file_path: return
+        tile.index = index
+        if tile.file_path != file_path:
+            tile.file_path = tile.label.file_path = file_path
+            tk_thumb = self.thumbnails.get(file_path)
+            if tk_thumb is not None:
+                perf.count("thumb_memory.hit")
+                tile.set_image(tk_thumb)
+            else:
+                perf.count("thumb_memory.miss")
+                tile.set_image(None)
+            try: rel_path = os.path.relpath(file_path, self.dir_path_var.get())
+            except ValueError: rel_path = os.path.basename(file_path)
+            tile.name_label.configure(text=rel_path)
+        self._sync_tile_selection(tile)
+        self.canvas.itemconfigure(tile.item, state="normal")
+
+    def _unbind_tile(self, tile):
+        if tile.index is None and tile.file_path is None: return
+        tile.index = tile.file_path = tile.label.file_path = None
+        tile.set_image(None)
+        self.canvas.itemconfigure(tile.item, state="hidden")
+
+    def _render_grid(self):
+        """スクロール位置に合わせてタイルを並べ、担当するファイルが変わったタイルだけを差し替える"""
+        started = time.perf_counter()
+        canvas_h = self.canvas.winfo_height()
+        self._scroll_offset = max(0, min(self._scroll_offset, self._content_height() - canvas_h))
+        _, _, cell_w, row_h = self._grid_metrics()
+        start, end = self.grid_range()
+        paths = self.controller.get_result_range(start, end) if self._tiles else []
+        used = set()
         self._is_updating_layout = True
         try:
-            saved_selections = {path for path, var in self.selected_files_vars.items() if var.get()}
-            
-            for widget in self.results_inner_frame.winfo_children():
-                widget.destroy()
-            
-            if refresh:
-                self.selected_files_vars.clear()
-                saved_selections.clear()
-            
-            self.schedule_action_bar_update()
-
-            max_items = self.max_display_var.get()
-            if max_items <= 0: max_items = 1
-            total_items = len(files_with_thumbs)
-            self.total_pages = (total_items + max_items - 1) // max_items if total_items > 0 else 1
-
-            if self.current_page >= self.total_pages: self.current_page = max(0, self.total_pages - 1)
-            
-            if self.page_info_label:
-                self.page_info_label.config(text=f"ページ {self.current_page + 1}/{self.total_pages} ({total_items}件)")
-            
-            start_index, end_index = self.current_page * max_items, (self.current_page + 1) * max_items
-            page_files_with_thumb_data = files_with_thumbs[start_index:end_index]
-            
-            self._clear_offscreen_thumbnails({path for path, _ in page_files_with_thumb_data})
-
-            if not page_files_with_thumb_data and refresh:
-                ttk.Label(self.results_inner_frame, text="見つかりませんでした…(>_<)").grid(padx=10, pady=10)
-                return
-
-            display_size = self.thumb_size_var.get()
-            frame_width = self.results_frame.winfo_width(); cell_width = display_size + 20
-            col_count = max(1, frame_width // cell_width)
-            
-            for i, (file_path, cached_thumb_bytes) in enumerate(page_files_with_thumb_data):
-                row_idx, col_idx = divmod(i, col_count)
-                item_frame = ttk.Frame(self.results_inner_frame, style='TFrame', padding=5)
-                item_frame.grid(row=row_idx, column=col_idx, padx=5, pady=5, sticky="n")
-                
-                initial_value = file_path in saved_selections
-                var = self.selected_files_vars.get(file_path)
-                if not var:
-                    var = tk.BooleanVar(value=initial_value)
-                    self.selected_files_vars[file_path] = var
-                elif var.get() != initial_value:
-                    var.set(initial_value)
-
-                if hasattr(var, '_trace_id') and var.trace_id:
-                    var.trace_remove('write', var.trace_id)
-                
-                callback = lambda *args, f=item_frame, v=var: self._handle_selection_change(f, v)
-                var.trace_id = var.trace_add('write', callback)
-
-                ttk.Checkbutton(item_frame, variable=var, style="Large.TCheckbutton").pack(anchor=tk.W)
-                
-                img_label = DraggableImageLabel(item_frame, self.controller, file_path, text="読込中...", cursor="hand2")
-                img_label.pack()
-
-                if file_path in self.thumbnails:
-                    tk_thumb = self.thumbnails[file_path]
-                    img_label.configure(image=tk_thumb)
-                    img_label.current_photo_image = tk_thumb
-                else:
-                    future = self.thumbnail_executor.submit(self._create_and_get_webp, file_path, cached_thumb_bytes)
-                    future.add_done_callback(lambda f, p=file_path, l=img_label: self.root.after_idle(self._update_thumbnail, f, p, l))
-
-                img_label.bind("<Double-Button-1>", lambda e, p=file_path: self.controller.show_full_image(p))
-                img_label.bind("<Button-3>", lambda e, p=file_path: self.show_context_menu(e, p))
-                
-                try: rel_path = os.path.relpath(file_path, self.dir_path_var.get())
-                except ValueError: rel_path = os.path.basename(file_path)
-                ttk.Label(item_frame, text=rel_path, wraplength=display_size).pack(fill=tk.X, expand=True)
-                
-                for widget in [item_frame] + item_frame.winfo_children():
-                    widget.bind("<Enter>", lambda e, f=item_frame, v=var: self._on_item_enter(f, v))
-                    widget.bind("<Leave>", lambda e, f=item_frame, v=var: self._on_item_leave(f, v))
-
-                self._update_selection_visuals(item_frame, var)
+            for index, file_path in enumerate(paths, start):
+                slot = index % len(self._tiles)
+                tile = self._tiles[slot]
+                used.add(slot)
+                self._bind_tile(tile, index, file_path)
+                row, col = divmod(index, self._grid_cols)
+                self.canvas.coords(tile.item, TILE_GAP + col * cell_w, TILE_GAP + row * row_h - self._scroll_offset)
+            for slot, tile in enumerate(self._tiles):
+                if slot not in used: self._unbind_tile(tile)
         finally:
             self._is_updating_layout = False
-
-        self.root.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        if refresh: self.canvas.yview_moveto(0)
+        self.update_result_count(self._total_items)
+        if perf.enabled:
+            perf.add("ui.grid_render", time.perf_counter() - started)
+
+    def _update_scrollbar(self):
+        content_h = self._content_height()
+        canvas_h = max(1, self.canvas.winfo_height())
+        if content_h <= canvas_h:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self._scroll_offset / content_h, (self._scroll_offset + canvas_h) / content_h)
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(int(offset), self._content_height() - self.canvas.winfo_height()))
+        if offset == self._scroll_offset: return
+        self._scroll_offset = offset
+        self._render_grid()
+        self._schedule_thumb_requests()
+
+    def _on_scrollbar(self, *args):
+        canvas_h = max(1, self.canvas.winfo_height())
+        if args[0] == "moveto":
+            self._scroll_to(float(args[1]) * self._content_height())
+        elif args[0] == "scroll":
+            step = canvas_h * 9 // 10 if args[2] == "pages" else max(1, canvas_h // 10)
+            self._scroll_to(self._scroll_offset + int(args[1]) * step)
+
+    def _schedule_thumb_requests(self, delay=THUMB_REQUEST_DELAY_MS):
+        # スクロールバーを大きく動かしている間は依頼せず、止まってから見えている分だけを依頼する
+        if self._thumb_request_job:
+            self.root.after_cancel(self._thumb_request_job)
+        self._thumb_request_job = self.root.after(delay, self._request_visible_thumbnails)
+
+    def _request_visible_thumbnails(self):
+        """タイルに割り当てたファイルのうち、メモリにないサムネイルの生成を依頼する（画面内の行を先に）"""
+        self._thumb_request_job = None
+        self.scheduler.new_generation(Priority.VISIBLE_THUMB)
+        bound = [tile for tile in self._tiles if tile.file_path is not None]
+        self._clear_offscreen_thumbnails({tile.file_path for tile in bound})
+        first_visible = self._scroll_offset // self._grid_metrics()[3] * self._grid_cols
+        bound.sort(key=lambda tile: (tile.index < first_visible, tile.index))
+        missing = []
+        for tile in bound:
+            if tile.file_path in self.thumbnails: continue
+            future = self._thumb_requests.get(tile.file_path)
+            if future is not None and not future.cancelled(): continue  # 処理中
+            missing.append(tile)
+        if missing:
+            cached_thumbs = self.controller.get_cached_thumbnails([tile.file_path for tile in missing])
+            for tile in missing:
+                file_path = tile.file_path
+                future = self.scheduler.submit(Priority.VISIBLE_THUMB, self._create_and_get_webp, file_path, cached_thumbs.get(file_path))
+                self._thumb_requests[file_path] = future
+                future.add_done_callback(lambda f, p=file_path: self._queue_photo(f, self._update_thumbnail, p))
+        # 下にスクロールしたときに見える範囲を先読みしておく
+        start, end = self.grid_range()
+        self.controller.prefetch_thumbnails(end, end + (end - start) * self.config.predictive_pages)
+
+    def update_result_count(self, total_items):
+        """結果件数とスクロールバー・表示位置の表示を更新する（タイルの差し替えはしない）"""
+        self._total_items = total_items
+        self._update_scrollbar()
+        if not self.page_info_label: return
+        if total_items == 0:
+            self.page_info_label.config(text="0件")
+            return
+        _, _, _, row_h = self._grid_metrics()
+        first = self._scroll_offset // row_h * self._grid_cols
+        last = min(total_items, -(-(self._scroll_offset + self.canvas.winfo_height()) // row_h) * self._grid_cols)
+        self.page_info_label.config(text=f"{first + 1}-{last} / {total_items}件")
+
+    def set_results(self, total_items, refresh=True):
+        """結果件数が変わった・並び順が変わったときに呼ぶ。refresh=True なら選択を解除して先頭に戻る"""
+        self._total_items = total_items
+        if refresh:
+            self.selected_files.clear()
+            for tile in self._tiles:
+                self._sync_tile_selection(tile)
+            self.schedule_action_bar_update()
+            self._scroll_offset = 0
+        self.canvas.delete("empty")
+        if total_items == 0 and refresh:
+            self.canvas.create_text(TILE_GAP * 2, TILE_GAP * 2, text="見つかりませんでした…(>_<)", anchor="nw", tags="empty")
+        if not self._tiles:
+            self._ensure_tile_pool()
+        self._render_grid()
+        self._schedule_thumb_requests(0)
+
+    def _relayout_grid(self, display_size=None):
+        """キャンバスの大きさやサムネイルサイズが変わったとき、先頭に見えているファイルを保ったまま並べ直す"""
+        self._resize_after_id = None
+        first_visible = self._scroll_offset // self._grid_metrics()[3] * self._grid_cols
+        self._ensure_tile_pool(display_size)
+        self._scroll_offset = first_visible // self._grid_cols * self._grid_metrics()[3]
+        self._render_grid()
+        self._schedule_thumb_requests()
 
     def create_widgets(self):
         style = ttk.Style()
@@ -643,7 +922,7 @@ class ImageSearchView:
         self.root.columnconfigure(0, weight=1)
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.grid(row=0, column=0, sticky="nsew")
-        main_frame.rowconfigure(4, weight=1) 
+        main_frame.rowconfigure(5, weight=1) 
         main_frame.columnconfigure(0, weight=1)
 
         mode_switcher_frame = ttk.Frame(main_frame)
@@ -667,21 +946,21 @@ class ImageSearchView:
         self.smart_tags_frame = ttk.Labelframe(main_frame, text="絞り込みタグ", padding=5)
         self.smart_tags_frame.grid(row=3, column=0, sticky="ew", padx=5, pady=(0, 5))
 
+        self.facets_frame = ttk.Labelframe(main_frame, text="結果の内訳", padding=5)
+        self.facets_frame.grid(row=4, column=0, sticky="ew", padx=5, pady=(0, 5))
+        self.facets_frame.columnconfigure(1, weight=1)
+
         self.results_frame = ttk.Frame(main_frame, borderwidth=2, relief="sunken")
-        self.results_frame.grid(row=4, column=0, padx=5, pady=5, sticky="nsew")
+        self.results_frame.grid(row=5, column=0, padx=5, pady=5, sticky="nsew")
         self.results_frame.rowconfigure(0, weight=1)
         self.results_frame.columnconfigure(0, weight=1)
         
-        self.canvas = tk.Canvas(self.results_frame)
+        # キャンバスはスクロールさせず、スクロールバーは仮想的なスクロール位置（_scroll_to）につなぐ
+        self.canvas = tk.Canvas(self.results_frame, highlightthickness=0)
         self.canvas.grid(row=0, column=0, sticky="nsew")
-        self.scrollbar = ttk.Scrollbar(self.results_frame, orient="vertical", command=self.canvas.yview)
+        self.scrollbar = ttk.Scrollbar(self.results_frame, orient="vertical", command=self._on_scrollbar)
         self.scrollbar.grid(row=0, column=1, sticky="ns")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
         
-        self.results_inner_frame = ttk.Frame(self.canvas)
-        self.canvas.create_window((0, 0), window=self.results_inner_frame, anchor="nw")
-        
-        self.results_inner_frame.bind("<Configure>", self.on_frame_configure)
         self.canvas.bind("<Enter>", self._bind_mousewheel)
         self.canvas.bind("<Leave>", self._unbind_mousewheel)
         self.results_frame.bind("<Configure>", self.on_resize_frame)
@@ -690,6 +969,42 @@ class ImageSearchView:
         self._update_ui_layout()
         self._update_contextual_actions()
         self.display_smart_tags([])
+        self.display_facets({}, [])
+
+    def display_facets(self, facets, filters):
+        """
+        結果の内訳（{ファセット: [(値, 件数)]}）を行ごとにボタンで表示する。ボタンを押すとその値で絞り込む。
+        filters は適用中の (ファセット, 値) のリストで、あれば解除ボタンと一緒に表示する
+        """
+        for widget in self.facets_frame.winfo_children():
+            widget.destroy()
+        # 値が1種類しかないファセットは絞り込みに使えないので出さない
+        rows = [(facet, values) for facet, values in facets.items() if len(values) > 1]
+        if not rows and not filters:
+            self.facets_frame.grid_remove()
+            return
+
+        self.facets_frame.grid()
+        row = 0
+        if filters:
+            text = "、".join(f"{FACETS[facet]}: {value_label(value)}" for facet, value in filters)
+            ttk.Label(self.facets_frame, text="絞り込み中").grid(row=row, column=0, sticky="w")
+            filter_frame = ttk.Frame(self.facets_frame)
+            filter_frame.grid(row=row, column=1, sticky="w")
+            ttk.Label(filter_frame, text=text, foreground="blue").pack(side='left', padx=2)
+            btn = ttk.Button(filter_frame, text="絞り込みを解除", command=self.controller.clear_facet_filters)
+            btn.pack(side='left', padx=2)
+            Tooltip(btn, "絞り込みで外した結果を元に戻します")
+            row += 1
+        for facet, values in rows:
+            ttk.Label(self.facets_frame, text=FACETS[facet]).grid(row=row, column=0, sticky="w")
+            values_frame = ttk.Frame(self.facets_frame)
+            values_frame.grid(row=row, column=1, sticky="w")
+            for value, count in values:
+                btn = ttk.Button(values_frame, text=f"{value_label(value)} ({count})",
+                                 command=lambda f=facet, v=value: self.controller.apply_facet_filter(f, v))
+                btn.pack(side='left', padx=2)
+            row += 1
 
     def display_smart_tags(self, tags):
         for widget in self.smart_tags_frame.winfo_children():
@@ -741,7 +1056,7 @@ class ImageSearchView:
         
         ttk.Frame(self.action_bar_frame).pack(side='left', expand=True, fill='x')
 
-        ttk.Button(self.action_bar_frame, text="このページの全ファイルを選択", command=self.select_all_files).pack(side='left', padx=5)
+        ttk.Button(self.action_bar_frame, text="全ファイルを選択", command=self.select_all_files).pack(side='left', padx=5)
 
     def _build_single_selection_actions(self, file_path):
         ttk.Label(self.action_bar_frame, text=f"「{os.path.basename(file_path)}」を選択中").pack(side='left', padx=5)
@@ -829,6 +1144,8 @@ class ImageSearchView:
         self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.progress_label = ttk.Label(progress_frame, text="待機中...", width=15, anchor="w")
         self.progress_label.pack(side=tk.LEFT, padx=5)
+        self.index_status_label = ttk.Label(action_frame, text="", foreground="gray", anchor="w")
+        self.index_status_label.grid(row=2, column=0, sticky="ew")
         
         self.page_info_label = ttk.Label(self.top_controls_frame) 
         
@@ -866,6 +1183,8 @@ class ImageSearchView:
         self.progress.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         self.progress_label = ttk.Label(progress_frame, text="待機中...", width=25, anchor="w")
         self.progress_label.pack(side=tk.LEFT, padx=5)
+        self.index_status_label = ttk.Label(right_frame, text="", foreground="gray", anchor="w")
+        self.index_status_label.grid(row=3, column=0, sticky="ew", padx=5)
 
         notebook = ttk.Notebook(self.top_controls_frame)
         notebook.grid(row=1, column=0, padx=5, pady=5, sticky="ew")
@@ -935,13 +1254,6 @@ class ImageSearchView:
         sort_combobox.pack(anchor='w')
         sort_combobox.bind("<<ComboboxSelected>>", self.controller.on_sort_changed)
 
-        display_count_frame = ttk.Frame(display_tab)
-        display_count_frame.pack(side='left', padx=10, pady=5)
-        ttk.Label(display_count_frame, text="最大表示件数:").pack(anchor='w')
-        max_display_entry = ttk.Entry(display_count_frame, textvariable=self.max_display_var, width=8)
-        max_display_entry.pack(anchor='w')
-        self.add_context_menu(max_display_entry)
-
         thumb_size_frame = ttk.Labelframe(display_tab, text="サムネイルサイズ")
         thumb_size_frame.pack(side='left', padx=10, pady=5, fill='x')
         
@@ -958,22 +1270,12 @@ class ImageSearchView:
         default_size = AppConfig().thumbnail_display_size
         Tooltip(reset_button, f"デフォルトのサイズ ({default_size}px) に戻します")
         
-        paging_frame = ttk.Frame(display_tab)
-        paging_frame.pack(side='left', padx=10, pady=5)
-        self.prev_page_btn = ttk.Button(paging_frame, text="◀ 前へ", command=self.prev_page)
-        self.prev_page_btn.pack(fill='x', expand=True)
-        self.next_page_btn = ttk.Button(paging_frame, text="次へ ▶", command=self.next_page)
-        self.next_page_btn.pack(fill='x', expand=True)
-        
-        page_jump_frame = ttk.Frame(display_tab)
-        page_jump_frame.pack(side='left', padx=10, pady=5)
-        self.page_info_label = ttk.Label(page_jump_frame, text="ページ 1/1")
-        self.page_info_label.pack(pady=2)
-        page_jump_inner_frame = ttk.Frame(page_jump_frame)
-        page_jump_inner_frame.pack()
-        page_jump_entry = ttk.Entry(page_jump_inner_frame, textvariable=self.page_jump_var, width=5)
-        page_jump_entry.pack(side=tk.LEFT, padx=(0,5))
-        ttk.Button(page_jump_inner_frame, text="移動", command=self.jump_to_page).pack(side=tk.LEFT)
+        position_frame = ttk.Frame(display_tab)
+        position_frame.pack(side='left', padx=10, pady=5)
+        ttk.Label(position_frame, text="表示位置:").pack(anchor='w')
+        self.page_info_label = ttk.Label(position_frame, text="0件")
+        self.page_info_label.pack(anchor='w')
+        self.update_result_count(self._total_items)
 
         latest_files_tab = ttk.Frame(notebook)
         notebook.add(latest_files_tab, text='最新ファイル')
@@ -990,13 +1292,47 @@ class ImageSearchView:
         self.setup_keyboard_navigation()
 
     def _schedule_thumb_resize(self, *args):
+        # ドラッグ中はメモリ上の段から素早く描き直し、止まってから高画質で描き直す
         if self._thumb_resize_job:
             self.root.after_cancel(self._thumb_resize_job)
-        self._thumb_resize_job = self.root.after(250, self._on_thumb_size_change)
+        if self._thumb_refine_job:
+            self.root.after_cancel(self._thumb_refine_job)
+        self._thumb_resize_job = self.root.after(50, self._resize_thumbnails_interim)
+        self._thumb_refine_job = self.root.after(400, self._on_thumb_size_change)
+
+    def _resize_thumbnails_interim(self):
+        """ウィジェットを作り直さずに並べ直し、各サムネイルをメモリ上の段から高速に縮小して差し替える"""
+        self._thumb_resize_job = None
+        try:
+            display_size = self.thumb_size_var.get()
+        except tk.TclError:
+            return  # 入力欄の編集途中（空欄など）
+        if display_size <= 0: return
+        self.scheduler.new_generation(Priority.VISIBLE_THUMB)
+        self._thumb_requests.clear()
+        self._relayout_grid(display_size)
+        for tile in self._tiles:
+            if tile.file_path is None: continue
+            future = self.scheduler.submit(Priority.VISIBLE_THUMB, self._create_interim_thumbnail, tile.file_path, display_size)
+            future.add_done_callback(lambda f, p=tile.file_path: self._queue_photo(f, self._apply_interim_thumbnail, p))
 
     def _on_thumb_size_change(self):
+        """高画質で描き直す。新しいサムネイルができるまでは、各タイルの今の画像をそのまま表示しておく"""
+        self._thumb_refine_job = None
+        if self._thumb_resize_job:
+            self.root.after_cancel(self._thumb_resize_job)
+            self._thumb_resize_job = None
+        try:
+            display_size = self.thumb_size_var.get()
+        except tk.TclError:
+            return
+        if display_size <= 0: return
+        self.scheduler.new_generation(Priority.VISIBLE_THUMB)
+        self._thumb_requests.clear()
         self.thumbnails.clear()
-        self.controller.on_sort_changed(refresh=False)
+        if display_size != self._grid_display_size:
+            self._relayout_grid(display_size)
+        self._schedule_thumb_requests(0)
         
     def _reset_thumb_size(self):
         default_size = AppConfig().thumbnail_display_size
@@ -1028,14 +1364,16 @@ class ImageSearchView:
         if self.cancel_button: Tooltip(self.cancel_button, "実行中の検索を中止します")
         if self.history_combo: Tooltip(self.history_combo, "過去の検索履歴を表示・選択します")
         if self.history_sort_combobox: Tooltip(self.history_sort_combobox, "履歴の表示順を変更します")
-        if self.prev_page_btn: Tooltip(self.prev_page_btn, "前のページに移動します")
-        if self.next_page_btn: Tooltip(self.next_page_btn, "次のページに移動します")
 
     def setup_keyboard_navigation(self):
         if self.search_entry:
             self.root.bind_all('<Control-f>', lambda e: self.search_entry.focus_set())
             self.search_entry.focus_set()
         self.root.bind_all('<F1>', self.show_help)
+        self.root.bind_all('<F12>', lambda e: self.show_perf_stats())
+
+    def show_perf_stats(self):
+        PerfStatsDialog(self.root, self.config)
 
     def show_help(self, event=None):
         help_text = """
@@ -1054,6 +1392,7 @@ class ImageSearchView:
 【ショートカットキー】
 - Ctrl + F: 検索バーにフォーカスを移動します。
 - F1: このヘルプを表示します。
+- F12: パフォーマンス統計を表示します（検索が遅いときの調査用）。
 
 【その他】
 - サムネイルをCtrl+クリックすると、チェックボックスと同様に選択/選択解除ができます。
@@ -1074,6 +1413,11 @@ class ImageSearchView:
         elif value == 0 and not text:
             self.progress_label.config(text="待機中...")
     
+    def update_index_status(self, text):
+        """バックグラウンドインデックス作成の進捗表示"""
+        if self.index_status_label and self.index_status_label.winfo_exists():
+            self.index_status_label.config(text=text)
+
     def get_search_parameters(self):
         return {
             "dir_path": self.dir_path_var.get(),
@@ -1085,7 +1429,7 @@ class ImageSearchView:
         }
 
     def get_selected_files(self):
-        return [f for f, var in self.selected_files_vars.items() if var.get()]
+        return list(self.selected_files)
 
     def show_context_menu(self, event, file_path):
         menu = tk.Menu(self.root, tearoff=0)
@@ -1138,12 +1482,8 @@ class ImageSearchView:
         self.include_negative_var.set(settings.get("include_negative", False))
         self.and_search_var.set(settings.get("and_search", True))
         self.recursive_search_var.set(settings.get("recursive_search", True))
-        self.max_display_var.set(settings.get("max_display", self.config.max_display_items))
         self.novel_ai_count_var.set(settings.get("novel_ai_count", 10))
 
-    def on_frame_configure(self, event):
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-
     def _bind_mousewheel(self, event):
         self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
 
@@ -1151,12 +1491,12 @@ class ImageSearchView:
         self.canvas.unbind_all("<MouseWheel>")
 
     def _on_mousewheel(self, event):
-        self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+        self._on_scrollbar("scroll", int(-1 * (event.delta / 120)), "units")
 
     def on_resize_frame(self, event):
         if self._resize_after_id:
             self.root.after_cancel(self._resize_after_id)
-        self._resize_after_id = self.root.after(300, lambda: self.controller.on_sort_changed(refresh=False))
+        self._resize_after_id = self.root.after(100, self._relayout_grid)
 
     def add_context_menu(self, widget):
         menu = tk.Menu(widget, tearoff=0)
@@ -1165,44 +1505,46 @@ class ImageSearchView:
         menu.add_command(label="ペースト", command=lambda: widget.event_generate("<<Paste>>"))
         widget.bind("<Button-3>", lambda e: menu.tk_popup(e.x_root, e.y_root))
 
-    def prev_page(self):
-        if self.current_page > 0:
-            self.current_page -= 1
-            self.controller.on_sort_changed(refresh=False)
-
-    def next_page(self):
-        if self.current_page < self.total_pages - 1:
-            self.current_page += 1
-            self.controller.on_sort_changed(refresh=False)
-
-    def jump_to_page(self):
-        try:
-            page_num = int(self.page_jump_var.get())
-            if 1 <= page_num <= self.total_pages:
-                self.current_page = page_num - 1
-                self.controller.on_sort_changed(refresh=False)
-            else:
-                messagebox.showerror("エラー", f"1から{self.total_pages}の間のページ番号を入力してください。")
-        except ValueError:
-            messagebox.showerror("エラー", "有効なページ番号（数値）を入力してください。")
-        finally:
-            self.page_jump_var.set("")
-
     def select_all_files(self):
-        [var.set(True) for var in self.selected_files_vars.values()]
+        self.selected_files = dict.fromkeys(self.controller.current_matched_files)
+        for tile in self._tiles:
+            self._sync_tile_selection(tile)
+        self.schedule_action_bar_update()
 
     def deselect_all_files(self):
-        [var.set(False) for var in self.selected_files_vars.values()]
+        self.selected_files.clear()
+        for tile in self._tiles:
+            self._sync_tile_selection(tile)
+        self.schedule_action_bar_update()
 
 class ImageViewerWindow(tk.Toplevel):
+    """
+    画像ビューア。フィット表示用の画像はワーカーで縮小デコードし、view.viewer_images（バイト数上限つきLRU）に入れる。
+    表示中の画像の前後 viewer_prefetch_count 枚も先に用意しておくため、矢印キーでの移動はキャッシュから表示できる。
+    別の画像へ移ると、まだ始まっていない先読みは取り消して、新しい位置の前後を依頼し直す。
+    拡大・原寸表示では見えている範囲だけを描く。操作中は粗い補間で画面分だけを描き（プレビュー）、
+    止まってから VIEWER_TILE_SIZE のタイル単位で高画質に描き直す。タイルはその拡大率の間は使い回す。
+    """
     def __init__(self, parent, controller, file_list, start_index=0):
         super().__init__(parent)
         self.controller = controller
+        self.view = controller.view
         self.file_list = file_list
         self.current_index = start_index
         self.current_zoom = 1.0
-        self.pil_image = None
+        self.pyramid = None  # 拡大・原寸表示用の元画像とその縮小段（必要になってから開く）
+        self.fit_image = None  # フィット表示中の縮小済み画像
+        self.fit_mode = True
         self.resize_timer = None
+        self._requests = {}  # (file_path, 枠) -> Future
+        self._direction = 1  # 直前に移動した向き（先読みはこちらを優先する）
+        # ビューアは複数開けるため、取り消しはこのウィンドウが投入したタスク（group）に限る
+        self._decode_group = ("viewer", id(self))
+        self._tile_group = ("viewer_tiles", id(self))
+        self._tiles = {}  # (列, 行) -> (キャンバスの項目, PhotoImage)。今の拡大率で描いたタイル
+        self._tile_requests = {}  # (拡大率, 列, 行) -> Future
+        self._preview_job = None
+        self._refine_job = None
         self.title("画像ビューア")
         self.geometry(self.controller.config.viewer_geometry)
         self.configure(bg="gray20")
@@ -1224,7 +1566,8 @@ class ImageViewerWindow(tk.Toplevel):
         self.canvas = tk.Canvas(canvas_frame, bg="gray20", highlightthickness=0)
         self.hbar = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
         self.vbar = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
-        self.canvas.config(xscrollcommand=self.hbar.set, yscrollcommand=self.vbar.set)
+        self.canvas.config(xscrollcommand=lambda *args: self._on_view_scrolled(self.hbar, *args),
+                           yscrollcommand=lambda *args: self._on_view_scrolled(self.vbar, *args))
         self.hbar.grid(row=1, column=0, sticky="ew")
         self.vbar.grid(row=0, column=1, sticky="ns")
         self.canvas.grid(row=0, column=0, sticky="nsew")
@@ -1233,7 +1576,13 @@ class ImageViewerWindow(tk.Toplevel):
         self.focus_set()
     def on_viewer_closing(self):
         self.controller.config.viewer_geometry = self.geometry()
+        self._cancel_requests()
         self.destroy()
+    def _cancel_requests(self, tiles_only=False):
+        """このウィンドウが投入した未着手のデコード・タイル描画を取り消す"""
+        self.view.scheduler.cancel_group(Priority.VIEWER, self._tile_group)
+        if not tiles_only:
+            self.view.scheduler.cancel_group(Priority.VIEWER, self._decode_group)
     def bind_events(self):
         self.bind("<Left>", lambda e: self.prev_image())
         self.bind("<Right>", lambda e: self.next_image())
@@ -1245,56 +1594,214 @@ class ImageViewerWindow(tk.Toplevel):
         self.canvas.bind("<ButtonPress-1>", self.on_button_press)
         self.canvas.bind("<B1-Motion>", self.on_move_press)
         self.bind("<Configure>", self.on_window_resize)
+    def _fit_box(self):
+        """フィット表示で画像を収める枠。ウィンドウがまだ表示されていなければ None"""
+        canvas_w, canvas_h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if canvas_w < 50 or canvas_h < 50:
+            return None
+        return (canvas_w - 10, canvas_h - 10)
+    def _cached_fit_image(self, file_path, box):
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            return None
+        return self.view.viewer_images.get((file_path, mtime, box))
+    def _decode_fit_image(self, file_path, box):
+        """ワーカーで実行: 枠に収まる大きさまで縮小してデコードし、キャッシュに入れる"""
+        mtime = os.path.getmtime(file_path)
+        with perf.span("viewer.decode"):
+            img = thumbnails.load_source(file_path, box)
+        self.view.viewer_images.set((file_path, mtime, box), img)
+        return img
+    def _request_fit_images(self, box):
+        """表示中の画像（未キャッシュなら）と前後の画像のデコードを依頼する。古い位置の未着手分は取り消す"""
+        self._cancel_requests()
+        self._requests = {key: future for key, future in self._requests.items() if not future.done()}
+        count = max(0, self.controller.config.viewer_prefetch_count)
+        indexes = [self.current_index]
+        for distance in range(1, count + 1):
+            indexes += [self.current_index + distance * self._direction, self.current_index - distance * self._direction]
+        for index in indexes:
+            if not (0 <= index < len(self.file_list)): continue
+            file_path = self.file_list[index]
+            key = (file_path, box)
+            if key in self._requests or self._cached_fit_image(file_path, box) is not None: continue
+            future = self.view.scheduler.submit(Priority.VIEWER, self._decode_fit_image, file_path, box, group=self._decode_group)
+            self._requests[key] = future
+            future.add_done_callback(lambda f, k=key: self.view._queue_photo(f, self._on_fit_image_decoded, k))
+    def _on_fit_image_decoded(self, future, key):
+        if self._requests.get(key) is future:
+            del self._requests[key]
+        if not self.winfo_exists() or future.cancelled(): return
+        file_path, box = key
+        # 先読み分はキャッシュに入れば十分。表示中の画像がまだ出ていなければここで表示する
+        if not self.fit_mode or self.fit_image is not None or box != self._fit_box(): return
+        if not (0 <= self.current_index < len(self.file_list)) or self.file_list[self.current_index] != file_path: return
+        try:
+            self._show_fit_image(future.result())
+        except Exception as e:
+            self._show_error(file_path, e)
+    def _show_fit_image(self, img):
+        self.fit_image = img
+        self.current_zoom = 1.0 if self.pyramid is None else img.width / max(1, self.pyramid.size[0])
+        with perf.span("viewer.photoimage"):
+            self.tk_image = ImageTk.PhotoImage(img)
+        self._clear_tiles()
+        self.canvas.delete("all")
+        self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
+        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+    def _show_error(self, file_path, e):
+        logging.error(f"画像を開けませんでした: {file_path}, {e}")
+        self.canvas.delete("all")
+        self.canvas.create_text(self.winfo_width()/2, self.winfo_height()/2, text=f"画像を開けませんでした\n{e}", fill="white", font=("", 16))
+    def _ensure_source_image(self):
+        """拡大・原寸表示のために元画像を開く（向きは EXIF に合わせる）"""
+        if self.pyramid is not None:
+            return True
+        file_path = self.file_list[self.current_index]
+        try:
+            with perf.span("viewer.open_source"):
+                with Image.open(file_path) as img:
+                    self.pyramid = TilePyramid(ImageOps.exif_transpose(img) or img)
+        except Exception as e:
+            self._show_error(file_path, e)
+            return False
+        if self.fit_image is not None:
+            self.current_zoom = self.fit_image.width / max(1, self.pyramid.size[0])
+        return True
+    def _set_zoom(self, zoom):
+        """拡大率を変える。画面の中央に見えていた位置を中央に保つ"""
+        canvas_w, canvas_h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        center_x = self.canvas.canvasx(canvas_w / 2) / self.current_zoom
+        center_y = self.canvas.canvasy(canvas_h / 2) / self.current_zoom
+        self.fit_mode = False
+        self.current_zoom = max(0.01, min(zoom, 10.0))
+        # 前の拡大率のタイルは使えない。未着手の描画も取り消す
+        self._cancel_requests(tiles_only=True)
+        self._clear_tiles()
+        self.canvas.delete("all")
+        content_w = max(1, round(self.pyramid.size[0] * self.current_zoom))
+        content_h = max(1, round(self.pyramid.size[1] * self.current_zoom))
+        self.canvas.config(scrollregion=(0, 0, content_w, content_h))
+        self.canvas.xview_moveto(max(0, center_x * self.current_zoom - canvas_w / 2) / content_w)
+        self.canvas.yview_moveto(max(0, center_y * self.current_zoom - canvas_h / 2) / content_h)
+        self._schedule_render()
+    def _on_view_scrolled(self, bar, first, last):
+        bar.set(first, last)
+        if not self.fit_mode:
+            self._schedule_render()
+    def _visible_box(self):
+        x0, y0 = int(self.canvas.canvasx(0)), int(self.canvas.canvasy(0))
+        return (x0, y0, x0 + self.canvas.winfo_width(), y0 + self.canvas.winfo_height())
+    def _tile_keys(self, box, margin=0):
+        """box と重なるタイル（周囲 margin 枚を含む）を、中央に近い順に返す"""
+        size = VIEWER_TILE_SIZE
+        cols = -(-round(self.pyramid.size[0] * self.current_zoom) // size)
+        rows = -(-round(self.pyramid.size[1] * self.current_zoom) // size)
+        tx0, ty0 = max(0, box[0] // size - margin), max(0, box[1] // size - margin)
+        tx1, ty1 = min(cols - 1, (box[2] - 1) // size + margin), min(rows - 1, (box[3] - 1) // size + margin)
+        center_x, center_y = (box[0] + box[2]) / 2 / size, (box[1] + box[3]) / 2 / size
+        keys = [(tx, ty) for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1)]
+        keys.sort(key=lambda key: (key[0] + 0.5 - center_x) ** 2 + (key[1] + 0.5 - center_y) ** 2)
+        return keys
+    def _schedule_render(self):
+        # プレビューは次のアイドル時に1回だけ描き、高画質のタイルは操作が止まってから描く
+        if self._preview_job is None:
+            self._preview_job = self.after_idle(self._render_preview)
+        if self._refine_job:
+            self.after_cancel(self._refine_job)
+        self._refine_job = self.after(VIEWER_REFINE_DELAY_MS, self._refine_tiles)
+    def _render_preview(self):
+        """見えている範囲を粗い補間で1枚に描き、タイルの下に敷く（まだタイルがない部分を埋める）"""
+        self._preview_job = None
+        if self.fit_mode or self.pyramid is None: return
+        box = self._visible_box()
+        if all(key in self._tiles for key in self._tile_keys(box)): return
+        with perf.span("viewer.preview"):
+            img = self.pyramid.render(self.current_zoom, box, self.pyramid.preview_resample(self.current_zoom))
+        self.canvas.delete("preview")
+        if img is None: return
+        self._preview_photo = ImageTk.PhotoImage(img)
+        self.canvas.create_image(max(0, box[0]), max(0, box[1]), anchor="nw", image=self._preview_photo, tags="preview")
+        self.canvas.tag_lower("preview")
+    def _refine_tiles(self):
+        """見えている範囲（と周囲1枚）の高画質タイルのうち、まだないものをワーカーで描く"""
+        self._refine_job = None
+        if self.fit_mode or self.pyramid is None: return
+        zoom, size = self.current_zoom, VIEWER_TILE_SIZE
+        keys = self._tile_keys(self._visible_box(), margin=1)
+        for key in keys:
+            request_key = (zoom, *key)
+            if key in self._tiles or request_key in self._tile_requests: continue
+            tile_box = (key[0] * size, key[1] * size, (key[0] + 1) * size, (key[1] + 1) * size)
+            future = self.view.scheduler.submit(Priority.VIEWER, self.pyramid.render, zoom, tile_box, group=self._tile_group)
+            self._tile_requests[request_key] = future
+            future.add_done_callback(lambda f, k=request_key, p=self.pyramid: self.view._queue_photo(f, self._on_tile_rendered, k, p))
+        # 画面から遠いタイルを捨てる
+        keep = set(keys)
+        for key in [key for key in self._tiles if key not in keep][:max(0, len(self._tiles) - VIEWER_MAX_TILES)]:
+            self.canvas.delete(self._tiles.pop(key)[0])
+    def _on_tile_rendered(self, future, request_key, pyramid):
+        if self._tile_requests.get(request_key) is future:
+            del self._tile_requests[request_key]
+        if not self.winfo_exists() or future.cancelled(): return
+        zoom, *key = request_key
+        key = tuple(key)
+        if self.fit_mode or pyramid is not self.pyramid or zoom != self.current_zoom or key in self._tiles: return
+        try:
+            img = future.result()
+        except Exception as e:
+            logging.debug(f"ビューアのタイル描画エラー: {e}")
+            return
+        if img is None: return
+        with perf.span("viewer.photoimage"):
+            photo = ImageTk.PhotoImage(img)
+        item = self.canvas.create_image(key[0] * VIEWER_TILE_SIZE, key[1] * VIEWER_TILE_SIZE, anchor="nw", image=photo, tags="tile")
+        self._tiles[key] = (item, photo)
+    def _clear_tiles(self):
+        self.canvas.delete("tile", "preview")
+        self._tiles.clear()
+        self._tile_requests.clear()
     def load_and_display_image(self):
         if not (0 <= self.current_index < len(self.file_list)):
             self.destroy()
             return
         file_path = self.file_list[self.current_index]
         self.title(f"画像ビューア - {os.path.basename(file_path)}")
-        try:
-            self.pil_image = Image.open(file_path)
-            self.fit_to_screen()
-        except Exception as e:
-            logging.error(f"画像を開けませんでした: {file_path}, {e}")
-            self.canvas.delete("all")
-            self.canvas.create_text(self.winfo_width()/2, self.winfo_height()/2, text=f"画像を開けませんでした\n{e}", fill="white", font=("", 16))
-    def display_image(self):
-        if not self.pil_image:
-            return
-        width, height = int(self.pil_image.width * self.current_zoom), int(self.pil_image.height * self.current_zoom)
-        if width <= 0 or height <= 0:
-            return
-        resized_img = self.pil_image.resize((width, height), LANCZOS_RESAMPLING)
-        self.tk_image = ImageTk.PhotoImage(resized_img)
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor="nw", image=self.tk_image)
-        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+        self.pyramid = None
+        self.fit_image = None
+        self.fit_to_screen()
     def zoom(self, factor):
-        self.current_zoom = max(0.01, min(self.current_zoom * factor, 10.0))
-        self.display_image()
-    def fit_to_screen(self, event=None):
-        if not self.pil_image:
+        if not self._ensure_source_image():
             return
-        canvas_w, canvas_h = self.canvas.winfo_width(), self.canvas.winfo_height()
-        if canvas_w < 50 or canvas_h < 50:
+        self._set_zoom(self.current_zoom * factor)
+    def fit_to_screen(self, event=None):
+        box = self._fit_box()
+        if box is None:
             self.after(50, self.fit_to_screen)
             return
-        img_w, img_h = self.pil_image.size
-        if img_w == 0 or img_h == 0:
-            return
-        zoom_w, zoom_h = (canvas_w - 10) / img_w, (canvas_h - 10) / img_h
-        self.current_zoom = min(zoom_w, zoom_h, 1.0)
-        self.display_image()
+        self.fit_mode = True
+        file_path = self.file_list[self.current_index]
+        img = self._cached_fit_image(file_path, box)
+        if img is not None:
+            self._show_fit_image(img)
+        else:
+            # デコードが終わるまでは直前の画像を表示しておく
+            self.fit_image = None
+        self._request_fit_images(box)
     def original_size(self):
-        self.current_zoom = 1.0
-        self.display_image()
+        if not self._ensure_source_image():
+            return
+        self._set_zoom(1.0)
     def prev_image(self):
         if self.current_index > 0:
             self.current_index -= 1
+            self._direction = -1
             self.load_and_display_image()
     def next_image(self):
         if self.current_index < len(self.file_list) - 1:
             self.current_index += 1
+            self._direction = 1
             self.load_and_display_image()
     def show_viewer_context_menu(self, event):
         file_path = self.file_list[self.current_index]
@@ -1306,7 +1813,8 @@ class ImageViewerWindow(tk.Toplevel):
     def on_window_resize(self, event):
         if self.resize_timer:
             self.after_cancel(self.resize_timer)
-        self.resize_timer = self.after(300, self.fit_to_screen)
+        # 拡大表示中はウィンドウの大きさに合わせて見えている範囲を描き直すだけにする
+        self.resize_timer = self.after(300, self.fit_to_screen if self.fit_mode else self._schedule_render)
 
 class WebPConversionOptionsDialog(tk.Toplevel):
     """WebP変換オプション設定ダイアログ"""
@@ -1399,4 +1907,81 @@ class WebPConversionOptionsDialog(tk.Toplevel):
 
     def cancel_clicked(self):
         self.result = None
-        self.destroy()
\ No newline at end of file
+        self.destroy()
+
+class PerfStatsDialog(tk.Toplevel):
+    """パフォーマンス統計（処理時間・回数・キャッシュヒット率）を1秒ごとに更新して表示するダイアログ"""
+    REFRESH_MS = 1000
+
+    def __init__(self, parent, config: AppConfig):
+        super().__init__(parent)
+        self.transient(parent)
+        self.title("パフォーマンス統計")
+        self.config_obj = config
+        self.enabled_var = tk.BooleanVar(value=perf.enabled)
+        self._refresh_job = None
+        self.create_widgets()
+        self.geometry(f"720x520+{parent.winfo_x()+50}+{parent.winfo_y()+50}")
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.refresh()
+
+    def create_widgets(self):
+        top = ttk.Frame(self, padding=5)
+        top.pack(fill='x')
+        ttk.Checkbutton(top, text="計測を有効にする", variable=self.enabled_var, command=self.toggle_enabled).pack(side='left')
+        ttk.Button(top, text="JSON保存", command=self.save_json).pack(side='right', padx=2)
+        ttk.Button(top, text="リセット", command=self.reset).pack(side='right', padx=2)
+        self.since_label = ttk.Label(top, foreground="gray")
+        self.since_label.pack(side='left', padx=10)
+
+        columns = ("count", "total", "avg", "max")
+        self.span_tree = ttk.Treeview(self, columns=columns, height=14)
+        self.span_tree.heading("#0", text="処理")
+        for col, text in zip(columns, ("回数", "合計 (ms)", "平均 (ms)", "最大 (ms)")):
+            self.span_tree.heading(col, text=text)
+            self.span_tree.column(col, width=90, anchor='e')
+        self.span_tree.column("#0", width=260)
+        self.span_tree.pack(fill='both', expand=True, padx=5, pady=5)
+
+        self.counter_tree = ttk.Treeview(self, columns=("value",), height=8)
+        self.counter_tree.heading("#0", text="カウンタ / ヒット率")
+        self.counter_tree.heading("value", text="値")
+        self.counter_tree.column("#0", width=260)
+        self.counter_tree.column("value", width=120, anchor='e')
+        self.counter_tree.pack(fill='both', expand=True, padx=5, pady=(0, 5))
+
+    def toggle_enabled(self):
+        perf.enabled = self.enabled_var.get()
+        self.config_obj.enable_perf_stats = perf.enabled
+
+    def reset(self):
+        perf.reset()
+        self.refresh()
+
+    def save_json(self):
+        path = filedialog.asksaveasfilename(parent=self, title="統計をJSONで保存", defaultextension=".json",
+                                            initialfile="perf_stats.json", filetypes=[("JSON", "*.json")])
+        if not path: return
+        try:
+            perf.dump_json(path)
+        except OSError as e:
+            messagebox.showerror("エラー", f"保存に失敗しました: {e}", parent=self)
+
+    def refresh(self):
+        stats = perf.snapshot()
+        self.since_label.config(text=f"集計開始: {stats['since']}")
+        self.span_tree.delete(*self.span_tree.get_children())
+        for name, s in stats["spans"].items():
+            self.span_tree.insert("", "end", text=name,
+                                  values=(s["count"], f"{s['total_ms']:.1f}", f"{s['avg_ms']:.2f}", f"{s['max_ms']:.1f}"))
+        self.counter_tree.delete(*self.counter_tree.get_children())
+        for name, rate in stats["hit_rates"].items():
+            self.counter_tree.insert("", "end", text=f"{name} ヒット率", values=(f"{rate:.1%}",))
+        for name, value in stats["counters"].items():
+            self.counter_tree.insert("", "end", text=name, values=(value,))
+        self._refresh_job = self.after(self.REFRESH_MS, self.refresh)
+
+    def close(self):
+        if self._refresh_job:
+            self.after_cancel(self._refresh_job)
+        self.destroy()
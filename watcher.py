@@ -0,0 +1,389 @@
+import os
+import time
+import logging
+import threading
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from config import AppConfig
+from model import ImageSearchModel
+from scanner import DirectorySnapshot, has_suffix, iter_image_entries, make_suffix_set, scan_directory, snapshot_formats_key
+
+class WatchEventHandler(FileSystemEventHandler):
+    """watchdog のイベントを WatchIngestPipeline に渡すだけのハンドラ（監視スレッドでは重い処理をしない）"""
+    def __init__(self, pipeline):
+        super().__init__()
+        self.pipeline = pipeline
+
+    def on_created(self, event):
+        if event.is_directory:
+            self.pipeline.dir_added(event.src_path)
+        else:
+            self.pipeline.file_changed(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.pipeline.file_changed(event.src_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.pipeline.dir_deleted(event.src_path)
+        else:
+            self.pipeline.file_deleted(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self.pipeline.dir_moved(event.src_path, event.dest_path)
+        else:
+            self.pipeline.file_moved(event.src_path, event.dest_path)
+
+class WatchIngestPipeline:
+    """
+    監視イベントをパスごとにデバウンスし、書き込みが落ち着いたファイルをまとめてインデックスへ取り込む。
+    - 作成・更新: 最後のイベントから watch_debounce_ms 経過後、サイズとmtimeが前回確認時から変わらず、
+      読み取り可能になったものをバッチで取り込む
+    - 削除・移動: インデックスのレコードを削除・付け替える
+    取り込んだレコードは set_query() で設定された検索条件でこのスレッド上で判定し、
+    on_batch(matched, unmatched, removed, removed_dirs) で結果を通知する（条件が None のときは matched / unmatched は空）。
+    """
+    def __init__(self, model: ImageSearchModel, config: AppConfig, ingest_batch, on_batch):
+        self.model = model
+        self.suffixes = make_suffix_set(config.supported_formats)
+        self.debounce = max(0.05, config.watch_debounce_ms / 1000)
+        self.batch_size = max(1, config.watch_batch_size)
+        self.stable_timeout = config.watch_stable_timeout_sec
+        self._ingest_batch = ingest_batch
+        self._on_batch = on_batch
+        self._query = None
+        # path -> [最後のイベント時刻, 最初のイベント時刻, 前回確認時の (サイズ, mtime)]
+        self._pending = {}
+        self._removed = set()
+        self._removed_dirs = set()
+        self._moves = []
+        self._rescan_dirs = set()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="watch-ingest")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def set_query(self, query):
+        """監視で取り込んだファイルを判定する検索条件（CompiledQuery）。None なら取り込みのみ行う"""
+        self._query = query
+
+    def _is_target(self, path):
+        return has_suffix(os.path.basename(path), self.suffixes)
+
+    def file_changed(self, path):
+        if not self._is_target(path): return
+        with self._cond:
+            now = time.monotonic()
+            entry = self._pending.get(path)
+            if entry:
+                entry[0] = now
+            else:
+                self._pending[path] = [now, now, None]
+            self._removed.discard(path)
+            self._cond.notify()
+
+    def file_deleted(self, path):
+        if not self._is_target(path): return
+        with self._cond:
+            self._pending.pop(path, None)
+            self._removed.add(path)
+            self._cond.notify()
+
+    def file_moved(self, src_path, dest_path):
+        with self._cond:
+            self._pending.pop(src_path, None)
+            if self._is_target(src_path):
+                if self._is_target(dest_path):
+                    self._moves.append((src_path, dest_path))
+                # 移動元は検索結果から外す（DBのレコードは先に移動先へ付け替えるので、削除しても消えない）
+                self._removed.add(src_path)
+            self._cond.notify()
+        self.file_changed(dest_path)
+
+    def dir_added(self, path):
+        with self._cond:
+            self._rescan_dirs.add(path)
+            self._cond.notify()
+
+    def dir_deleted(self, path):
+        with self._cond:
+            self._removed_dirs.add(path)
+            self._cond.notify()
+
+    def dir_moved(self, src_path, dest_path):
+        with self._cond:
+            self._moves.append((src_path, dest_path))
+            self._removed_dirs.add(src_path)
+            self._rescan_dirs.add(dest_path)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.debounce / 2)
+                if self._stopped: return
+                now = time.monotonic()
+                due = [(path, entry[0], entry[2]) for path, entry in self._pending.items() if now - entry[0] >= self.debounce]
+                due = due[:self.batch_size]
+                removed, self._removed = self._removed, set()
+                removed_dirs, self._removed_dirs = self._removed_dirs, set()
+                moves, self._moves = self._moves, []
+                rescan_dirs, self._rescan_dirs = self._rescan_dirs, set()
+            try:
+                self._apply_removals(moves, removed, removed_dirs)
+                self._rescan(rescan_dirs)
+                ready = self._check_stable(due)
+                if ready or removed or removed_dirs:
+                    self._ingest(ready, removed, removed_dirs)
+            except Exception:
+                logging.error("監視ファイルの取り込み中にエラーが発生しました", exc_info=True)
+
+    def _apply_removals(self, moves, removed, removed_dirs):
+        for src_path, dest_path in moves:
+            self.model.rename_records(src_path, dest_path)
+        if removed:
+            self.model.delete_records(removed)
+        for dir_path in removed_dirs:
+            self.model.delete_records_under(dir_path)
+
+    def _rescan(self, dir_paths):
+        """追加・移動されたフォルダの中身を取り込み対象にする（中のファイルごとのイベントは届かないことがある）"""
+        for dir_path in dir_paths:
+            try:
+                for entry in iter_image_entries(dir_path, self.suffixes, max_workers=1):
+                    self.file_changed(entry.path)
+            except OSError as e:
+                logging.warning(f"監視フォルダの走査に失敗: {dir_path} -> {e}")
+
+    def _check_stable(self, due):
+        """デバウンス期間が過ぎたファイルのうち、書き込みが終わったものを返す"""
+        ready, gone, retry = [], [], {}
+        for path, last_event, last_sig in due:
+            try:
+                st = os.stat(path)
+                sig = (st.st_size, st.st_mtime)
+                if sig[0] > 0 and sig == last_sig:
+                    with open(path, 'rb') as f:
+                        f.read(1)
+                    ready.append((path, last_event))
+                    continue
+            except FileNotFoundError:
+                gone.append((path, last_event))
+                continue
+            except OSError:
+                sig = None
+            retry[path] = (last_event, sig)
+
+        with self._cond:
+            now = time.monotonic()
+            # 確認中に新しいイベントが届いたファイルは、次回あらためて確認する
+            ready = [path for path, last_event in ready if self._pop_if_unchanged(path, last_event)]
+            for path, last_event in gone:
+                self._pop_if_unchanged(path, last_event)
+            for path, (last_event, sig) in retry.items():
+                entry = self._pending.get(path)
+                if not entry or entry[0] != last_event: continue
+                if now - entry[1] > self.stable_timeout:
+                    logging.warning(f"ファイルの書き込みが完了しないためスキップ: {path}")
+                    del self._pending[path]
+                else:
+                    entry[0], entry[2] = now, sig
+        return ready
+
+    def _pop_if_unchanged(self, path, last_event):
+        entry = self._pending.get(path)
+        if entry and entry[0] == last_event:
+            del self._pending[path]
+            return True
+        return False
+
+    def _ingest(self, ready, removed, removed_dirs):
+        records = self._ingest_batch(ready) if ready else []
+        query = self._query
+        matched, unmatched = [], []
+        if query is not None:
+            for record in records:
+                if query(record):
+                    matched.append(record)
+                else:
+                    unmatched.append(record['file_path'])
+        self._on_batch(matched, unmatched, list(removed), list(removed_dirs))
+
+class NativeWatchBackend:
+    """
+    watchdog の Observer による監視。Observer は1つだけ起動したまま使い回し、
+    監視対象フォルダ（と再帰設定）が変わったときだけ watch を付け替える。
+    """
+    name = "native"
+
+    def __init__(self, pipeline: WatchIngestPipeline, model: ImageSearchModel, config: AppConfig):
+        self.handler = WatchEventHandler(pipeline)
+        self._observer = None
+        self._watch = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def watch(self, root, recursive):
+        key = (os.path.normpath(root), recursive)
+        with self._lock:
+            if key == self._key: return
+            self._unschedule()
+            if self._observer is None:
+                self._observer = Observer()
+                self._observer.daemon = True
+                self._observer.start()
+            self._watch = self._observer.schedule(self.handler, key[0], recursive=recursive)
+            self._key = key
+
+    def unwatch(self):
+        with self._lock:
+            self._unschedule()
+
+    def _unschedule(self):
+        if self._watch is not None:
+            try:
+                self._observer.unschedule(self._watch)
+            except KeyError:
+                pass
+        self._watch = None
+        self._key = None
+
+    def stop(self):
+        with self._lock:
+            self._unschedule()
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join()
+                self._observer = None
+
+class PollingWatchBackend:
+    """
+    ネイティブの変更通知を使わず、一定間隔でディレクトリの mtime を確認する監視。
+    mtime が変わったディレクトリだけを列挙し直し、前回の一覧との差分を作成・削除イベントとして
+    WatchIngestPipeline に渡す。前回の一覧は検索と共有しているディレクトリスナップショットから読み込むため、
+    アプリを閉じている間に追加されたファイルも最初の確認で取り込まれる。
+    1回の確認はディレクトリ1つにつき stat 1回で済むため、ネットワークドライブや大きなツリーでも負荷が小さい。
+    ただし、既存ファイルの上書き（ディレクトリの mtime が変わらない変更）は検出できない。
+    """
+    name = "polling"
+
+    def __init__(self, pipeline: WatchIngestPipeline, model: ImageSearchModel, config: AppConfig):
+        self.pipeline = pipeline
+        self.model = model
+        self.suffixes = make_suffix_set(config.supported_formats)
+        self.formats_key = snapshot_formats_key(self.suffixes)
+        self.interval = max(1, config.watch_poll_interval_sec)
+        self._key = None
+        # dir_path -> (mtime, 対象ファイル名の集合, サブディレクトリ名の集合)。None なら次の確認で読み込み直す
+        self._state = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def watch(self, root, recursive):
+        key = (os.path.normpath(root), recursive)
+        with self._lock:
+            if key == self._key: return
+            self._key = key
+            self._state = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="watch-poll")
+                self._thread.start()
+        self._wake.set()
+
+    def unwatch(self):
+        with self._lock:
+            self._key = None
+            self._state = None
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            with self._lock:
+                key = self._key
+                if key is not None and self._state is None:
+                    self._state = {d: (mtime, set(files), set(subdirs))
+                                   for d, (mtime, files, subdirs) in self.model.load_dir_snapshots(key[0], self.formats_key).items()}
+                state = self._state
+            if key is not None:
+                try:
+                    self._poll(key[0], key[1], state)
+                except Exception:
+                    logging.error(f"フォルダの変更確認中にエラーが発生しました: {key[0]}", exc_info=True)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _poll(self, root, recursive, state):
+        updates, visited = {}, set()
+        stack = [root]
+        while stack:
+            if self._stopped: return
+            dir_path = stack.pop()
+            visited.add(dir_path)
+            try:
+                dir_mtime = os.stat(dir_path).st_mtime
+            except OSError:
+                continue
+            known = state.get(dir_path)
+            if known and known[0] == dir_mtime:
+                file_names, subdir_names = known[1], known[2]
+            else:
+                try:
+                    files, subdirs = scan_directory(dir_path, self.suffixes)
+                except OSError as e:
+                    logging.warning(f"ディレクトリの列挙に失敗: {dir_path} -> {e}")
+                    continue
+                file_names = {e.name for e in files}
+                subdir_names = {os.path.basename(d) for d in subdirs}
+                if known:
+                    self._emit_diff(dir_path, known, file_names, subdir_names, recursive)
+                # 更新直後のディレクトリは mtime を記録せず、次回も列挙し直して差分を取る
+                settled = time.time() - dir_mtime >= DirectorySnapshot.SETTLE_SECONDS
+                state[dir_path] = (dir_mtime if settled else None, file_names, subdir_names)
+                if settled:
+                    updates[dir_path] = (dir_mtime, sorted(file_names), sorted(subdir_names))
+            if recursive:
+                stack.extend(os.path.join(dir_path, name) for name in subdir_names)
+
+        removed = [d for d in state if d not in visited] if recursive else []
+        for dir_path in removed:
+            del state[dir_path]
+        self.model.save_dir_snapshots(updates, self.formats_key, removed)
+
+    def _emit_diff(self, dir_path, known, file_names, subdir_names, recursive):
+        _, old_files, old_subdirs = known
+        for name in file_names - old_files:
+            self.pipeline.file_changed(os.path.join(dir_path, name))
+        for name in old_files - file_names:
+            self.pipeline.file_deleted(os.path.join(dir_path, name))
+        if not recursive: return
+        for name in subdir_names - old_subdirs:
+            self.pipeline.dir_added(os.path.join(dir_path, name))
+        for name in old_subdirs - subdir_names:
+            self.pipeline.dir_deleted(os.path.join(dir_path, name))
+
+WATCH_BACKENDS = {
+    NativeWatchBackend.name: NativeWatchBackend,
+    PollingWatchBackend.name: PollingWatchBackend,
+}
+
+def create_watch_backend(pipeline: WatchIngestPipeline, model: ImageSearchModel, config: AppConfig):
+    backend_cls = WATCH_BACKENDS.get(config.watch_backend)
+    if backend_cls is None:
+        logging.warning(f"不明な監視バックエンド '{config.watch_backend}' です。'native' を使用します。")
+        backend_cls = NativeWatchBackend
+    return backend_cls(pipeline, model, config)